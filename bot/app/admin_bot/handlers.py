@@ -2,13 +2,13 @@ import asyncio
 import logging
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
 from telegram.ext import ContextTypes
-from app.database.operations import DatabaseManager
+from app.database.operations import AsyncDatabaseManager
 from app.config import AUTHORIZED_OPERATORS
 
 logger = logging.getLogger(__name__)
 
 class AdminBotHandlers:
-    def __init__(self, db_manager: DatabaseManager):
+    def __init__(self, db_manager: AsyncDatabaseManager):
         self.db_manager = db_manager
 
     async def start_cmd(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -70,10 +70,26 @@ class AdminBotHandlers:
         message = update.message.text
         
         try:
-            # Получаем всех активных подписчиков
-            subscribers = self.db_manager.get_active_subscribers()
+            success = 0
+            failed = 0
             
-            if not subscribers:
+            # Получаем активных подписчиков пачками и отправляем сообщение каждому
+            async for user_ids in self.db_manager.iter_active_subscriber_ids():
+                for user_id in user_ids:
+                    try:
+                        await context.bot.send_message(
+                            chat_id=user_id,
+                            text=message,
+                            parse_mode='Markdown'
+                        )
+                        success += 1
+                        # Небольшая задержка между отправками
+                        await asyncio.sleep(0.1)
+                    except Exception as e:
+                        logger.error(f"Failed to send broadcast to {user_id}: {e}")
+                        failed += 1
+            
+            if not success and not failed:
                 await update.message.reply_text(
                     "❌ Нет активных подписчиков для рассылки.",
                     reply_markup=InlineKeyboardMarkup([[
@@ -82,30 +98,12 @@ class AdminBotHandlers:
                 )
                 return
             
-            success = 0
-            failed = 0
-            
-            # Отправляем сообщение каждому подписчику
-            for subscriber in subscribers:
-                try:
-                    await context.bot.send_message(
-                        chat_id=subscriber.user_id,
-                        text=message,
-                        parse_mode='Markdown'
-                    )
-                    success += 1
-                    # Небольшая задержка между отправками
-                    await asyncio.sleep(0.1)
-                except Exception as e:
-                    logger.error(f"Failed to send broadcast to {subscriber.user_id}: {e}")
-                    failed += 1
-            
             # Отправляем статистику
             status_text = (
                 f"📢 Рассылка завершена\n\n"
                 f"✅ Успешно отправлено: {success}\n"
                 f"❌ Ошибок доставки: {failed}\n"
-                f"📊 Всего подписчиков: {len(subscribers)}"
+                f"📊 Всего подписчиков: {success + failed}"
             )
             
             await update.message.reply_text(
@@ -157,8 +155,8 @@ class AdminBotHandlers:
             
         elif query.data == 'broadcast_stats':
             # Получаем статистику из базы данных
-            subscribers = self.db_manager.get_subscribers_count()
-            active = self.db_manager.get_active_subscribers_count()
+            subscribers = await self.db_manager.get_subscribers_count()
+            active = await self.db_manager.get_active_subscribers_count()
             
             await query.message.edit_text(
                 f"📊 Статистика рассылок\n\n"
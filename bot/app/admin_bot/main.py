@@ -1,5 +1,6 @@
 # app/admin_bot/main.py
 import os
+import html
 import logging
 import asyncio
 import requests
@@ -16,9 +17,10 @@ from telegram.ext import (
 )
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup, ReplyKeyboardMarkup
 
-from app.database.operations import DatabaseManager
-from app.ai.chat import ChatManager
-from app.config import AUTHORIZED_OPERATORS, ADMIN_BOT_TOKEN, DATABASE_URL, TELEGRAM_TOKEN
+from app.database.operations import AsyncDatabaseManager, dispose_engines
+from app.config import (
+    AUTHORIZED_OPERATORS, ADMIN_BOT_TOKEN, DATABASE_URL, TELEGRAM_TOKEN, COUNTERS_RECONCILE_INTERVAL
+)
 
 # Состояния для ConversationHandler
 AWAITING_REPLY = 1
@@ -33,12 +35,32 @@ nest_asyncio.apply()
 SECRET_KEY = os.getenv("SECRET_KEY", "MYSECRET")
 MAIN_BOT_URL = os.getenv("MAIN_BOT_URL", "http://silkway-bot:8000")
 
-db_manager = DatabaseManager(DATABASE_URL)
+# Раздел админки -> (статус сессии в БД, подпись)
+REQUEST_VIEWS = {
+    'pending': ('pending', "новых"),
+    'answered': ('answered', "отвеченных"),
+    'in_progress': ('in_progress', "в процессе"),
+    'unanswered': ('pending', "неотвеченных"),
+}
+REQUESTS_PAGE_SIZE = 10
+REQUEST_PREVIEW_LENGTH = 200
+
+
+def _page_cursor(session) -> str:
+    """Ключ keyset-пагинации (updated_at, id) для callback_data (до 64 байт)"""
+    return f"{session.updated_at.strftime('%Y%m%d%H%M%S%f')}-{session.id}"
+
+
+def _parse_page_cursor(cursor: str):
+    updated_at, session_id = cursor.split('-')
+    return datetime.strptime(updated_at, '%Y%m%d%H%M%S%f'), int(session_id)
 
 class AdminHandlers:
     def __init__(self):
-        self.db_manager = DatabaseManager(DATABASE_URL)
-        self.chat_manager = ChatManager(self.db_manager)
+        # Схему БД и историю диалогов ведет основной бот: без миграций и writer'а
+        self.db_manager = AsyncDatabaseManager(DATABASE_URL, migrate=False, writer=False)
+        # Списки заявок и статистика читаются через read-only соединения
+        self.read_db = AsyncDatabaseManager(DATABASE_URL, read_only=True)
 
     def get_admin_keyboard(self):
         """Основная клавиатура админа"""
@@ -60,55 +82,82 @@ class AdminHandlers:
             reply_markup=self.get_admin_keyboard()
         )
 
+    def _render_requests_page(self, status, page):
+        """Текст и клавиатура одной страницы заявок"""
+        sessions, has_prev, has_next = page
+        _, status_text = REQUEST_VIEWS[status]
+
+        lines = [f"📋 Заявки {status_text}:\n"]
+        keyboard = []
+        for session in sessions:
+            last_message = getattr(session, 'last_message', None) or 'Нет сообщения'
+            if len(last_message) > REQUEST_PREVIEW_LENGTH:
+                last_message = last_message[:REQUEST_PREVIEW_LENGTH] + '…'
+            last_message = html.escape(last_message)
+            lines.append(
+                f"📝 №{session.id} от <a href='tg://user?id={session.user_id}'>{session.user_id}</a>, "
+                f"⏰ {session.created_at.strftime('%d.%m.%Y %H:%M')}\n"
+                f"{last_message}\n"
+            )
+            keyboard.append([
+                InlineKeyboardButton(f"✍️ Ответить №{session.id}", callback_data=f"reply_{session.user_id}"),
+                InlineKeyboardButton(f"❌ Закрыть №{session.id}", callback_data=f"close_{session.user_id}")
+            ])
+
+        navigation = []
+        if has_prev:
+            navigation.append(InlineKeyboardButton(
+                "« Назад", callback_data=f"rq:{status}:p:{_page_cursor(sessions[0])}"
+            ))
+        if has_next:
+            navigation.append(InlineKeyboardButton(
+                "Далее »", callback_data=f"rq:{status}:n:{_page_cursor(sessions[-1])}"
+            ))
+        if navigation:
+            keyboard.append(navigation)
+
+        return "\n".join(lines), InlineKeyboardMarkup(keyboard)
+
     async def show_requests(self, update: Update, context: ContextTypes.DEFAULT_TYPE, status='pending'):
-        """Показывает список заявок с определенным статусом"""
+        """Показывает первую страницу заявок с определенным статусом одним сообщением"""
         user_id = update.effective_user.id
         if user_id not in AUTHORIZED_OPERATORS:
             return
 
-        if status == 'pending':
-            sessions = self.db_manager.get_pending_sessions()
-            status_text = "новых"
-        elif status == 'answered':
-            sessions = self.db_manager.get_answered_sessions()
-            status_text = "отвеченных"
-        elif status == 'in_progress':
-            sessions = self.db_manager.get_in_progress_sessions()
-            status_text = "в процессе"
-        else:
-            sessions = self.db_manager.get_unanswered_sessions()
-            status_text = "неотвеченных"
-
-        if not sessions:
+        db_status, status_text = REQUEST_VIEWS[status]
+        page = await self.read_db.get_sessions_page(db_status, limit=REQUESTS_PAGE_SIZE)
+
+        if not page[0]:
             await update.message.reply_text(f"Нет заявок {status_text}.")
             return
 
-        for session in sessions:
-            try:
-                user = await context.bot.get_chat(session.user_id)
-                username = user.username or "Без username"
-                
-                msg = (
-                    f"📝 Обращение №{session.id}\n"
-                    f"От: <a href='tg://user?id={session.user_id}'>{username}</a>\n"
-                    f"ID: <code>{session.user_id}</code>\n"
-                    f"⏰ Создано: {session.created_at.strftime('%d.%m.%Y %H:%M')}\n\n"
-                    f"Сообщение:\n{getattr(session, 'last_message', 'Нет сообщения')}\n"
-                )
+        text, reply_markup = self._render_requests_page(status, page)
+        await update.message.reply_text(text, reply_markup=reply_markup, parse_mode='HTML')
 
-                keyboard = [
-                    [InlineKeyboardButton("✍️ Ответить", callback_data=f"reply_{session.user_id}")],
-                    [InlineKeyboardButton("❌ Закрыть", callback_data=f"close_{session.user_id}")]
-                ]
+    async def handle_requests_page(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Переход на следующую/предыдущую страницу заявок (редактирует то же сообщение)"""
+        query = update.callback_query
+        if update.effective_user.id not in AUTHORIZED_OPERATORS:
+            await query.answer("⛔️ У вас нет доступа к этой функции")
+            return
+        await query.answer()
 
-                await update.message.reply_text(
-                    msg,
-                    reply_markup=InlineKeyboardMarkup(keyboard),
-                    parse_mode='HTML'
-                )
-            except Exception as e:
-                logger.error(f"Error showing request for user {session.user_id}: {e}")
-                continue
+        _, status, direction, cursor = query.data.split(':', 3)
+        db_status, status_text = REQUEST_VIEWS[status]
+        key = _parse_page_cursor(cursor)
+        page = await self.read_db.get_sessions_page(
+            db_status,
+            limit=REQUESTS_PAGE_SIZE,
+            after=key if direction == 'n' else None,
+            before=key if direction == 'p' else None
+        )
+
+        if not page[0]:
+            await query.edit_message_text(f"Нет заявок {status_text}.")
+            return
+
+        text, reply_markup = self._render_requests_page(status, page)
+        await query.edit_message_text(text, reply_markup=reply_markup, parse_mode='HTML')
 
     async def handle_broadcast_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Обработчик команды управления рассылкой"""
@@ -140,8 +189,8 @@ class AdminHandlers:
             return AWAITING_BROADCAST
             
         elif query.data == 'broadcast_stats':
-            subscribers = self.db_manager.get_subscribers_count()
-            active = self.db_manager.get_active_subscribers_count()
+            subscribers = await self.read_db.get_subscribers_count()
+            active = await self.read_db.get_active_subscribers_count()
             
             await query.message.edit_text(
                 f"📊 Статистика подписчиков\n\n"
@@ -155,9 +204,7 @@ class AdminHandlers:
     async def send_broadcast(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Отправка рассылки"""
         message = update.message.text
-        subscribers = self.db_manager.get_active_subscribers()
-        
-        logger.info(f"Starting broadcast to {len(subscribers)} subscribers")
+        logger.info("Starting broadcast to active subscribers")
         
         success = 0
         failed = 0
@@ -165,21 +212,22 @@ class AdminHandlers:
         # Создаем клиент для основного бота
         main_bot = ApplicationBuilder().token(os.getenv("TELEGRAM_TOKEN")).build()
         
-        for subscriber in subscribers:
-            try:
-                logger.info(f"Attempting to send broadcast to user {subscriber.user_id}")
-                # Отправляем через основной бот
-                await main_bot.bot.send_message(
-                    chat_id=subscriber.user_id,
-                    text=message,
-                    parse_mode='Markdown'
-                )
-                logger.info(f"Successfully sent broadcast to user {subscriber.user_id}")
-                success += 1
-                await asyncio.sleep(0.1)
-            except Exception as e:
-                logger.error(f"Failed to send broadcast to {subscriber.user_id}: {e}")
-                failed += 1
+        # Подписчики читаются пачками, в памяти не больше одной пачки user_id
+        async for user_ids in self.read_db.iter_active_subscriber_ids():
+            for user_id in user_ids:
+                try:
+                    # Отправляем через основной бот
+                    await main_bot.bot.send_message(
+                        chat_id=user_id,
+                        text=message,
+                        parse_mode='Markdown'
+                    )
+                    logger.debug(f"Successfully sent broadcast to user {user_id}")
+                    success += 1
+                    await asyncio.sleep(0.1)
+                except Exception as e:
+                    logger.error(f"Failed to send broadcast to {user_id}: {e}")
+                    failed += 1
         
         # Закрываем клиент основного бота
         await main_bot.shutdown()
@@ -188,7 +236,7 @@ class AdminHandlers:
             f"📢 Рассылка завершена\n\n"
             f"✅ Успешно отправлено: {success}\n"
             f"❌ Ошибок: {failed}\n"
-            f"📊 Всего подписчиков: {len(subscribers)}"
+            f"📊 Всего подписчиков: {success + failed}"
         )
         
         logger.info(status_text)
@@ -214,7 +262,7 @@ class AdminHandlers:
         """Периодическая проверка новых запросов"""
         try:
             # Проверяем новые заявки
-            pending_sessions = self.db_manager.get_pending_sessions()
+            pending_sessions = await self.read_db.get_pending_sessions()
             if pending_sessions:
                 for admin_id in AUTHORIZED_OPERATORS:
                     try:
@@ -241,7 +289,7 @@ class AdminHandlers:
                         logger.warning(f"Не удалось отправить уведомление о новой заявке оператору {admin_id}: {e}")
 
             # Проверяем обращения в процессе с новыми сообщениями
-            in_progress_sessions = self.db_manager.get_in_progress_sessions()
+            in_progress_sessions = await self.read_db.get_in_progress_sessions()
             if in_progress_sessions:
                 for admin_id in AUTHORIZED_OPERATORS:
                     try:
@@ -278,7 +326,7 @@ class AdminHandlers:
         user_id = int(query.data.split('_')[1])
         
         try:
-            self.db_manager.close_session(user_id)
+            await self.db_manager.close_session(user_id)
             await query.message.edit_text(
                 f"✅ Обращение пользователя {user_id} закрыто",
                 reply_markup=None
@@ -287,6 +335,29 @@ class AdminHandlers:
             logger.error(f"Error closing session: {e}")
             await query.message.reply_text("❌ Ошибка при закрытии обращения")
 
+    async def reload_knowledge_base(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Команда /reload_kb: перечитать базу знаний основного бота"""
+        if update.effective_user.id not in AUTHORIZED_OPERATORS:
+            return
+        try:
+            r = await asyncio.to_thread(
+                requests.post,
+                f"{MAIN_BOT_URL}/admin/reload_kb",
+                params={'secret': SECRET_KEY},
+                timeout=10
+            )
+            if r.status_code == 200:
+                await update.message.reply_text(
+                    f"✅ База знаний обновлена (версия {r.json().get('version')})"
+                )
+            else:
+                await update.message.reply_text(
+                    "❌ Не удалось обновить базу знаний. Проверьте файл knowledge.json"
+                )
+        except Exception as e:
+            logger.error(f"Error reloading knowledge base: {e}")
+            await update.message.reply_text("❌ Основной бот недоступен")
+
     async def check_main_bot_availability(self):
         """Проверка доступности основного бота"""
         try:
@@ -298,7 +369,7 @@ class AdminHandlers:
     async def check_inactive_sessions(self, context: ContextTypes.DEFAULT_TYPE):
         """Проверка неактивных сессий"""
         try:
-            inactive_sessions = self.db_manager.get_inactive_sessions()
+            inactive_sessions = await self.read_db.get_inactive_sessions()
             for session in inactive_sessions:
                 try:
                     # Отправляем сообщение пользователю
@@ -311,16 +382,26 @@ class AdminHandlers:
                         )
                     )
                     # Закрываем сессию
-                    self.db_manager.set_session_answered(session.user_id)
+                    await self.db_manager.set_session_answered(session.user_id)
                 except Exception as e:
                     logger.error(f"Error handling inactive session {session.user_id}: {e}")
         except Exception as e:
             logger.error(f"Error checking inactive sessions: {e}")
 
+    async def reconcile_counters(self, context: ContextTypes.DEFAULT_TYPE):
+        """Периодическая сверка счетчиков подписчиков с реальным количеством"""
+        await self.db_manager.reconcile_counters()
+
 def main():
-    app = ApplicationBuilder().token(ADMIN_BOT_TOKEN).build()
     handlers = AdminHandlers()
 
+    async def on_shutdown(application):
+        await handlers.db_manager.close()
+        await handlers.read_db.close()
+        dispose_engines()
+
+    app = ApplicationBuilder().token(ADMIN_BOT_TOKEN).post_shutdown(on_shutdown).build()
+
     # Создаем ConversationHandler для рассылки
     broadcast_conv_handler = ConversationHandler(
         entry_points=[
@@ -338,12 +419,15 @@ def main():
 
     # Добавляем обработчики
     app.add_handler(CommandHandler("start", handlers.start_cmd))
+    app.add_handler(CommandHandler("reload_kb", handlers.reload_knowledge_base))
     app.add_handler(broadcast_conv_handler)
+    app.add_handler(CallbackQueryHandler(handlers.handle_requests_page, pattern='^rq:'))
     app.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, handlers.handle_text))
     
     if app.job_queue:
         app.job_queue.run_repeating(handlers.check_new_requests, interval=30)
         app.job_queue.run_repeating(handlers.check_inactive_sessions, interval=3600)
+        app.job_queue.run_repeating(handlers.reconcile_counters, interval=COUNTERS_RECONCILE_INTERVAL, first=60)
     else:
         logger.warning("JobQueue не доступен. Периодические проверки отключены.")
     
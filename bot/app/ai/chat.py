@@ -1,76 +1,229 @@
-from .model import SilkwayAI
-from typing import Dict, List, Optional, Tuple
+from typing import Callable, Dict, List, Optional, Tuple
+import asyncio
 import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from app.config import CHAT_WORKERS, CHAT_DEADLINE, CHAT_STREAM_DEADLINE
 from app.database.operations import DatabaseManager
-from app.knowledge_base.faq import FAQ
+from app.knowledge_base.faq import get_faq
+from app.knowledge_base.intent import Intent, IntentResolver
+from app.ai.engine import CancelToken
+from app.ai.response_cache import ResponseCache
+from app.ai.prompt_builder import PromptBuilder
+from app.database.state import get_state_backend
 
 logger = logging.getLogger(__name__)
 
+OPERATOR_HANDOFF_MESSAGE = (
+    "🔄 Подождите, пожалуйста. Я перевожу ваш запрос на оператора...\n\n"
+    "Оператор ответит вам в ближайшее время."
+)
+
+
+class ProcessingCancelled(Exception):
+    """Обработка сообщения прервана: истек срок ожидания ответа"""
+
+
 class ChatManager:
     def __init__(self, db_manager: DatabaseManager):
         """Инициализация менеджера чата"""
-        self.model = SilkwayAI()
-        self.conversations: Dict[int, List[Dict]] = {}
+        # SilkwayAI создается при первом обращении (см. model)
+        self._model = None
+        self._model_lock = threading.Lock()
+        self.conversations = get_state_backend().conversations(db_manager)
         self.db_manager = db_manager
-        self.faq = FAQ()
+        self.faq = get_faq()
+        self.intents = IntentResolver(self.faq)
+        self.response_cache = ResponseCache(self.faq)
+        self.prompt_builder = PromptBuilder()
+        # Обработка сообщений вне event loop, не больше CHAT_WORKERS одновременно
+        self.executor = ThreadPoolExecutor(max_workers=CHAT_WORKERS, thread_name_prefix="chat")
         
+    @property
+    def model(self):
+        if self._model is None:
+            with self._model_lock:
+                if self._model is None:
+                    from .model import SilkwayAI
+                    self._model = SilkwayAI()
+        return self._model
+
+    def classify(self, message: str) -> Tuple[Intent, bool]:
+        """
+        Классификация сообщения (один раз на сообщение) и признак, что ответ
+        потребует генерации моделью (не FAQ, заготовка по теме или перевод на оператора)
+        """
+        intent = self.intents.resolve(message)
+        return intent, self.model.needs_generation(intent)
+
+    async def aclassify(self, message: str) -> Tuple[Intent, bool]:
+        """classify в потоке: поиск по FAQ и SilkwayAI не занимают event loop"""
+        return await asyncio.to_thread(self.classify, message)
+
+    def warm_up(self):
+        """Заранее загрузить токенизатор и модель (вызывается в фоне после старта бота)"""
+        self.prompt_builder.counter.load()
+        self.model.warm_up()
+
     def add_message(self, user_id: int, message: str, role: str = "user"):
-        if user_id not in self.conversations:
-            self.conversations[user_id] = []
-            
-        self.conversations[user_id].append({
-            "role": role,
-            "content": message
-        })
-        
-        # Ограничиваем историю последними 10 сообщениями
-        self.conversations[user_id] = self.conversations[user_id][-10:]
+        # История ограничена кольцевым буфером ConversationStore;
+        # длина в токенах сохраняется вместе с сообщением
+        tokens = self.prompt_builder.counter.measure(message)
+        self.conversations.append(user_id, message, role, tokens)
 
     def get_conversation_context(self, user_id: int) -> str:
-        if user_id not in self.conversations:
-            return ""
-            
-        context = "\n".join([
-            f"{'Пользователь' if msg['role'] == 'user' else 'Ассистент'}: {msg['content']}"
-            for msg in self.conversations[user_id][-3:]  # Берем последние 3 сообщения
-        ])
-        
-        return context
+        """История пользователя для промпта в пределах бюджета токенов"""
+        return self.prompt_builder.fit_history(
+            self.conversations.get(user_id), self.prompt_builder.budget
+        )
+
+    def build_prompt(self, user_id: int, message: str) -> str:
+        """Промпт модели: преамбула, справка FAQ, история до сообщения и сообщение"""
+        history = self.conversations.get(user_id)
+        # Последнее сообщение истории - это текущий вопрос
+        if history and history[-1].role == "user" and history[-1].content == message:
+            history = history[:-1]
+        return self.prompt_builder.build(message, history, self.faq.get_reference(message))
 
     def get_conversation_history(self, user_id: int, limit: int = 5) -> str:
-        if user_id not in self.conversations:
+        messages = self.conversations.get(user_id, limit=limit)
+        if not messages:
             return "История диалога отсутствует"
             
         history = []
-        for msg in self.conversations[user_id][-limit:]:
-            role = "👤 Клиент" if msg['role'] == 'user' else "🤖 Бот"
-            history.append(f"{role}: {msg['content']}")
+        for msg in messages:
+            role = "👤 Клиент" if msg.role == 'user' else "🤖 Бот"
+            history.append(f"{role}: {msg.content}")
             
         return "\n\n".join(history)
 
-    def process_message(self, user_id: int, message: str) -> Tuple[str, bool]:
+    async def aprocess_message(self, user_id: int, message: str,
+                               deadline: float = CHAT_DEADLINE,
+                               on_partial: Optional[Callable[[str], None]] = None,
+                               stream_deadline: float = CHAT_STREAM_DEADLINE,
+                               intent: Optional[Intent] = None) -> Tuple[str, bool]:
+        """
+        Обработать сообщение в пуле потоков, не блокируя event loop.
+        Если ответ не готов за deadline секунд, обработка и генерация отменяются,
+        а пользователь получает запасной ответ (FAQ/тема или оператор).
+        Если частичный ответ уже показывается, ждем до stream_deadline секунд:
+        иначе видимый ответ оборвался бы на середине.
+        on_partial вызывается из другого потока с частичным ответом модели.
+        intent - результат classify, если сообщение уже классифицировано.
+        """
+        cancel = CancelToken()
+        streaming = threading.Event()
+
+        def partial(text: str):
+            streaming.set()
+            on_partial(text)
+
+        future = self.executor.submit(
+            self.process_message, user_id, message, cancel, partial if on_partial else None, intent
+        )
+        result = asyncio.wrap_future(future)
         try:
+            return await asyncio.wait_for(asyncio.shield(result), deadline)
+        except asyncio.TimeoutError:
+            pass
+        if streaming.is_set() and stream_deadline > deadline:
+            try:
+                return await asyncio.wait_for(asyncio.shield(result), stream_deadline - deadline)
+            except asyncio.TimeoutError:
+                deadline = stream_deadline
+
+        cancel.set()
+        # Если задача еще в очереди - она не начнется, и сообщение не попало в историю
+        started = not future.cancel()
+        logger.warning(f"Processing message of user {user_id} exceeded {deadline}s deadline")
+        # Запасной ответ пишет историю (БД, подсчет токенов) - вне event loop
+        return await asyncio.to_thread(
+            self.fallback_response, user_id, message, add_user_message=not started, intent=intent
+        )
+
+    def topic_response(self, intent: Intent) -> Optional[str]:
+        """Заготовленный ответ первой найденной темы, у которой он есть"""
+        topic_responses = self.faq.kb.topic_responses
+        for topic in intent.match.topics:
+            if topic in topic_responses:
+                return topic_responses[topic]
+        return None
+
+    def fallback_response(self, user_id: int, message: str, add_user_message: bool = True,
+                          intent: Optional[Intent] = None) -> Tuple[str, bool]:
+        """Лучший ответ без генерации: FAQ, заготовленный ответ по теме или оператор"""
+        if intent is None:
+            intent = self.intents.resolve(message)
+        response = intent.faq_response or self.topic_response(intent)
+        if add_user_message:
+            self.add_message(user_id, message)
+        if response:
+            self.add_message(user_id, response, role="assistant")
+            return response, False
+        return OPERATOR_HANDOFF_MESSAGE, True
+
+    def close(self):
+        """Остановить пул потоков (задачи из очереди отменяются) и движок генерации"""
+        self.executor.shutdown(wait=False, cancel_futures=True)
+        if self._model is not None:
+            self._model.close()
+
+    def process_message(self, user_id: int, message: str,
+                        cancel: Optional[CancelToken] = None,
+                        on_partial: Optional[Callable[[str], None]] = None,
+                        intent: Optional[Intent] = None) -> Tuple[str, bool]:
+        """
+        Синхронная обработка сообщения.
+        cancel - отмена: генерация снимается, ответ модели не используется,
+        on_partial - получатель частичного ответа модели во время генерации,
+        intent - результат classify (иначе сообщение классифицируется здесь)
+        """
+        try:
+            # Ответы, не зависящие от контекста, берем из кэша
+            cached = self.response_cache.get(message)
+            if cached is not None:
+                response, needs_operator = cached
+                self.add_message(user_id, message)
+                if not needs_operator:
+                    self.add_message(user_id, response, role="assistant")
+                return cached
+
+            # Классифицируем сообщение один раз для всех этапов
+            if intent is None:
+                intent = self.intents.resolve(message)
+
             # Добавляем сообщение в историю
             self.add_message(user_id, message)
             
             # Сначала проверяем FAQ
-            faq_response = self.faq.get_response(message)
-            if faq_response:
-                self.add_message(user_id, faq_response, role="assistant")
-                return faq_response, False
+            if intent.faq_response:
+                self.add_message(user_id, intent.faq_response, role="assistant")
+                self.response_cache.set(message, intent.faq_response, False)
+                return intent.faq_response, False
 
             # Проверяем, относится ли вопрос к разрешенным темам
-            if not self.model.is_allowed_question(message):
-                # Возвращаем ответ о переводе на оператора
-                return (
-                    "🔄 Подождите, пожалуйста. Я перевожу ваш запрос на оператора...\n\n"
-                    "Оператор ответит вам в ближайшее время.",
-                    True
-                )
+            if intent.needs_operator:
+                # Возвращаем ответ о переводе на оператора. Он не кэшируется:
+                # иначе ошибка классификации закрепилась бы за ключом до конца TTL
+                return OPERATOR_HANDOFF_MESSAGE, True
+
+            # Заготовленный ответ по теме, как и FAQ, не зависит от истории
+            response = self.topic_response(intent)
+            if response:
+                self.add_message(user_id, response, role="assistant")
+                self.response_cache.set(message, response, False)
+                return response, False
 
             # Получаем контекст и генерируем ответ
-            context = self.get_conversation_context(user_id)
-            response = self.model.generate_response(f"{context}\nПользователь: {message}")
+            if cancel is not None and cancel.is_set():
+                raise ProcessingCancelled()
+            response = self.model.generate_response(
+                message, intent=intent, prompt=self.build_prompt(user_id, message),
+                on_partial=on_partial, cancel=cancel
+            )
+            if cancel is not None and cancel.is_set():
+                # Пользователь уже получил запасной ответ
+                raise ProcessingCancelled()
             
             # Если модель не смогла сгенерировать внятный ответ
             if not response or response.strip() == "":
@@ -85,10 +238,12 @@ class ChatManager:
             
             return response, False
 
+        except ProcessingCancelled:
+            logger.info(f"Processing message of user {user_id} cancelled after deadline")
+            return OPERATOR_HANDOFF_MESSAGE, True
         except Exception as e:
             logger.error(f"Error processing message: {e}")
             return "Извините, произошла ошибка. Перевожу на оператора...", True
 
     def clear_conversation(self, user_id: int):
-        if user_id in self.conversations:
-            del self.conversations[user_id]
\ No newline at end of file
+        self.conversations.clear(user_id)
\ No newline at end of file
@@ -0,0 +1,167 @@
+import logging
+import sys
+import threading
+import time
+from collections import OrderedDict, deque
+from contextlib import contextmanager
+from typing import List, Optional
+
+from app.config import (
+    CONVERSATION_HISTORY_SIZE,
+    CONVERSATION_MAX_USERS,
+    CONVERSATION_TTL,
+    CONVERSATION_MAX_BYTES,
+)
+
+logger = logging.getLogger(__name__)
+
+# Типы взаимодействий, из которых восстанавливается история диалога
+REHYDRATE_MESSAGE_TYPES = ('ai', 'operator_redirect')
+
+
+class Message:
+    """Сообщение диалога (без __dict__, чтобы история занимала меньше памяти)"""
+    __slots__ = ('role', 'content', 'tokens')
+
+    def __init__(self, role: str, content: str, tokens: Optional[int] = None):
+        self.role = role
+        self.content = content
+        # Длина в токенах модели (считается PromptBuilder один раз)
+        self.tokens = tokens
+
+    @property
+    def size(self) -> int:
+        return sys.getsizeof(self.content)
+
+
+class Conversation:
+    """Кольцевой буфер последних сообщений пользователя"""
+    __slots__ = ('messages', 'size', 'last_access')
+
+    def __init__(self, history_size: int):
+        self.messages = deque(maxlen=history_size)
+        self.size = 0
+        self.last_access = time.monotonic()
+
+    def append(self, message: Message) -> int:
+        """Добавить сообщение; Returns: изменение размера в байтах"""
+        delta = message.size
+        if len(self.messages) == self.messages.maxlen:
+            delta -= self.messages[0].size
+        self.messages.append(message)
+        self.size += delta
+        return delta
+
+
+def load_history(db_manager, user_id: int, history_size: int) -> List[Message]:
+    """Последние сообщения пользователя из таблицы interactions (старые первыми)"""
+    if db_manager is None:
+        return []
+    try:
+        interactions = db_manager.get_user_interactions(
+            user_id, limit=history_size, message_types=REHYDRATE_MESSAGE_TYPES
+        )
+    except Exception as e:
+        logger.error(f"Error loading conversation for user {user_id}: {e}")
+        return []
+    messages = []
+    # get_user_interactions возвращает новые записи первыми
+    for interaction in reversed(interactions):
+        if interaction.message:
+            messages.append(Message("user", interaction.message))
+        if interaction.message_type == 'ai' and interaction.response:
+            messages.append(Message("assistant", interaction.response))
+    return messages[-history_size:]
+
+
+class ConversationStore:
+    """
+    Ограниченное хранилище диалогов ChatManager.
+    История пользователя - кольцевой буфер из history_size сообщений.
+    Пользователи вытесняются по LRU, по TTL и при превышении лимита памяти;
+    вытесненная история прозрачно восстанавливается из таблицы interactions.
+    """
+
+    def __init__(self, db_manager, history_size: int = CONVERSATION_HISTORY_SIZE,
+                 max_users: int = CONVERSATION_MAX_USERS, ttl: float = CONVERSATION_TTL,
+                 max_bytes: int = CONVERSATION_MAX_BYTES):
+        self.db_manager = db_manager
+        self.history_size = history_size
+        self.max_users = max_users
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.size = 0
+        self.evictions = 0
+        self.rehydrations = 0
+        self._conversations = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __contains__(self, user_id: int) -> bool:
+        return user_id in self._conversations
+
+    def __len__(self) -> int:
+        return len(self._conversations)
+
+    def _load(self, user_id: int) -> Conversation:
+        """Восстановить историю пользователя из interactions (без блокировки)"""
+        conversation = Conversation(self.history_size)
+        for message in load_history(self.db_manager, user_id, self.history_size):
+            conversation.append(message)
+        return conversation
+
+    @contextmanager
+    def _locked(self, user_id: int):
+        """
+        Захватить блокировку хранилища и выдать диалог пользователя.
+        История из БД загружается вне блокировки, чтобы запрос к БД не задерживал
+        остальных пользователей; если диалог тем временем появился в памяти,
+        загруженная копия отбрасывается.
+        """
+        loaded = None
+        while True:
+            with self._lock:
+                conversation = self._conversations.get(user_id)
+                if conversation is None and loaded is not None:
+                    conversation = loaded
+                    self._conversations[user_id] = conversation
+                    self.size += conversation.size
+                    if conversation.messages:
+                        self.rehydrations += 1
+                if conversation is not None:
+                    self._conversations.move_to_end(user_id)
+                    conversation.last_access = time.monotonic()
+                    yield conversation
+                    self._evict()
+                    return
+            loaded = self._load(user_id)
+
+    def _evict(self):
+        """Вытеснить устаревшие и самые давние диалоги сверх лимитов"""
+        expire_before = time.monotonic() - self.ttl
+        while self._conversations:
+            user_id, oldest = next(iter(self._conversations.items()))
+            if (len(self._conversations) <= self.max_users
+                    and self.size <= self.max_bytes
+                    and oldest.last_access >= expire_before):
+                break
+            del self._conversations[user_id]
+            self.size -= oldest.size
+            self.evictions += 1
+
+    def append(self, user_id: int, content: str, role: str = "user", tokens: Optional[int] = None):
+        """Добавить сообщение в историю пользователя"""
+        with self._locked(user_id) as conversation:
+            self.size += conversation.append(Message(role, content, tokens))
+
+    def get(self, user_id: int, limit: int = None) -> List[Message]:
+        """Последние limit сообщений пользователя (все, если limit не задан)"""
+        with self._locked(user_id) as conversation:
+            messages = list(conversation.messages)
+        return messages[-limit:] if limit else messages
+
+    def clear(self, user_id: int):
+        """Удалить историю пользователя из памяти"""
+        with self._lock:
+            conversation = self._conversations.pop(user_id, None)
+            if conversation is not None:
+                self.size -= conversation.size
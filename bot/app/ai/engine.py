@@ -0,0 +1,703 @@
+# ai/engine.py
+"""
+Движок генерации с динамическим батчингом.
+
+Модель работает в отдельном процессе. Запросы из всех потоков бота
+попадают в общую очередь; процесс-воркер берет первый запрос, ждет
+до max_wait_ms остальные (не больше max_batch_size) и прогоняет их через
+model.generate одним батчем с выравниванием слева. Ответы возвращаются
+через очередь результатов, поток-читатель разрешает Future вызывающих.
+
+Если задан prefix (постоянная системная преамбула промптов), воркер один
+раз считает для него past_key_values и начинает prefill каждого промпта
+с этой преамбулой с готового кэша, кодируя только остаток. Промпт
+токенизируется целиком: кэш используется, только если его токены
+начинаются с токенов преамбулы (у SentencePiece токенизация на стыке
+может отличаться от раздельной).
+
+Для запросов с on_partial воркер во время генерации присылает накопленный
+текст ответа (не чаще GENERATION_STREAM_INTERVAL_MS), а поток-читатель
+передает его в on_partial.
+
+Отмена Future запроса (или CancelToken, переданный в generate) отправляет
+id запроса воркеру: запрос из очереди в батч не попадает, а генерация
+батча, все запросы которого отменены, прерывается.
+
+torch и transformers импортируются только внутри процесса-воркера.
+"""
+import itertools
+import logging
+import multiprocessing
+import queue
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future, TimeoutError as FutureTimeoutError
+from typing import Callable, Dict, List, Optional
+
+from app.config import (
+    AI_MODEL_PATH,
+    AI_MODEL_QUANTIZATION,
+    AI_MODEL_QUANTIZATION_MODES,
+    GENERATION_BATCH_SIZE,
+    GENERATION_BATCH_WAIT_MS,
+    GENERATION_MAX_INPUT_TOKENS,
+    GENERATION_START_TIMEOUT,
+    GENERATION_STREAM_INTERVAL_MS,
+)
+
+logger = logging.getLogger(__name__)
+
+_STOP = None
+
+
+# ----- Загрузчики модели (выполняются в процессе-воркере) -----
+
+def load_pretrained(model_path: str = AI_MODEL_PATH, quantization: str = AI_MODEL_QUANTIZATION):
+    """
+    Токенизатор и модель из каталога или хаба HuggingFace.
+    quantization='int8' - динамически квантованная модель на CPU (с кэшем на диске)
+    """
+    if quantization not in AI_MODEL_QUANTIZATION_MODES:
+        raise ValueError(f"Unknown quantization mode: {quantization}")
+    import torch
+    from transformers import AutoModelForCausalLM, AutoTokenizer
+
+    tokenizer = AutoTokenizer.from_pretrained(model_path)
+    if quantization == 'int8':
+        from .quantization import load_quantized
+        logger.info(f"Loading model {model_path} quantized to int8 on cpu")
+        return tokenizer, load_quantized(model_path)
+
+    device = "cuda" if torch.cuda.is_available() else "cpu"
+    logger.info(f"Loading model {model_path} on {device}")
+    model = AutoModelForCausalLM.from_pretrained(model_path).to(device)
+    return tokenizer, model
+
+
+def tiny_random_lm(seed: int = 0, hidden_size: int = 64, layers: int = 2):
+    """
+    Маленькая модель архитектуры LLaMA (как у saiga2) со случайными весами
+    и байтовым токенизатором. Ничего не скачивает; для проверки движка
+    и бенчмарков на CPU.
+    """
+    import torch
+    from tokenizers import Tokenizer, decoders, models, pre_tokenizers
+    from transformers import LlamaConfig, LlamaForCausalLM, PreTrainedTokenizerFast
+
+    eos = "<|endoftext|>"
+    # alphabet() возвращает символы в произвольном порядке: сортируем для воспроизводимости
+    vocab = {ch: i for i, ch in enumerate(sorted(pre_tokenizers.ByteLevel.alphabet()))}
+    vocab[eos] = len(vocab)
+    backend = Tokenizer(models.BPE(vocab=vocab, merges=[]))
+    backend.pre_tokenizer = pre_tokenizers.ByteLevel(add_prefix_space=False)
+    backend.decoder = decoders.ByteLevel()
+    tokenizer = PreTrainedTokenizerFast(tokenizer_object=backend, eos_token=eos, pad_token=eos)
+
+    torch.manual_seed(seed)
+    config = LlamaConfig(
+        vocab_size=len(vocab), hidden_size=hidden_size, intermediate_size=hidden_size * 4,
+        num_hidden_layers=layers, num_attention_heads=max(1, hidden_size // 64),
+        max_position_embeddings=2048, bos_token_id=vocab[eos], eos_token_id=vocab[eos],
+        pad_token_id=vocab[eos],
+    )
+    return tokenizer, LlamaForCausalLM(config)
+
+
+# ----- KV-кэш общей преамбулы -----
+
+def _cache_layers(past_key_values) -> list:
+    """[(keys, values)] по слоям из кэша модели (формат зависит от версии transformers)"""
+    if hasattr(past_key_values, 'layers'):
+        return [(layer.keys, layer.values) for layer in past_key_values.layers]
+    if hasattr(past_key_values, 'to_legacy_cache'):
+        return list(past_key_values.to_legacy_cache())
+    return list(past_key_values)
+
+
+class PrefixCache:
+    """
+    past_key_values постоянного начала промпта. Считается один раз после
+    загрузки модели (и заново вместе с ней), хранится в памяти воркера.
+    """
+
+    def __init__(self, tokenizer, model, text: str):
+        import torch
+
+        self.text = text
+        self.tokenizer = tokenizer
+        self.input_ids = tokenizer(text, return_tensors="pt").input_ids.to(model.device)
+        self.ids = self.input_ids[0].tolist()
+        with torch.inference_mode():
+            output = model(input_ids=self.input_ids, use_cache=True)
+        self.layers = _cache_layers(output.past_key_values)
+
+    def __len__(self) -> int:
+        return self.input_ids.shape[1]
+
+    def suffix(self, prompt: str) -> Optional[List[int]]:
+        """
+        Токены промпта после преамбулы. None, если промпт с нее не начинается
+        или его токенизация не начинается с токенов преамбулы (тогда кэш неприменим).
+        """
+        if not prompt.startswith(self.text):
+            return None
+        ids = self.tokenizer(prompt)["input_ids"]
+        if len(ids) <= len(self.ids) or ids[:len(self.ids)] != self.ids:
+            return None
+        return ids[len(self.ids):]
+
+    def past_key_values(self, batch_size: int):
+        """Новый кэш с преамбулой для батча (generate дописывает в кэш, поэтому копия)"""
+        from transformers import DynamicCache
+
+        cache = DynamicCache()
+        for layer_idx, (keys, values) in enumerate(self.layers):
+            cache.update(
+                keys.expand(batch_size, -1, -1, -1).contiguous(),
+                values.expand(batch_size, -1, -1, -1).contiguous(),
+                layer_idx,
+            )
+        return cache
+
+
+# ----- Отмена запросов -----
+
+class CancelToken:
+    """
+    Отмена обработки вызывающим (например, по истечении срока ответа).
+    Обработчики add_callback вызываются при отмене; добавленный после
+    отмены обработчик вызывается сразу.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._cancelled = False
+        self._callbacks = []
+
+    def is_set(self) -> bool:
+        return self._cancelled
+
+    def set(self):
+        with self._lock:
+            if self._cancelled:
+                return
+            self._cancelled = True
+            callbacks, self._callbacks = self._callbacks, []
+        for callback in callbacks:
+            try:
+                callback()
+            except Exception as e:
+                logger.error(f"Error in cancel callback: {e}")
+
+    def add_callback(self, callback: Callable[[], None]):
+        with self._lock:
+            if not self._cancelled:
+                self._callbacks.append(callback)
+                return
+        callback()
+
+
+class _Cancellations:
+    """
+    Отмененные запросы в воркере (id приходят через очередь cancels).
+    Запросы берутся из очереди по возрастанию id, поэтому отмена
+    уже обработанного запроса не запоминается.
+    """
+
+    def __init__(self, cancels=None):
+        self.cancels = cancels
+        self.ids = set()
+        # Наибольший id, взятый из очереди, и запросы в pending и текущем батче
+        self.taken = 0
+        self.active = set()
+
+    def poll(self):
+        while self.cancels is not None:
+            try:
+                request_id = self.cancels.get_nowait()
+            except (queue.Empty, EOFError, OSError):
+                return
+            if request_id > self.taken or request_id in self.active:
+                self.ids.add(request_id)
+
+    def take(self, item) -> bool:
+        """Учесть запрос, взятый из очереди; False - запрос уже отменен"""
+        self.poll()
+        self.taken = max(self.taken, item[0])
+        if item[0] in self.ids:
+            self.ids.discard(item[0])
+            return False
+        self.active.add(item[0])
+        return True
+
+    def cancelled(self, item) -> bool:
+        return item[0] in self.ids
+
+    def done(self, item):
+        self.active.discard(item[0])
+        self.ids.discard(item[0])
+
+
+class _CancelCriteria:
+    """
+    Критерий остановки generate по строкам батча: строка готова, если запрос
+    отменен или набрал свои max_new_tokens. Иначе отмененный длинный запрос
+    держал бы генерацию коротких соседей по батчу.
+    start - длина промпта (выставляет _generate).
+    """
+
+    def __init__(self, cancellations: _Cancellations, items):
+        self.cancellations = cancellations
+        self.items = items
+        self.start = 0
+
+    def __call__(self, input_ids, scores, **kwargs):
+        import torch
+
+        self.cancellations.poll()
+        generated = input_ids.shape[1] - self.start
+        return torch.tensor(
+            [self.cancellations.cancelled(item) or generated >= item[2] for item in self.items],
+            dtype=torch.bool, device=input_ids.device,
+        )
+
+
+# ----- Процесс-воркер -----
+
+class _PartialStreamer:
+    """
+    Стример для model.generate: копит новые токены каждой строки батча
+    и не чаще interval секунд отдает текст потоковых запросов в on_partial.
+    """
+
+    def __init__(self, tokenizer, items, on_partial: Callable, interval: float,
+                 cancellations: Optional[_Cancellations] = None):
+        self.tokenizer = tokenizer
+        self.items = items
+        self.on_partial = on_partial
+        self.interval = interval
+        self.cancellations = cancellations or _Cancellations()
+        self.rows = [i for i, item in enumerate(items) if item[4]]
+        self.tokens = [[] for _ in items]
+        self.sent = [""] * len(items)
+        self._prompt_seen = False
+        self._last = time.monotonic()
+
+    def put(self, value):
+        # Первый вызов - токены промпта, дальше - по токену на строку за шаг
+        if not self._prompt_seen:
+            self._prompt_seen = True
+            return
+        for row, token in enumerate(value.reshape(-1).tolist()):
+            self.tokens[row].append(token)
+        now = time.monotonic()
+        if now - self._last >= self.interval:
+            self._last = now
+            self._flush()
+
+    def _flush(self):
+        for row in self.rows:
+            item = self.items[row]
+            if self.cancellations.cancelled(item):
+                continue
+            text = self.tokenizer.decode(self.tokens[row][:item[2]], skip_special_tokens=True).strip()
+            if text and text != self.sent[row]:
+                self.sent[row] = text
+                self.on_partial(item, text)
+
+    def end(self):
+        pass
+
+
+def _collect_batch(requests, pending: deque, max_batch_size: int, max_wait: float,
+                   cancellations: Optional[_Cancellations] = None):
+    """
+    Следующий батч: первый запрос (ждем сколько угодно) и совместимые с ним
+    (та же temperature), пришедшие за max_wait секунд. Несовместимые
+    запросы откладываются в pending до следующих батчей, отмененные
+    отбрасываются.
+    Возвращает None, если получена команда остановки.
+    """
+    cancellations = cancellations or _Cancellations()
+    cancellations.poll()
+    for item in [item for item in pending if cancellations.cancelled(item)]:
+        pending.remove(item)
+        cancellations.done(item)
+
+    if pending:
+        first = pending.popleft()
+    else:
+        while True:
+            first = requests.get()
+            if first is _STOP:
+                return None
+            if cancellations.take(first):
+                break
+    batch = [first]
+    temperature = first[3]
+
+    # Сначала отложенные запросы с той же температурой
+    for item in list(pending):
+        if len(batch) >= max_batch_size:
+            break
+        if item[3] == temperature:
+            pending.remove(item)
+            batch.append(item)
+
+    deadline = time.monotonic() + max_wait
+    while len(batch) < max_batch_size:
+        timeout = deadline - time.monotonic()
+        if timeout <= 0:
+            break
+        try:
+            item = requests.get(timeout=timeout)
+        except queue.Empty:
+            break
+        if item is _STOP:
+            requests.put(_STOP)
+            break
+        if not cancellations.take(item):
+            continue
+        if item[3] == temperature:
+            batch.append(item)
+        else:
+            pending.append(item)
+    return batch
+
+
+def _generate(tokenizer, model, prompts: list, limits: List[int], temperature: float,
+              max_input_tokens: int, prefix: Optional[PrefixCache] = None,
+              streamer: Optional[_PartialStreamer] = None,
+              stop: Optional[_CancelCriteria] = None) -> List[str]:
+    """
+    Один вызов model.generate для промптов. С prefix промпты - это токены
+    остатков после преамбулы (PrefixCache.suffix): к ним слева приписываются
+    токены преамбулы, а их past_key_values передаются в generate, и prefill
+    считает только остатки.
+    stop - критерий досрочной остановки строк (отмена или свой лимит токенов).
+    """
+    import torch
+    from transformers import StoppingCriteriaList
+
+    if prefix is None:
+        inputs = tokenizer(
+            prompts, return_tensors="pt", padding=True,
+            truncation=True, max_length=max_input_tokens,
+        ).to(model.device)
+        cache = {}
+    else:
+        # Паддинг остатков слева оказывается между преамбулой и остатком; он замаскирован
+        max_length = max(1, max_input_tokens - len(prefix))
+        inputs = tokenizer.pad(
+            {"input_ids": [ids[-max_length:] for ids in prompts]}, padding=True, return_tensors="pt",
+        ).to(model.device)
+        batch_size = inputs["input_ids"].shape[0]
+        inputs["input_ids"] = torch.cat(
+            [prefix.input_ids.expand(batch_size, -1), inputs["input_ids"]], dim=1
+        )
+        inputs["attention_mask"] = torch.cat(
+            [torch.ones(batch_size, len(prefix), dtype=inputs["attention_mask"].dtype,
+                        device=model.device), inputs["attention_mask"]], dim=1
+        )
+        cache = {"past_key_values": prefix.past_key_values(batch_size)}
+
+    if stop is not None:
+        stop.start = inputs["input_ids"].shape[1]
+    sampling = {"do_sample": True, "temperature": temperature} if temperature > 0 else {"do_sample": False}
+    with torch.inference_mode():
+        output = model.generate(
+            input_ids=inputs["input_ids"],
+            attention_mask=inputs["attention_mask"],
+            max_new_tokens=max(limits),
+            pad_token_id=tokenizer.pad_token_id,
+            eos_token_id=tokenizer.eos_token_id,
+            streamer=streamer,
+            stopping_criteria=StoppingCriteriaList([stop] if stop is not None else []),
+            **cache,
+            **sampling,
+        )
+    new_tokens = output[:, inputs["input_ids"].shape[1]:]
+    return [
+        tokenizer.decode(tokens[:limit], skip_special_tokens=True).strip()
+        for tokens, limit in zip(new_tokens, limits)
+    ]
+
+
+def _generate_batch(tokenizer, model, batch, max_input_tokens: int,
+                    prefix: Optional[PrefixCache] = None,
+                    on_partial: Optional[Callable] = None,
+                    stream_interval: float = GENERATION_STREAM_INTERVAL_MS / 1000,
+                    cancellations: Optional[_Cancellations] = None) -> List[str]:
+    """
+    Тексты ответов для батча запросов (request_id, prompt, max_new_tokens, temperature, stream).
+    Промпты с общей преамбулой и без нее генерируются отдельными вызовами.
+    on_partial(item, text) получает промежуточный текст потоковых запросов.
+    Вызов, все запросы которого отменены, пропускается или прерывается.
+    """
+    cancellations = cancellations or _Cancellations()
+    temperature = batch[0][3]
+    suffixes = [prefix.suffix(item[1]) if prefix is not None else None for item in batch]
+    groups = [
+        ([i for i, suffix in enumerate(suffixes) if suffix is not None], prefix),
+        ([i for i, suffix in enumerate(suffixes) if suffix is None], None),
+    ]
+    texts = [None] * len(batch)
+    for indices, group_prefix in groups:
+        cancellations.poll()
+        if all(cancellations.cancelled(batch[i]) for i in indices):
+            continue
+        prompts = [suffixes[i] if group_prefix is not None else batch[i][1] for i in indices]
+        limits = [batch[i][2] for i in indices]
+        items = [batch[i] for i in indices]
+        streamer = None
+        if on_partial is not None and any(item[4] for item in items):
+            streamer = _PartialStreamer(tokenizer, items, on_partial, stream_interval, cancellations)
+        results = _generate(tokenizer, model, prompts, limits, temperature, max_input_tokens,
+                            group_prefix, streamer, _CancelCriteria(cancellations, items))
+        for i, text in zip(indices, results):
+            texts[i] = text
+    return texts
+
+
+def _worker_main(loader: Callable, loader_args: tuple, requests, results,
+                 max_batch_size: int, max_wait: float, max_input_tokens: int,
+                 prefix_text: Optional[str] = None, cancels=None):
+    """Цикл процесса-воркера: загрузить модель, посчитать кэш преамбулы и обслуживать батчи"""
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(name)s - %(levelname)s - %(message)s")
+    try:
+        tokenizer, model = loader(*loader_args)
+        # Для батча промпты выравниваются слева: генерация продолжает последний токен.
+        # Слишком длинный промпт обрезается тоже слева, чтобы не потерять "Ответ:" в конце
+        tokenizer.padding_side = "left"
+        tokenizer.truncation_side = "left"
+        if tokenizer.pad_token is None:
+            tokenizer.pad_token = tokenizer.eos_token
+        model.eval()
+        prefix = PrefixCache(tokenizer, model, prefix_text) if prefix_text else None
+    except Exception as e:
+        results.put((None, None, f"{type(e).__name__}: {e}", 0, True))
+        return
+    results.put((None, None, None, 0, True))
+
+    def on_partial(item, text):
+        results.put((item[0], text, None, 0, False))
+
+    pending = deque()
+    cancellations = _Cancellations(cancels)
+    for batch_id in itertools.count(1):
+        batch = _collect_batch(requests, pending, max_batch_size, max_wait, cancellations)
+        if batch is None:
+            break
+        try:
+            texts = _generate_batch(tokenizer, model, batch, max_input_tokens, prefix, on_partial,
+                                    cancellations=cancellations)
+        except Exception as e:
+            logger.error(f"Error generating batch of {len(batch)}: {e}")
+            texts = [None] * len(batch)
+            error = f"{type(e).__name__}: {e}"
+        else:
+            error = None
+        for item, text in zip(batch, texts):
+            # Отмененный запрос клиент уже не ждет
+            if not cancellations.cancelled(item):
+                results.put((item[0], text, error, batch_id, True))
+            cancellations.done(item)
+
+
+# ----- Клиент в процессе бота -----
+
+class GenerationEngine:
+    """
+    Очередь генерации с батчингом в отдельном процессе.
+    submit() возвращает concurrent.futures.Future, generate() ждет результат.
+    """
+
+    def __init__(self, loader: Callable = load_pretrained, loader_args: tuple = (AI_MODEL_PATH,),
+                 max_batch_size: int = GENERATION_BATCH_SIZE,
+                 max_wait_ms: float = GENERATION_BATCH_WAIT_MS,
+                 max_input_tokens: int = GENERATION_MAX_INPUT_TOKENS,
+                 prefix: Optional[str] = None):
+        self.loader = loader
+        self.loader_args = loader_args
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000
+        self.max_input_tokens = max_input_tokens
+        # Общая преамбула промптов, для которой воркер держит KV-кэш
+        self.prefix = prefix
+
+        # spawn: воркер не наследует потоки и состояние бота (fork с torch небезопасен)
+        self._context = multiprocessing.get_context("spawn")
+        self._requests = None
+        self._results = None
+        self._cancels = None
+        self._process = None
+        self._reader = None
+        self._futures: Dict[int, Future] = {}
+        self._partial_callbacks: Dict[int, Callable[[str], None]] = {}
+        self._lock = threading.Lock()
+        self._ids = itertools.count(1)
+
+        self.completed = 0
+        self.batches = 0
+        self._last_batch = 0
+
+    @property
+    def running(self) -> bool:
+        return self._process is not None and self._process.is_alive()
+
+    def start(self, timeout: float = GENERATION_START_TIMEOUT):
+        """Запустить процесс-воркер и дождаться загрузки модели"""
+        if self.running:
+            return
+        self._requests = self._context.Queue()
+        self._results = self._context.Queue()
+        self._cancels = self._context.Queue()
+        self._process = self._context.Process(
+            target=_worker_main,
+            args=(self.loader, self.loader_args, self._requests, self._results,
+                  self.max_batch_size, self.max_wait, self.max_input_tokens, self.prefix,
+                  self._cancels),
+            name="generation-worker",
+            daemon=True,
+        )
+        self._process.start()
+
+        try:
+            _, _, error, _, _ = self._results.get(timeout=timeout)
+        except queue.Empty:
+            self._process.terminate()
+            raise RuntimeError(f"Generation worker did not start in {timeout}s")
+        if error:
+            self._process.join()
+            raise RuntimeError(f"Generation worker failed to load model: {error}")
+
+        self._reader = threading.Thread(target=self._read_results, name="generation-results", daemon=True)
+        self._reader.start()
+        logger.info(
+            f"Generation engine started: batch {self.max_batch_size}, wait {self.max_wait * 1000:.0f}ms"
+        )
+
+    def submit(self, prompt: str, max_new_tokens: int = 200, temperature: float = 0.7,
+               on_partial: Optional[Callable[[str], None]] = None) -> Future:
+        """
+        Поставить промпт в очередь генерации.
+        on_partial(text) вызывается из потока-читателя с накопленным текстом ответа.
+        Отмена Future (future.cancel()) снимает запрос с генерации
+        """
+        if not self.running:
+            raise RuntimeError("Generation engine is not running")
+        future = Future()
+        with self._lock:
+            # Под блокировкой: воркер получает запросы по возрастанию id
+            request_id = next(self._ids)
+            self._futures[request_id] = future
+            if on_partial is not None:
+                self._partial_callbacks[request_id] = on_partial
+            self._requests.put((request_id, prompt, max_new_tokens, temperature, on_partial is not None))
+        future.add_done_callback(lambda f: self._cancel(request_id) if f.cancelled() else None)
+        return future
+
+    def generate(self, prompt: str, max_new_tokens: int = 200, temperature: float = 0.7,
+                 timeout: Optional[float] = None,
+                 on_partial: Optional[Callable[[str], None]] = None,
+                 cancel: Optional[CancelToken] = None) -> str:
+        """
+        Сгенерировать ответ, ожидая не дольше timeout секунд.
+        По таймауту или отмене cancel запрос снимается с генерации
+        (CancelledError при отмене)
+        """
+        future = self.submit(prompt, max_new_tokens, temperature, on_partial)
+        if cancel is not None:
+            cancel.add_callback(future.cancel)
+        try:
+            return future.result(timeout)
+        except FutureTimeoutError:
+            # До Python 3.11 это не встроенный TimeoutError
+            future.cancel()
+            raise
+
+    def _cancel(self, request_id: int):
+        """Сообщить воркеру об отмене запроса, если он еще не завершен"""
+        with self._lock:
+            if self._futures.pop(request_id, None) is None:
+                return
+            self._partial_callbacks.pop(request_id, None)
+        try:
+            self._cancels.put(request_id)
+        except (ValueError, OSError):
+            # Очередь уже закрыта вместе с воркером
+            pass
+
+    def _partial(self, request_id: int, text: str):
+        callback = self._partial_callbacks.get(request_id)
+        if callback is None:
+            return
+        try:
+            callback(text)
+        except Exception as e:
+            logger.error(f"Error in partial response callback: {e}")
+
+    def _resolve(self, request_id: int, text: Optional[str], error: Optional[str]):
+        with self._lock:
+            future = self._futures.pop(request_id, None)
+            self._partial_callbacks.pop(request_id, None)
+        # Вызывающий мог отменить Future по таймауту - результат просто отбрасываем
+        if future is None or not future.set_running_or_notify_cancel():
+            return
+        if error:
+            future.set_exception(RuntimeError(error))
+        else:
+            future.set_result(text)
+
+    def _read_results(self):
+        """Разрешать Future по результатам воркера; при его падении - завершить все с ошибкой"""
+        while True:
+            try:
+                request_id, text, error, batch_id, done = self._results.get(timeout=1)
+            except queue.Empty:
+                if self.running:
+                    continue
+                break
+            except (EOFError, OSError):
+                break
+            if not done:
+                self._partial(request_id, text)
+                continue
+            # Результаты одного батча приходят подряд
+            self.completed += 1
+            if batch_id != self._last_batch:
+                self._last_batch = batch_id
+                self.batches += 1
+            self._resolve(request_id, text, error)
+
+        with self._lock:
+            request_ids = list(self._futures)
+        if request_ids:
+            logger.error(f"Generation worker stopped, failing {len(request_ids)} requests")
+        for request_id in request_ids:
+            self._resolve(request_id, None, "generation worker stopped")
+
+    def stats(self) -> dict:
+        return {
+            'running': self.running,
+            'completed': self.completed,
+            'batches': self.batches,
+            'mean_batch_size': round(self.completed / self.batches, 2) if self.batches else 0.0,
+            'pending': len(self._futures),
+        }
+
+    def close(self, timeout: float = 5.0):
+        """Остановить воркер; незавершенные запросы получают ошибку"""
+        if self._process is None:
+            return
+        if self._process.is_alive():
+            self._requests.put(_STOP)
+            self._process.join(timeout)
+            if self._process.is_alive():
+                self._process.terminate()
+                self._process.join()
+        if self._reader is not None:
+            self._reader.join(timeout)
+        self._process = None
+
@@ -1,118 +1,181 @@
-import torch
-from transformers import AutoModelForCausalLM, AutoTokenizer
-from typing import Dict, List, Optional
+from typing import Callable, Dict, List, Optional
 import logging
-from app.knowledge_base.faq import FAQ
+import threading
+from concurrent.futures import CancelledError
+from app.config import (
+    AI_MODEL_PATH, AI_MODEL_ENABLED, AI_MODEL_QUANTIZATION,
+    GENERATION_MAX_NEW_TOKENS, GENERATION_TIMEOUT, GENERATION_PREFIX_CACHE,
+)
+from app.knowledge_base.prompts import PromptManager
+from app.knowledge_base.faq import get_faq
+from app.knowledge_base.intent import Intent, IntentResolver
 
 logger = logging.getLogger(__name__)
 
 class SilkwayAI:
-    def __init__(self, model_path: str = "IlyaGusev/saiga2_7b_lora"):
-        self.device = "cuda" if torch.cuda.is_available() else "cpu"
-        logger.info(f"Using device: {self.device}")
+    def __init__(self, model_path: str = AI_MODEL_PATH):
+        self.model_path = model_path
         
-        # Временно отключаем загрузку модели для тестирования
-        self.tokenizer = None
-        self.model = None
+        # Модель работает в процессе движка генерации (load_model / warm_up),
+        # по умолчанию отключена
+        self.engine = None
+        # Движок запускает один поток, остальные вызовы его не дублируют
+        self._engine_lock = threading.Lock()
+        self._starting = None
+        self._closed = False
         
-        # Инициализируем FAQ
-        self.faq = FAQ()
+        # Общая база знаний процесса
+        self.faq = get_faq()
+        self.intents = IntentResolver(self.faq)
         
-        # Определяем разрешенные темы и ключевые слова
-        self.allowed_topics = {
-            'доставка': [
-                'доставка', 'доставить', 'привезти', 'курьер', 'получить',
-                'заказ', 'отправление', 'посылка'
-            ],
-            'трекинг': [
-                'трек', 'отследить', 'где', 'статус', 'местоположение',
-                'номер', 'посмотреть', 'найти'
-            ],
-            'адрес': [
-                'адрес', 'склад', 'находится', 'расположен', 'контакты',
-                'где находится', 'как добраться', 'координаты'
-            ],
-            'возврат': [
-                'возврат', 'вернуть', 'обмен', 'поменять', 'брак',
-                'недостача', 'не подошло', 'проблема'
-            ],
-            'оплата': [
-                'оплата', 'оплатить', 'стоимость', 'цена', 'тариф',
-                'сколько стоит', 'карта', 'счет'
-            ],
-            'график': [
-                'график', 'время', 'работает', 'открыто', 'закрыто',
-                'режим', 'часы работы', 'выходные'
-            ]
-        }
+    @property
+    def ready(self) -> bool:
+        return self.engine is not None and self.engine.running
 
-    def is_allowed_question(self, text: str) -> bool:
+    def load_model(self, wait: bool = True) -> bool:
         """
-        Проверка, относится ли вопрос к разрешенным темам
+        Запустить движок генерации: один на процесс, даже при одновременных вызовах.
+        wait=False - не ждать загрузки модели (она продолжается в фоне).
+        Returns: движок готов к генерации
         """
-        text = text.lower()
-        
-        # Сначала проверяем FAQ
-        if self.faq.get_response(text):
+        if self.ready:
             return True
-            
-        # Проверяем ключевые слова по темам
-        for topic_keywords in self.allowed_topics.values():
-            if any(keyword in text for keyword in topic_keywords):
+        with self._engine_lock:
+            if self.ready:
                 return True
-                
-        return False
+            starting = self._starting
+            if starting is None and not self._closed:
+                starting = threading.Thread(target=self._start_engine, name="generation-start", daemon=True)
+                self._starting = starting
+                starting.start()
+        if wait and starting is not None:
+            starting.join()
+        return self.ready
+
+    def _start_engine(self):
+        """Запуск движка в потоке, занявшем _starting"""
+        try:
+            from .engine import GenerationEngine, load_pretrained
+            # Все промпты начинаются с BASE_CONTEXT: его KV-кэш считается один раз
+            prefix = PromptManager.BASE_CONTEXT if GENERATION_PREFIX_CACHE else None
+            engine = GenerationEngine(load_pretrained, (self.model_path, AI_MODEL_QUANTIZATION), prefix=prefix)
+            engine.start()
+            with self._engine_lock:
+                previous, self.engine = self.engine, engine
+                closed = self._closed
+            if previous is not None:
+                # Упавший воркер
+                previous.close()
+            if closed:
+                # close() вызван во время загрузки
+                self.close()
+        except Exception as e:
+            logger.error(f"Error starting generation engine: {e}")
+        finally:
+            with self._engine_lock:
+                self._starting = None
+
+    def warm_up(self):
+        """Загрузить модель заранее"""
+        if AI_MODEL_ENABLED:
+            self.load_model()
+
+    def close(self):
+        """Остановить движок генерации"""
+        with self._engine_lock:
+            self._closed = True
+            engine, self.engine = self.engine, None
+        if engine is not None:
+            engine.close()
+
+    def generate_text(self, user_input: str, max_new_tokens: int, temperature: float,
+                      prompt: Optional[str] = None,
+                      on_partial: Optional[Callable[[str], None]] = None,
+                      cancel=None) -> Optional[str]:
+        """
+        Ответ языковой модели через движок генерации (None, если модель отключена или ошибка).
+        prompt - готовый промпт (PromptBuilder), иначе промпт только из вопроса;
+        on_partial получает накопленный текст во время генерации;
+        cancel (CancelToken) снимает запрос с генерации
+        """
+        if not AI_MODEL_ENABLED:
+            return None
+        # Пока модель загружается, запрос не ждет: ответ без модели (оператор)
+        if not self.load_model(wait=False):
+            logger.info("Generation engine is starting, answering without model")
+            return None
+        try:
+            response = self.engine.generate(
+                prompt or PromptManager.get_prompt(user_input), max_new_tokens, temperature,
+                timeout=GENERATION_TIMEOUT, on_partial=on_partial, cancel=cancel
+            )
+            return response or None
+        except CancelledError:
+            logger.info("Generation cancelled")
+            return None
+        except Exception as e:
+            logger.error(f"Error generating response: {e}")
+            return None
+
+    @property
+    def allowed_topics(self) -> Dict[str, List[str]]:
+        """Разрешенные темы и ключевые слова (из базы знаний)"""
+        return self.faq.kb.topic_keywords
+
+    def needs_generation(self, intent: Intent) -> bool:
+        """Ответ на вопрос дает модель: нет ответа FAQ и заготовки по теме, тема разрешена"""
+        if not AI_MODEL_ENABLED or intent.faq_response or not intent.allowed:
+            return False
+        topic_responses = self.faq.kb.topic_responses
+        return not any(topic in topic_responses for topic in intent.match.topics)
+
+    def is_allowed_question(self, text: str, intent: Optional[Intent] = None) -> bool:
+        """
+        Проверка, относится ли вопрос к разрешенным темам
+        """
+        intent = intent or self.intents.resolve(text)
+        return intent.allowed
 
     def generate_response(
         self,
         user_input: str,
         max_length: int = 1000,
-        temperature: float = 0.7
+        temperature: float = 0.7,
+        intent: Optional[Intent] = None,
+        prompt: Optional[str] = None,
+        on_partial: Optional[Callable[[str], None]] = None,
+        cancel=None
     ) -> str:
         """
-        Генерация ответа на вопрос пользователя
+        Генерация ответа на вопрос пользователя.
+        intent - результат классификации вопроса (если уже получен в ChatManager),
+        prompt - промпт с историей диалога для модели,
+        on_partial - получатель частичного ответа модели (потоковый вывод),
+        cancel - CancelToken отмены генерации
         """
+        intent = intent or self.intents.resolve(user_input)
+
         # Проверяем наличие ответа в FAQ
-        faq_response = self.faq.get_response(user_input)
-        if faq_response:
-            return faq_response
+        if intent.faq_response:
+            return intent.faq_response
             
         # Если нет в FAQ, используем заготовленные ответы по темам
-        user_input_lower = user_input.lower()
-        
-        # Словарь базовых ответов по темам
-        topic_responses = {
-            'доставка': (
-                "Мы можем организовать доставку вашего заказа. "
-                "Для этого перейдите в раздел «Заказы» в приложении, "
-                "выберите опцию «доставка до двери» и укажите адрес. "
-                "Стоимость доставки рассчитывается автоматически."
-            ),
-            'трекинг': (
-                "Чтобы отследить ваш заказ, используйте раздел «Заказы» "
-                "в мобильном приложении. Там вы увидите текущий статус "
-                "и местоположение вашей посылки."
-            ),
-            'адрес': (
-                "Наши склады работают по следующим адресам:\n"
-                "Для уточнения графика работы конкретного склада "
-            ),
-            'возврат': (
-                "Для оформления возврата:\n"
-                "1. Свяжитесь с продавцом через приложение\n"
-                "2. Опишите причину возврата\n"
-                "3. Следуйте инструкциям продавца\n\n"
-            )
-        }
-        
-        # Проверяем каждую тему
-        for topic, keywords in self.allowed_topics.items():
-            if any(keyword in user_input_lower for keyword in keywords):
-                if topic in topic_responses:
-                    return topic_responses[topic]
+        # Ответы по темам из базы знаний
+        topic_responses = self.faq.kb.topic_responses
+
+        # Проверяем найденные темы (в порядке объявления)
+        for topic in intent.match.topics:
+            if topic in topic_responses:
+                return topic_responses[topic]
         
         # Если не нашли конкретный ответ, но тема разрешена
-        if self.is_allowed_question(user_input):
+        if intent.allowed:
+            response = self.generate_text(
+                user_input, min(max_length, GENERATION_MAX_NEW_TOKENS), temperature, prompt, on_partial,
+                cancel
+            )
+            if response:
+                return response
             return (
                 "Я понимаю ваш вопрос, но для предоставления точной информации "
                 "мне нужно перевести вас на оператора. Он сможет помочь вам более детально."
@@ -1,4 +1,5 @@
-import easyocr
+import asyncio
+import threading
 from dataclasses import dataclass
 import re
 
@@ -10,8 +11,24 @@ class Address:
     full_address: str
 
 class AddressChecker:
-    def __init__(self):
-        self.reader = easyocr.Reader(['ch_sim', 'en'])
+    def __init__(self, languages=('ch_sim', 'en')):
+        self.languages = list(languages)
+        # easyocr и его модели загружаются при первом распознавании или прогреве
+        self._reader = None
+        self._reader_lock = threading.Lock()
+
+    @property
+    def reader(self):
+        if self._reader is None:
+            with self._reader_lock:
+                if self._reader is None:
+                    import easyocr
+                    self._reader = easyocr.Reader(self.languages)
+        return self._reader
+
+    def warm_up(self):
+        """Заранее загрузить модели easyocr"""
+        self.reader
     
     def extract_client_code(self, text: str) -> str:
         """Извлекает код клиента из текста"""
@@ -59,8 +76,8 @@ class AddressChecker:
             (is_valid, message)
         """
         try:
-            # Распознаем текст
-            result = self.reader.readtext(image_path)
+            # Распознаем текст в отдельном потоке, чтобы не блокировать event loop
+            result = await asyncio.to_thread(lambda: self.reader.readtext(image_path))
             detected_text = ' '.join([text[1] for text in result])
             
             # Проверяем адрес
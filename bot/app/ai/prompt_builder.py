@@ -0,0 +1,198 @@
+# ai/prompt_builder.py
+"""
+Сборка промпта модели в пределах бюджета токенов.
+
+Промпт: BASE_CONTEXT, справка из FAQ (ближайшая запись), история диалога
+и вопрос (формат - PromptManager.get_prompt). Преамбула и вопрос входят
+всегда (слишком длинный вопрос обрезается до бюджета, метка "Ответ:"
+в конце сохраняется), справка - если помещается, из истории берутся
+самые новые сообщения; не поместившиеся старые сообщения клиента
+сворачиваются в одну строку-сводку (или отбрасываются, если не помещается и она).
+
+Число токенов каждого сообщения считается один раз и хранится
+в Message.tokens, остальные тексты (преамбула, справки) - в LRU-кэше.
+"""
+import logging
+import math
+import re
+import threading
+from functools import lru_cache
+from typing import Callable, Optional, Sequence
+
+from app.config import (
+    AI_MODEL_ENABLED,
+    AI_MODEL_PATH,
+    PROMPT_TOKEN_BUDGET,
+    PROMPT_TOKEN_CACHE_SIZE,
+    PROMPT_TOKENIZER,
+)
+from app.ai.conversation import Message
+from app.knowledge_base.prompts import PromptManager
+
+logger = logging.getLogger(__name__)
+
+# Оценка без токенизатора: у LLaMA-токенизатора на русском тексте 2.5-3 символа на токен
+ESTIMATE_CHARS_PER_TOKEN = 2.5
+# Длина одного вопроса в сводке старых сообщений
+SUMMARY_ITEM_CHARS = 80
+SUMMARY_TITLE = "Ранее клиент спрашивал: "
+
+ROLE_LABELS = {'user': "Пользователь", 'assistant': "Ассистент"}
+
+_SENTENCE_END = re.compile(r'(?<=[.!?])\s')
+
+
+def format_turn(message: Message) -> str:
+    return f"{ROLE_LABELS.get(message.role, 'Ассистент')}: {message.content}"
+
+
+def _load_tokenizer(model_path: str):
+    from transformers import AutoTokenizer
+    return AutoTokenizer.from_pretrained(model_path)
+
+
+class TokenCounter:
+    """
+    Подсчет токенов: токенизатором модели (mode='model') или оценкой
+    по длине текста (mode='estimate'). 'auto' - токенизатор, если модель
+    включена. Токенизатор загружается при прогреве модели (load) или
+    в фоне при первом подсчете; до загрузки длины оцениваются, чтобы
+    подсчет не ждал загрузку в потоке обработки сообщения.
+    """
+
+    def __init__(self, mode: str = PROMPT_TOKENIZER, model_path: str = AI_MODEL_PATH,
+                 cache_size: int = PROMPT_TOKEN_CACHE_SIZE,
+                 loader: Callable[[str], object] = _load_tokenizer):
+        if mode == 'auto':
+            mode = 'model' if AI_MODEL_ENABLED else 'estimate'
+        self.mode = mode
+        self.model_path = model_path
+        self.loader = loader
+        self._tokenizer = None
+        self._lock = threading.Lock()
+        self._loading = None
+        self._loading_lock = threading.Lock()
+        # Повторяющиеся тексты (преамбула, справки, метки) - через кэш
+        self.count = lru_cache(maxsize=cache_size)(self.measure)
+
+    def load(self):
+        """Загрузить токенизатор модели (при ошибке - перейти на оценку)"""
+        if self.mode != 'model' or self._tokenizer is not None:
+            return
+        with self._lock:
+            if self.mode != 'model' or self._tokenizer is not None:
+                return
+            try:
+                self._tokenizer = self.loader(self.model_path)
+            except Exception as e:
+                logger.error(f"Error loading tokenizer {self.model_path}, estimating tokens: {e}")
+                self.mode = 'estimate'
+                return
+        # В кэше остались оценки, посчитанные до загрузки
+        self.count.cache_clear()
+        logger.info(f"Tokenizer {self.model_path} loaded")
+
+    @property
+    def tokenizer(self):
+        """Токенизатор, если он уже загружен (иначе загрузка запускается в фоне)"""
+        if self._tokenizer is None and self.mode == 'model' and self._loading is None:
+            with self._loading_lock:
+                if self._loading is None:
+                    self._loading = threading.Thread(target=self.load, name="tokenizer-load", daemon=True)
+                    self._loading.start()
+        return self._tokenizer
+
+    def measure(self, text: str) -> int:
+        """Число токенов текста без кэша"""
+        tokenizer = self.tokenizer
+        if tokenizer is not None:
+            return len(tokenizer(text, add_special_tokens=False)['input_ids'])
+        return math.ceil(len(text) / ESTIMATE_CHARS_PER_TOKEN)
+
+    def truncate(self, text: str, tokens: int) -> str:
+        """Начало текста не длиннее tokens токенов"""
+        tokenizer = self.tokenizer
+        if tokenizer is not None:
+            ids = tokenizer(text, add_special_tokens=False)['input_ids']
+            return tokenizer.decode(ids[:max(0, tokens)], skip_special_tokens=True) if len(ids) > tokens else text
+        return text[:max(0, int(tokens * ESTIMATE_CHARS_PER_TOKEN))]
+
+
+class PromptBuilder:
+    """Промпт из преамбулы, справки FAQ, истории и вопроса не длиннее budget токенов"""
+
+    def __init__(self, counter: Optional[TokenCounter] = None, budget: int = PROMPT_TOKEN_BUDGET):
+        self.counter = counter or TokenCounter()
+        self.budget = budget
+
+    def message_tokens(self, message: Message) -> int:
+        """Токены сообщения в истории (считаются один раз на сообщение)"""
+        if message.tokens is None:
+            message.tokens = self.counter.measure(message.content)
+        # Метка роли и перевод строки
+        return message.tokens + self.counter.count(f"{ROLE_LABELS.get(message.role, 'Ассистент')}: ") + 1
+
+    def _summary(self, dropped: Sequence[Message], available: int) -> Optional[str]:
+        """Сводка вытесненных вопросов клиента (новые первыми), не длиннее available токенов"""
+        items = []
+        for message in reversed(dropped):
+            if message.role != 'user':
+                continue
+            item = _SENTENCE_END.split(message.content.strip(), 1)[0]
+            if len(item) > SUMMARY_ITEM_CHARS:
+                item = item[:SUMMARY_ITEM_CHARS].rstrip() + "…"
+            candidate = SUMMARY_TITLE + "; ".join(reversed(items + [item]))
+            if self.counter.measure(candidate) + 1 > available:
+                break
+            items.append(item)
+        return SUMMARY_TITLE + "; ".join(reversed(items)) if items else None
+
+    def fit_history(self, history: Sequence[Message], available: int) -> str:
+        """Текст истории: новые сообщения, пока помещаются, старые - сводкой"""
+        kept = []
+        used = 0
+        for message in reversed(history):
+            cost = self.message_tokens(message)
+            if used + cost > available:
+                break
+            kept.append(message)
+            used += cost
+        dropped = history[:len(history) - len(kept)]
+        lines = [format_turn(message) for message in reversed(kept)]
+        if dropped:
+            summary = self._summary(dropped, available - used)
+            if summary:
+                lines.insert(0, summary)
+        return "\n".join(lines)
+
+    def build(self, question: str, history: Sequence[Message] = (),
+              reference: Optional[str] = None) -> str:
+        """
+        Промпт для вопроса. history - сообщения до вопроса (старые первыми),
+        reference - текст справки из базы знаний.
+        """
+        count = self.counter.count
+        # Преамбула с разметкой вопроса ("Вопрос: ... Ответ:") и сам вопрос
+        available = self.budget - count(PromptManager.get_prompt(""))
+        question_tokens = count(question)
+        if question_tokens > available:
+            # Иначе промпт обрезал бы движок, и метка "Ответ:" потерялась бы
+            logger.warning(f"Question of {question_tokens} tokens truncated to {available}")
+            # Недорезанный многобайтный символ декодируется как U+FFFD
+            question = self.counter.truncate(question, available).rstrip().rstrip('\ufffd')
+            question_tokens = count(question)
+        available -= question_tokens
+
+        if reference:
+            cost = count(reference) + 8
+            if cost <= available:
+                available -= cost
+            else:
+                reference = None
+
+        history_text = self.fit_history(history, available - 4) if history and available > 4 else ""
+        return PromptManager.get_prompt(question, history=history_text, reference=reference or "")
+
+    def prompt_tokens(self, prompt: str) -> int:
+        """Длина готового промпта (без кэша: промпты не повторяются)"""
+        return self.counter.measure(prompt)
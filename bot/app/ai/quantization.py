@@ -0,0 +1,97 @@
+# ai/quantization.py
+"""
+Int8-квантование модели для генерации на CPU.
+
+Веса всех nn.Linear квантуются динамически (torch.ao.quantization.quantize_dynamic):
+хранятся в int8, активации квантуются на лету. Квантованная модель
+сохраняется на диск целиком, и при следующем запуске загружается из кэша
+без чтения fp32-весов и повторного квантования. Имя файла кэша включает
+версии torch и transformers: сохраненный модуль зависит от них.
+
+Функции вызываются в процессе-воркере движка генерации (см. engine.py).
+"""
+import copyreg
+import hashlib
+import logging
+import os
+import re
+import time
+
+from app.config import AI_MODEL_QUANTIZED_CACHE_DIR
+
+logger = logging.getLogger(__name__)
+
+
+def _qscheme(name: str):
+    import torch
+    return getattr(torch, name)
+
+
+def _reduce_qscheme(qscheme):
+    # У torch.qscheme нет __module__: pickle ищет его перебором sys.modules,
+    # а ленивые модули transformers при этом импортируют необязательные
+    # зависимости (torchvision) и падают. Сохраняем по имени через _qscheme
+    return _qscheme, (str(qscheme).rsplit('.', 1)[-1],)
+
+
+def quantize_int8(model):
+    """Динамическое int8-квантование линейных слоев (только CPU)"""
+    import torch
+    return torch.ao.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+
+
+def cache_path(model_path: str, cache_dir: str = AI_MODEL_QUANTIZED_CACHE_DIR) -> str:
+    """Файл кэша квантованной модели для model_path и текущих версий библиотек"""
+    import torch
+    import transformers
+
+    # Для локального каталога учитываем время изменения весов (и во вложенных каталогах)
+    source = os.path.abspath(model_path) if os.path.isdir(model_path) else model_path
+    if os.path.isdir(source):
+        mtimes = [
+            os.stat(os.path.join(root, f)).st_mtime
+            for root, _, files in os.walk(source) for f in files
+        ]
+        if mtimes:
+            source += f":{max(mtimes)}"
+    digest = hashlib.sha1(source.encode()).hexdigest()[:12]
+    name = re.sub(r'[^A-Za-z0-9_.-]+', '_', os.path.basename(model_path.rstrip('/')))
+    return os.path.join(
+        cache_dir, f"{name}-{digest}-int8-torch{torch.__version__}-tf{transformers.__version__}.pt"
+    )
+
+
+def load_quantized(model_path: str, cache_dir: str = AI_MODEL_QUANTIZED_CACHE_DIR):
+    """
+    Квантованная модель из кэша; если кэша нет - загрузить fp32,
+    квантовать и сохранить в кэш (атомарно, через временный файл).
+    """
+    import torch
+    from transformers import AutoModelForCausalLM
+
+    path = cache_path(model_path, cache_dir)
+    if os.path.exists(path):
+        started = time.monotonic()
+        try:
+            # Сохранен модуль целиком (упакованные int8-веса), нужен полный unpickle
+            model = torch.load(path, weights_only=False)
+            logger.info(f"Loaded quantized model from {path} in {time.monotonic() - started:.1f}s")
+            return model
+        except Exception as e:
+            logger.error(f"Error loading quantized model cache {path}, re-quantizing: {e}")
+
+    started = time.monotonic()
+    model = AutoModelForCausalLM.from_pretrained(model_path)
+    model = quantize_int8(model.eval())
+    logger.info(f"Quantized {model_path} to int8 in {time.monotonic() - started:.1f}s")
+
+    try:
+        os.makedirs(cache_dir, exist_ok=True)
+        copyreg.pickle(torch.qscheme, _reduce_qscheme)
+        tmp_path = f"{path}.tmp{os.getpid()}"
+        torch.save(model, tmp_path)
+        os.replace(tmp_path, path)
+        logger.info(f"Saved quantized model to {path}")
+    except Exception as e:
+        logger.error(f"Error saving quantized model cache {path}: {e}")
+    return model
@@ -0,0 +1,53 @@
+# ai/response_cache.py
+import logging
+from typing import Optional, Tuple
+
+from app.config import RESPONSE_CACHE_SIZE, RESPONSE_CACHE_TTL
+from app.database.cache import TTLCache, MISSING
+from app.knowledge_base.intent import normalize_query
+
+logger = logging.getLogger(__name__)
+
+
+class ResponseCache:
+    """
+    Кэш ответов ChatManager, не зависящих от контекста диалога: ответы FAQ
+    и заготовки по темам. Ответы модели зависят от истории и не кэшируются.
+    Ключ - normalize_query(сообщение), по нему же классифицируется сообщение;
+    при смене версии базы знаний кэш сбрасывается.
+    """
+
+    def __init__(self, faq, maxsize: int = RESPONSE_CACHE_SIZE, ttl: float = RESPONSE_CACHE_TTL):
+        self.faq = faq
+        self.cache = TTLCache(maxsize, ttl)
+        self.version = faq.version
+
+    def _check_version(self):
+        if self.faq.version != self.version:
+            logger.info(f"Knowledge base changed to version {self.faq.version}, clearing response cache")
+            self.cache.clear()
+            self.version = self.faq.version
+
+    def get(self, message: str) -> Optional[Tuple[str, bool]]:
+        """(response, needs_operator) из кэша или None"""
+        self._check_version()
+        value = self.cache.get(normalize_query(message))
+        return None if value is MISSING else value
+
+    def set(self, message: str, response: str, needs_operator: bool):
+        self._check_version()
+        self.cache.set(normalize_query(message), (response, needs_operator))
+
+    def clear(self):
+        self.cache.clear()
+
+    def stats(self) -> dict:
+        """Счётчики попаданий и промахов"""
+        total = self.cache.hits + self.cache.misses
+        return {
+            'hits': self.cache.hits,
+            'misses': self.cache.misses,
+            'hit_rate': round(self.cache.hits / total, 3) if total else 0.0,
+            'size': len(self.cache),
+            'kb_version': self.version,
+        }
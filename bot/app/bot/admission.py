@@ -0,0 +1,205 @@
+# bot/admission.py
+"""
+Контроль допуска запросов к хендлерам.
+
+Политика задаётся в config.py (ADMISSION_POLICY / ADMISSION_QUEUES):
+каждый хендлер списывает со счёта пользователя свою стоимость, тяжёлые
+хендлеры (OCR, генерация) дополнительно проходят через очередь с
+ограниченной параллельностью. Когда очередь слишком длинная, запрос
+отклоняется вежливым ответом, а не ждёт, перегружая процессор.
+"""
+import asyncio
+import logging
+from functools import wraps
+from typing import Optional
+
+from telegram import Update
+from telegram.ext import ContextTypes
+
+from app.database.state import get_state_backend
+from app.config import (
+    ADMISSION_POLICY,
+    ADMISSION_QUEUES,
+    ADMISSION_USER_BUDGET,
+    ADMISSION_USER_PERIOD,
+    ADMISSION_USER_CONCURRENCY,
+)
+
+logger = logging.getLogger(__name__)
+
+BUDGET_EXCEEDED_MESSAGE = "Пожалуйста, подождите немного перед следующим запросом."
+BUSY_MESSAGE = "⏳ Предыдущий запрос ещё обрабатывается. Пожалуйста, дождитесь ответа."
+OVERLOADED_MESSAGE = (
+    "⏳ Сейчас бот обрабатывает много запросов. "
+    "Пожалуйста, повторите попытку через минуту."
+)
+
+
+class WorkQueue:
+    """Очередь тяжёлых запросов: не больше concurrency одновременно и max_waiting ожидающих"""
+
+    def __init__(self, name: str, concurrency: int, max_waiting: int):
+        self.name = name
+        self.concurrency = concurrency
+        self.max_waiting = max_waiting
+        self.active = 0
+        self.waiting = 0
+        self.shed = 0
+        self._semaphore = asyncio.Semaphore(concurrency)
+
+    def is_full(self) -> bool:
+        # Зарезервированные места (waiting) еще могут не войти в семафор
+        return self.active + self.waiting >= self.concurrency + self.max_waiting
+
+    def reserve(self) -> bool:
+        """Занять место ожидающего (без await); False - очередь заполнена"""
+        if self.is_full():
+            return False
+        self.waiting += 1
+        return True
+
+    def cancel(self):
+        """Освободить место, занятое reserve(), не входя в очередь"""
+        self.waiting -= 1
+
+    async def acquire(self):
+        """Дождаться выполнения запроса, занявшего место через reserve()"""
+        try:
+            await self._semaphore.acquire()
+        finally:
+            self.waiting -= 1
+        self.active += 1
+
+    def release(self):
+        self.active -= 1
+        self._semaphore.release()
+
+
+class AdmissionController:
+    """
+    Допуск запросов по политике:
+    - бюджет стоимости на пользователя (скользящее окно в бэкенде состояния);
+    - число одновременных тяжёлых запросов пользователя;
+    - глубина очередей OCR / генерации (сброс нагрузки).
+
+    Места пользователя и в очереди занимаются до первого await
+    (проверка и резервирование атомарны для event loop) и освобождаются,
+    если бюджет исчерпан.
+    """
+
+    def __init__(self, policy: dict = ADMISSION_POLICY, queues: dict = ADMISSION_QUEUES,
+                 user_budget: int = ADMISSION_USER_BUDGET,
+                 user_period: float = ADMISSION_USER_PERIOD,
+                 user_concurrency: int = ADMISSION_USER_CONCURRENCY):
+        self.policy = policy
+        self.user_budget = user_budget
+        self.user_period = user_period
+        self.user_concurrency = user_concurrency
+        self.queues = {
+            name: WorkQueue(name, **settings) for name, settings in queues.items()
+        }
+        self._in_flight = {}
+
+    def _queue(self, handler: str) -> Optional[WorkQueue]:
+        name = self.policy.get(handler, {}).get('queue')
+        return self.queues.get(name) if name else None
+
+    def _release_user(self, user_id: int):
+        remaining = self._in_flight[user_id] - 1
+        if remaining:
+            self._in_flight[user_id] = remaining
+        else:
+            del self._in_flight[user_id]
+
+    async def check(self, handler: str, user_id: int) -> Optional[str]:
+        """
+        Проверить допуск; Returns: текст отказа или None, если запрос допущен.
+        Допущенный запрос хендлера с очередью занимает места, поэтому
+        его нужно выполнить через run() (или освободить через cancel()).
+        """
+        rule = self.policy.get(handler)
+        if not rule:
+            return None
+        queue = self._queue(handler)
+        if queue is not None:
+            if self._in_flight.get(user_id, 0) >= self.user_concurrency:
+                return BUSY_MESSAGE
+            if not queue.reserve():
+                queue.shed += 1
+                logger.warning(
+                    f"Shedding {handler} for user {user_id}: "
+                    f"{queue.name} queue has {queue.waiting} waiting"
+                )
+                return OVERLOADED_MESSAGE
+            self._in_flight[user_id] = self._in_flight.get(user_id, 0) + 1
+        cost = rule.get('cost', 1)
+        if cost:
+            try:
+                allowed = await get_state_backend().rate_limits().hit(
+                    f"admission:{user_id}", self.user_budget, self.user_period, cost=cost
+                )
+            except Exception as e:
+                # Недоступность хранилища не должна блокировать пользователей
+                logger.error(f"Admission budget storage error: {e}")
+                allowed = True
+            if not allowed:
+                self.cancel(handler, user_id)
+                return BUDGET_EXCEEDED_MESSAGE
+        return None
+
+    def cancel(self, handler: str, user_id: int):
+        """Освободить места допущенного запроса, который не будет выполнен"""
+        queue = self._queue(handler)
+        if queue is not None:
+            queue.cancel()
+            self._release_user(user_id)
+
+    async def run(self, handler: str, user_id: int, coro_func):
+        """Выполнить допущенный запрос (через очередь, если она задана политикой)"""
+        queue = self._queue(handler)
+        if queue is None:
+            return await coro_func()
+        try:
+            await queue.acquire()
+            try:
+                return await coro_func()
+            finally:
+                queue.release()
+        finally:
+            self._release_user(user_id)
+
+
+admission_controller = AdmissionController()
+
+
+async def admit(handler: str, update: Update, coro_func):
+    """
+    Выполнить await coro_func() с допуском по политике handler.
+    При отказе пользователь получает его текст.
+    Returns: результат coro_func или False, если запрос отклонен
+    """
+    user = update.effective_user
+    if user is None:
+        return await coro_func()
+
+    reason = await admission_controller.check(handler, user.id)
+    if reason:
+        if update.message:
+            await update.message.reply_text(reason)
+        elif update.callback_query:
+            await update.callback_query.answer(reason)
+        return False
+
+    return await admission_controller.run(handler, user.id, coro_func)
+
+
+def admission(func):
+    """
+    Декоратор допуска для методов BotHandlers.
+    Стоимость и очередь хендлера берутся из ADMISSION_POLICY по имени метода.
+    """
+    @wraps(func)
+    async def wrapper(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        return await admit(func.__name__, update, lambda: func(self, update, context))
+
+    return wrapper
@@ -1,35 +1,39 @@
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
 from telegram.ext import ContextTypes, filters, CommandHandler, MessageHandler, CallbackQueryHandler
-from app.knowledge_base.faq import FAQ
-from app.database.operations import DatabaseManager
+from app.knowledge_base.faq import get_faq
+from app.database.operations import AsyncDatabaseManager
 from app.bot.keyboards import Keyboards
 from app.bot.middlewares import log_handler, rate_limit
+from app.bot.admission import admission, admit
+from app.bot.streaming import ResponseStreamer
 from app.ai.ocr import AddressChecker
 import logging
 from pathlib import Path
 from app.ai.chat import ChatManager
+from app.database.state import get_state_backend
 import config
 
 logger = logging.getLogger(__name__)
 
 class BotHandlers:
-    def __init__(self, chat_manager: ChatManager, db_manager: DatabaseManager):
+    def __init__(self, chat_manager: ChatManager, db_manager: AsyncDatabaseManager):
         """Инициализация компонентов бота"""
         self.chat_manager = chat_manager
         self.db_manager = db_manager
-        self.faq = FAQ()
+        self.faq = get_faq()
         self.keyboards = Keyboards()
         self.address_checker = AddressChecker()
-        self.code_context = {}  # Для хранения контекста ввода кода
+        self.code_context = get_state_backend().flags('code_context')  # Для хранения контекста ввода кода
 
     @log_handler
+    @admission
     async def start_handler(self, update: Update, context: ContextTypes.DEFAULT_TYPE) -> bool:
         """
         Хендлер на команду /start. Приветствует пользователя
         и показывает главное меню.
         """
         user = update.effective_user
-        is_subscribed = self.db_manager.check_subscription(user.id)
+        is_subscribed = await self.db_manager.check_subscription(user.id)
         
         welcome_text = (
             "👋 Здравствуйте! Я помощник Silkway cargo.\n\n"
@@ -48,6 +52,7 @@ class BotHandlers:
         return True
 
     @log_handler
+    @admission
     async def callback_query_handler(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Обработчик callback запросов от inline кнопок"""
         query = update.callback_query
@@ -56,7 +61,7 @@ class BotHandlers:
         if query.data == 'subscribe':
             user = update.effective_user
             # Проверяем, подписан ли уже пользователь
-            if self.db_manager.check_subscription(user.id):
+            if await self.db_manager.check_subscription(user.id):
                 await query.message.edit_text(
                     "✅ Вы уже подписаны на рассылку!\n\n"
                     "Чтобы вернуться в главное меню, нажмите /start",
@@ -65,7 +70,7 @@ class BotHandlers:
                 return True
                 
             # Если не подписан - подписываем
-            if self.db_manager.add_subscriber(user.id, user.username):
+            if await self.db_manager.add_subscriber(user.id, user.username):
                 await query.message.edit_text(
                     "✅ Вы успешно подписались на рассылку!\n\n"
                     "Теперь вы будете получать важные уведомления:\n"
@@ -85,7 +90,7 @@ class BotHandlers:
         
         elif query.data == 'unsubscribe':
             user = update.effective_user
-            if self.db_manager.unsubscribe(user.id):
+            if await self.db_manager.unsubscribe(user.id):
                 await query.message.edit_text(
                     "✅ Вы успешно отписались от рассылки.\n\n"
                     "Вы больше не будете получать уведомления.\n"
@@ -100,51 +105,8 @@ class BotHandlers:
                 )
             return True
         
-        responses = {
-            'track': (
-                "📦 Чтобы отследить заказ:\n\n"
-                "1. Откройте мобильное приложение\n"
-                "2. Перейдите в раздел «Заказы»\n"
-                "3. Выберите «Прибыл в пункт выдачи»"
-            ),
-            'delivery': (
-                "🚚 Для оформления доставки до двери:\n\n"
-                "1. Перейдите в раздел «Заказы»\n"
-                "2. Выберите «Прибыл в пункт выдачи»\n"
-                "3. Поставьте галочку «доставка до двери»\n"
-                "4. Заполните адрес и оплатите"
-            ),
-            'check_address': (
-                "✅ Для проверки адреса склада мне понадобится:\n\n"
-                "1️⃣ Ваш код клиента (6 цифр)\n"
-                "2️⃣ Скриншот страницы с адресом\n\n"
-                "Сначала отправьте код командой: `/code ваш_код`\n"
-                "Например: `/code 929848`\n\n"
-                "После этого отправьте скриншот, и я проверю правильность адреса."
-            ),
-            'refund': (
-                "↩️ Варианты возврата:\n\n"
-                "1. При браке товара\n"
-                "2. При несоответствии описанию\n"
-                "3. При неверном размере/цвете\n"
-                "4. При недостаче\n\n"
-            ),
-            'faq': (
-                "❓ Частые вопросы:\n\n"
-                "1. Как отследить заказ?\n"
-                "2. Как заказать доставку?\n"
-                "3. График работы склада\n"
-                "4. Как сделать возврат?\n\n"
-                "Выберите интересующий вас вопрос или напишите его в чат"
-            ),
-            'start_check': (
-                "Отправьте, пожалуйста, ваш код клиента командой `/code ваш_код`\n"
-                "Например: `/code 929848`"
-            ),
-            'main_menu': (
-                "Выберите интересующий вас вопрос:"
-            )
-        }
+        # Ответы на кнопки меню из базы знаний
+        responses = self.faq.kb.callback_responses
         
         response = responses.get(query.data)
         if response:
@@ -155,7 +117,10 @@ class BotHandlers:
                     [InlineKeyboardButton("« Главное меню", callback_data='main_menu')]
                 ])
             elif query.data == 'main_menu':
-                keyboard = self.keyboards.main_menu()
+                # Статус подписки берется из кэша, без запроса к БД
+                keyboard = self.keyboards.main_menu(
+                    await self.db_manager.check_subscription(update.effective_user.id)
+                )
             elif query.data == 'check_address':
                 keyboard = InlineKeyboardMarkup([[
                     InlineKeyboardButton("✅ Да, проверить адрес", callback_data='start_check')
@@ -186,7 +151,7 @@ class BotHandlers:
                 )
 
         # Сохраняем взаимодействие
-        self.db_manager.save_interaction(
+        await self.db_manager.save_interaction(
             user_id=update.effective_user.id,
             message=f"[CALLBACK] {query.data}",
             response=response or faq_response or "Раздел недоступен",
@@ -211,7 +176,7 @@ class BotHandlers:
         else:
             # Если это не команда, проверяем контекст и само сообщение
             code = message.strip() if message.strip().isdigit() else None
-            if not self.code_context.get(user_id):
+            if not await self.code_context.get(user_id):
                 # Если нет контекста ввода кода, игнорируем
                 return False
 
@@ -222,7 +187,7 @@ class BotHandlers:
                 parse_mode='Markdown'
             )
             # Устанавливаем контекст ожидания кода
-            self.code_context[user_id] = True
+            await self.code_context.set(user_id)
             return True
 
         if not code.isdigit() or len(code) != 6:
@@ -236,7 +201,7 @@ class BotHandlers:
         # Сохраняем код
         context.user_data['client_code'] = code
         # Очищаем контекст ожидания кода
-        self.code_context.pop(user_id, None)
+        await self.code_context.pop(user_id)
         
         await update.message.reply_text(
             f"✅ Отлично! Ваш код {code} сохранен.\n\n"
@@ -263,21 +228,26 @@ class BotHandlers:
                 parse_mode='Markdown'
             )
             # Устанавливаем контекст ожидания кода
-            self.code_context[update.effective_user.id] = True
+            await self.code_context.set(update.effective_user.id)
             return True
         
-        await update.message.reply_text("🔍 Проверяю адрес, пожалуйста, подождите...")
-        
         photo = update.message.photo[-1]
-        photo_file = await photo.get_file()
-        
         temp_dir = Path("temp")
         temp_dir.mkdir(exist_ok=True)
         photo_path = temp_dir / f"{photo.file_id}.jpg"
-        
-        try:
+
+        async def check():
+            await update.message.reply_text("🔍 Проверяю адрес, пожалуйста, подождите...")
+            photo_file = await photo.get_file()
             await photo_file.download_to_drive(photo_path)
-            is_valid, message = await self.address_checker.check_image(str(photo_path), client_code)
+            return await self.address_checker.check_image(str(photo_path), client_code)
+
+        try:
+            # Допуск (бюджет и очередь OCR) - только для фото, которое будет распознаваться
+            result = await admit('handle_photo', update, check)
+            if result is False:
+                return False
+            is_valid, message = result
             
             if is_valid:
                 await update.message.reply_text(
@@ -291,7 +261,7 @@ class BotHandlers:
                 )
 
             # Логируем взаимодействие
-            self.db_manager.save_interaction(
+            await self.db_manager.save_interaction(
                 user_id=update.effective_user.id,
                 message="[PHOTO]",
                 response=message,
@@ -323,20 +293,43 @@ class BotHandlers:
         message = update.message.text
 
         # Если активен контекст ввода кода и сообщение похоже на код
-        if self.code_context.get(user_id) and message.strip().isdigit():
+        if message.strip().isdigit() and await self.code_context.get(user_id):
             return await self.code_handler(update, context)
         
         # Обновляем время последней активности
-        self.db_manager.update_last_activity(user_id)
+        await self.db_manager.update_last_activity(user_id)
         
+        # Ответ модели показывается по мере генерации (заглушка появляется с первым текстом)
+        streamer = ResponseStreamer(update.message) if config.STREAM_RESPONSES else None
         try:
             # Обрабатываем сообщение через чат-менеджер
-            response, needs_operator = self.chat_manager.process_message(user_id, message)
+            # Обработка идет в пуле потоков ChatManager с ограничением по времени
+            # Классификация - один раз на сообщение и вне event loop
+            intent, needs_generation = await self.chat_manager.aclassify(message)
+
+            def answer():
+                return self.chat_manager.aprocess_message(
+                    user_id, message, on_partial=streamer.on_partial if streamer else None,
+                    intent=intent
+                )
+
+            # Допуск (бюджет и очередь генерации) - только для ответов модели:
+            # FAQ, кэш и заготовки по темам не списываются
+            if needs_generation:
+                result = await admit('message_handler', update, answer)
+                if result is False:
+                    return False
+            else:
+                result = await answer()
+            response, needs_operator = result
             
             if needs_operator:
+                # Показанная часть ответа остается, следом - перевод на оператора
+                if streamer:
+                    await streamer.keep()
                 try:
                     # Создаем сессию с оператором
-                    self.db_manager.create_operator_session(user_id, message)
+                    await self.db_manager.create_operator_session(user_id, message)
                     
                     # Отправляем сообщение пользователю
                     await update.message.reply_text(
@@ -346,7 +339,7 @@ class BotHandlers:
                     )
                     
                     # Сохраняем взаимодействие
-                    self.db_manager.save_interaction(
+                    await self.db_manager.save_interaction(
                         user_id=user_id,
                         message=message,
                         response="[REDIRECTED TO OPERATOR]",
@@ -367,13 +360,17 @@ class BotHandlers:
                     else None
                 )
                 
-                await update.message.reply_text(
-                    response,
-                    reply_markup=reply_markup
-                )
+                # Заменяем заглушку итоговым ответом, если она была отправлена
+                if streamer is None or not await streamer.finish(response, reply_markup):
+                    if streamer:
+                        await streamer.discard()
+                    await update.message.reply_text(
+                        response,
+                        reply_markup=reply_markup
+                    )
                 
                 # Сохраняем успешное взаимодействие
-                self.db_manager.save_interaction(
+                await self.db_manager.save_interaction(
                     user_id=user_id,
                     message=message,
                     response=response,
@@ -383,6 +380,8 @@ class BotHandlers:
                 
         except Exception as e:
             logger.error(f"Error in message_handler: {e}")
+            if streamer:
+                await streamer.discard()
             await update.message.reply_text(
                 "❌ Извините, произошла ошибка. Пожалуйста, попробуйте позже или обратитесь к оператору.",
                 reply_markup=self.keyboards.operator_redirect()
@@ -413,7 +412,7 @@ class BotHandlers:
     async def start_cmd(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Обработка команды /start"""
         user = update.effective_user
-        is_subscribed = self.db_manager.check_subscription(user.id)
+        is_subscribed = await self.db_manager.check_subscription(user.id)
         
         await update.message.reply_text(
             "👋 Добро пожаловать в бот!\n\n"
@@ -4,7 +4,8 @@ from functools import wraps
 from datetime import datetime
 from telegram import Update
 from telegram.ext import ContextTypes
-from database.operations import save_interaction
+from app.database.operations import asave_interaction
+from app.database.state import get_state_backend
 
 logger = logging.getLogger(__name__)
 
@@ -37,7 +38,7 @@ def log_handler(func):
 
             # Логируем успешное взаимодействие
             if update.message and not update.message.photo:
-                save_interaction(
+                await asave_interaction(
                     user_id=user.id,
                     message=msg_text,
                     response=str(response) if response else None,
@@ -45,7 +46,7 @@ def log_handler(func):
                     success=True
                 )
             elif update.callback_query:
-                save_interaction(
+                await asave_interaction(
                     user_id=user.id,
                     message=msg_text,
                     response=str(response) if response else None,
@@ -53,7 +54,7 @@ def log_handler(func):
                     success=True
                 )
             elif update.message and update.message.photo:
-                save_interaction(
+                await asave_interaction(
                     user_id=user.id,
                     message="[PHOTO]",
                     response=str(response) if response else None,
@@ -67,7 +68,7 @@ def log_handler(func):
             # Логируем ошибку
             logger.error(f"Error in {func.__name__}: {str(e)}")
             
-            save_interaction(
+            await asave_interaction(
                 user_id=user.id,
                 message=msg_text or "[ERROR]",
                 response=str(e),
@@ -106,21 +107,19 @@ def rate_limit(limit: int = 1, period: int = 60):
         period: период в секундах
     """
     def decorator(func):
-        CACHE = {}
-
         @wraps(func)
         async def wrapper(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
             user_id = update.effective_user.id
-            current_time = datetime.now()
-
-            # Очищаем старые запросы
-            user_requests = CACHE.get(user_id, [])
-            user_requests = [
-                req for req in user_requests
-                if (current_time - req).total_seconds() <= period
-            ]
+            # Окна запросов хранятся в бэкенде состояния (общем для воркеров при Redis)
+            key = f"{func.__name__}:{user_id}"
+            try:
+                allowed = await get_state_backend().rate_limits().hit(key, limit, period)
+            except Exception as e:
+                # Недоступность хранилища не должна блокировать пользователей
+                logger.error(f"Rate limit storage error: {e}")
+                allowed = True
 
-            if len(user_requests) >= limit:
+            if not allowed:
                 msg = "Пожалуйста, подождите немного перед следующим запросом."
                 if update.message:
                     await update.message.reply_text(msg)
@@ -128,9 +127,6 @@ def rate_limit(limit: int = 1, period: int = 60):
                     await update.callback_query.answer(msg)
                 return False
 
-            user_requests.append(current_time)
-            CACHE[user_id] = user_requests
-
             return await func(self, update, context)
 
         return wrapper
@@ -0,0 +1,159 @@
+# bot/streaming.py
+"""
+Потоковый вывод ответа модели в Telegram.
+
+Пока модель генерирует ответ, пользователь видит сообщение-заглушку,
+которое правится накопленным текстом не чаще STREAM_EDIT_INTERVAL
+(Telegram ограничивает частоту правок в чате), а в конце заменяется
+итоговым ответом. Для мгновенных ответов (FAQ, кэш) заглушка не
+отправляется вовсе: она появляется с первым частичным текстом.
+"""
+import asyncio
+import logging
+import time
+from typing import Optional
+
+from telegram import Message
+from telegram.error import BadRequest, RetryAfter
+
+from app.config import STREAM_EDIT_INTERVAL, STREAM_PLACEHOLDER
+
+logger = logging.getLogger(__name__)
+
+# Признак, что ответ еще дописывается
+CURSOR = " ▌"
+# Максимальная длина текста сообщения Telegram
+MAX_MESSAGE_LENGTH = 4096
+
+
+def _retry_delay(error: RetryAfter) -> float:
+    retry_after = error.retry_after
+    return retry_after.total_seconds() if hasattr(retry_after, 'total_seconds') else float(retry_after)
+
+
+class ResponseStreamer:
+    """
+    Заглушка с постепенно дописываемым ответом на сообщение пользователя.
+    on_partial можно вызывать из любого потока; finish/keep/discard - из event loop.
+    """
+
+    def __init__(self, message: Message, interval: float = STREAM_EDIT_INTERVAL,
+                 placeholder: str = STREAM_PLACEHOLDER):
+        self.message = message
+        self.interval = interval
+        self.placeholder = placeholder
+        self.loop = asyncio.get_running_loop()
+        self.reply: Optional[Message] = None
+        self.edits = 0
+        self._text = None
+        self._shown = None
+        self._last_edit = 0.0
+        self._changed = asyncio.Event()
+        self._task = None
+        self._closed = False
+
+    def on_partial(self, text: str):
+        """Новый частичный текст ответа (вызывается из потока генерации)"""
+        try:
+            self.loop.call_soon_threadsafe(self._update, text)
+        except RuntimeError:
+            # Event loop уже остановлен
+            pass
+
+    def _update(self, text: str):
+        if self._closed:
+            return
+        self._text = text
+        self._changed.set()
+        if self._task is None:
+            self._task = self.loop.create_task(self._run())
+
+    async def _edit(self, text: str, **kwargs) -> bool:
+        """Изменить текст заглушки; при RetryAfter ждем и повторяем один раз"""
+        text = text[:MAX_MESSAGE_LENGTH]
+        for attempt in range(2):
+            try:
+                await self.reply.edit_text(text, **kwargs)
+                self._shown = text
+                self.edits += 1
+                return True
+            except RetryAfter as e:
+                if attempt:
+                    raise
+                await asyncio.sleep(_retry_delay(e))
+            except BadRequest as e:
+                # Текст не изменился - правка не нужна
+                if "not modified" in str(e).lower():
+                    return True
+                raise
+            finally:
+                self._last_edit = time.monotonic()
+        return False
+
+    async def _run(self):
+        """Отправить заглушку и править ее не чаще interval, пока ответ не готов"""
+        try:
+            self.reply = await self.message.reply_text(self.placeholder)
+            self._last_edit = time.monotonic()
+            while not self._closed:
+                await asyncio.sleep(max(0.0, self._last_edit + self.interval - time.monotonic()))
+                await self._changed.wait()
+                self._changed.clear()
+                if self._closed:
+                    break
+                text = self._text + CURSOR
+                if text != self._shown:
+                    await self._edit(text)
+        except asyncio.CancelledError:
+            pass
+        except Exception as e:
+            logger.error(f"Error streaming response: {e}")
+
+    async def _stop(self):
+        """Прекратить промежуточные правки; заглушка остается"""
+        self._closed = True
+        if self._task is None:
+            return
+        if self.reply is None:
+            # Заглушка еще отправляется - дожидаемся ее
+            self._changed.set()
+            await self._task
+        else:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+
+    async def finish(self, text: str, reply_markup=None) -> bool:
+        """
+        Заменить заглушку итоговым ответом (соблюдая интервал правок).
+        Returns: False, если заглушка не отправлялась - ответ нужно отправить обычным сообщением
+        """
+        await self._stop()
+        if self.reply is None:
+            return False
+        try:
+            await asyncio.sleep(max(0.0, self._last_edit + self.interval - time.monotonic()))
+            return await self._edit(text, reply_markup=reply_markup)
+        except Exception as e:
+            logger.error(f"Error finishing streamed response: {e}")
+            return False
+
+    async def discard(self):
+        """Удалить заглушку (ответ будет отправлен иначе, например, переводом на оператора)"""
+        await self._stop()
+        if self.reply is None:
+            return
+        try:
+            await self.reply.delete()
+        except Exception as e:
+            logger.error(f"Error deleting streamed response: {e}")
+
+    async def keep(self):
+        """
+        Оставить уже показанный частичный ответ (без курсора), например, когда
+        следом идет перевод на оператора; заглушку без текста удалить
+        """
+        if not self._text:
+            await self.discard()
+            return
+        if not await self.finish(self._text):
+            await self.discard()
@@ -14,6 +14,80 @@ WHATSAPP_REDIRECT = "your number" # your number
 REDIS_URL = os.getenv('REDIS_URL', 'redis://localhost:6379/0')
 DATABASE_URL = os.getenv('DATABASE_URL', 'sqlite:///data/bot.db')
 
+# Пул соединений с БД (общий на процесс)
+DB_POOL_SIZE = int(os.getenv('DB_POOL_SIZE', 5))
+DB_MAX_OVERFLOW = int(os.getenv('DB_MAX_OVERFLOW', 10))
+DB_POOL_TIMEOUT = int(os.getenv('DB_POOL_TIMEOUT', 30))  # ожидание свободного соединения, сек
+DB_POOL_RECYCLE = int(os.getenv('DB_POOL_RECYCLE', 1800))  # пересоздание соединений, сек
+
+# Конкурентный доступ к SQLite (bot.db общая для основного и админ-бота)
+SQLITE_JOURNAL_MODE = os.getenv('SQLITE_JOURNAL_MODE', 'WAL')
+SQLITE_SYNCHRONOUS = os.getenv('SQLITE_SYNCHRONOUS', 'NORMAL')  # в WAL безопасно и без fsync на каждый commit
+SQLITE_CACHE_SIZE_KB = int(os.getenv('SQLITE_CACHE_SIZE_KB', 65536))
+SQLITE_MMAP_SIZE = int(os.getenv('SQLITE_MMAP_SIZE', 268435456))  # 256 МБ
+SQLITE_BUSY_TIMEOUT_MS = int(os.getenv('SQLITE_BUSY_TIMEOUT_MS', 5000))
+DB_LOCK_RETRIES = int(os.getenv('DB_LOCK_RETRIES', 5))  # повторы единицы работы при блокировке
+DB_LOCK_RETRY_BASE_DELAY = float(os.getenv('DB_LOCK_RETRY_BASE_DELAY', 0.05))  # сек
+DB_LOCK_RETRY_MAX_DELAY = float(os.getenv('DB_LOCK_RETRY_MAX_DELAY', 1.0))  # сек
+
+# Кэш статуса подписки
+SUBSCRIPTION_CACHE_SIZE = int(os.getenv('SUBSCRIPTION_CACHE_SIZE', 100000))  # пользователей
+SUBSCRIPTION_CACHE_TTL = int(os.getenv('SUBSCRIPTION_CACHE_TTL', 600))  # сек
+# Сброс кэша в других процессах через Redis pub/sub (выключен, если Redis не поднят)
+SUBSCRIPTION_CACHE_REDIS = os.getenv('SUBSCRIPTION_CACHE_REDIS', 'false').lower() == 'true'
+SUBSCRIPTION_CACHE_CHANNEL = 'silkway:subscription:invalidate'
+
+# Хранилище состояния основного бота (история диалогов, code_context, rate_limit):
+# memory — в памяти процесса; redis — общее для нескольких воркеров (REDIS_URL)
+STATE_BACKEND = os.getenv('STATE_BACKEND', 'memory').lower()
+STATE_REDIS_PREFIX = os.getenv('STATE_REDIS_PREFIX', 'silkway:')
+STATE_FLAG_TTL = int(os.getenv('STATE_FLAG_TTL', 3600))  # ожидание ввода кода, сек
+RATE_LIMIT_MAX_KEYS = int(os.getenv('RATE_LIMIT_MAX_KEYS', 100000))  # отслеживаемых пользователей в памяти
+RATE_LIMIT_SWEEP_INTERVAL = int(os.getenv('RATE_LIMIT_SWEEP_INTERVAL', 300))  # очистка неактивных, сек
+
+# Контроль допуска запросов (app/bot/admission.py).
+# Стоимость хендлера списывается с бюджета пользователя ADMISSION_USER_BUDGET
+# за ADMISSION_USER_PERIOD секунд; queue — очередь тяжёлых запросов хендлера.
+# message_handler допускается только для ответов модели (FAQ и кэш бесплатны),
+# handle_photo — только для распознавания (фото без кода клиента бесплатно).
+ADMISSION_POLICY = {
+    'start_handler': {'cost': 1},
+    'callback_query_handler': {'cost': 1},
+    'message_handler': {'cost': 3, 'queue': 'generation'},
+    'handle_photo': {'cost': 10, 'queue': 'ocr'},
+}
+# concurrency — одновременно выполняемых запросов, max_waiting — ожидающих;
+# при заполненной очереди запрос отклоняется (сброс нагрузки)
+ADMISSION_QUEUES = {
+    'ocr': {
+        'concurrency': int(os.getenv('ADMISSION_OCR_CONCURRENCY', 2)),
+        'max_waiting': int(os.getenv('ADMISSION_OCR_MAX_WAITING', 6)),
+    },
+    'generation': {
+        'concurrency': int(os.getenv('ADMISSION_GENERATION_CONCURRENCY', 4)),
+        'max_waiting': int(os.getenv('ADMISSION_GENERATION_MAX_WAITING', 20)),
+    },
+}
+ADMISSION_USER_BUDGET = int(os.getenv('ADMISSION_USER_BUDGET', 40))  # единиц стоимости
+ADMISSION_USER_PERIOD = int(os.getenv('ADMISSION_USER_PERIOD', 60))  # сек
+ADMISSION_USER_CONCURRENCY = int(os.getenv('ADMISSION_USER_CONCURRENCY', 1))  # тяжёлых запросов на пользователя
+# Одновременно обрабатываемых обновлений Telegram: ёмкость очередей допуска
+# (выполняемые + ожидающие) и запас, чтобы сверх неё запросы доходили
+# до допуска и получали отказ, а не ждали в очереди PTB
+BOT_CONCURRENT_UPDATES = int(os.getenv(
+    'BOT_CONCURRENT_UPDATES',
+    sum(q['concurrency'] + q['max_waiting'] for q in ADMISSION_QUEUES.values()) + 8
+))
+
+# Размер пачки подписчиков, читаемой из БД при рассылке
+BROADCAST_CHUNK_SIZE = int(os.getenv('BROADCAST_CHUNK_SIZE', 500))
+
+# Отложенная запись истории диалогов (одна транзакция на пачку)
+INTERACTION_BATCH_SIZE = int(os.getenv('INTERACTION_BATCH_SIZE', 200))  # строк в транзакции
+INTERACTION_FLUSH_INTERVAL_MS = int(os.getenv('INTERACTION_FLUSH_INTERVAL_MS', 250))
+INTERACTION_QUEUE_MAXSIZE = int(os.getenv('INTERACTION_QUEUE_MAXSIZE', 10000))
+INTERACTION_PUT_TIMEOUT = float(os.getenv('INTERACTION_PUT_TIMEOUT', 1.0))  # ожидание места в очереди, сек
+
 # Добавим настройки для админ-бота
 ADMIN_BOT_TOKEN = os.getenv("ADMIN_BOT_TOKEN", " your admin bot telegram token") #admin bot
 AUTHORIZED_OPERATORS = [
@@ -27,5 +101,65 @@ SECRET_KEY = os.getenv("SECRET_KEY", "silkway-super-secret-key-2024")
 # Настройки для job-queue
 JOB_QUEUE_INTERVAL = 30  # интервал проверки в секундах
 
+# Интервал сверки счетчиков подписчиков с таблицей, сек
+COUNTERS_RECONCILE_INTERVAL = 3600
+
 # Количество сообщений в истории чата
-CHAT_HISTORY_LIMIT = 5
\ No newline at end of file
+CHAT_HISTORY_LIMIT = 5
+
+# База знаний (FAQ, темы, ответы меню) и интервал проверки файла на изменения, сек (0 — не следить)
+KNOWLEDGE_BASE_PATH = os.getenv('KNOWLEDGE_BASE_PATH', str(BASE_DIR / 'knowledge_base' / 'knowledge.json'))
+KNOWLEDGE_BASE_RELOAD_INTERVAL = int(os.getenv('KNOWLEDGE_BASE_RELOAD_INTERVAL', 30))
+
+# Модели ИИ (torch/transformers/easyocr импортируются лениво, при первом использовании или прогреве)
+AI_MODEL_PATH = os.getenv('AI_MODEL_PATH', 'IlyaGusev/saiga2_7b_lora')
+AI_MODEL_ENABLED = os.getenv('AI_MODEL_ENABLED', 'false').lower() == 'true'  # загрузка языковой модели
+AI_MODEL_QUANTIZATION_MODES = ('none', 'int8')  # int8 - динамическое квантование, только CPU
+AI_MODEL_QUANTIZATION = os.getenv('AI_MODEL_QUANTIZATION', 'none').lower()
+if AI_MODEL_QUANTIZATION not in AI_MODEL_QUANTIZATION_MODES:
+    raise ValueError(
+        f"AI_MODEL_QUANTIZATION={AI_MODEL_QUANTIZATION!r}, expected one of {AI_MODEL_QUANTIZATION_MODES}"
+    )
+AI_MODEL_QUANTIZED_CACHE_DIR = os.getenv('AI_MODEL_QUANTIZED_CACHE_DIR', 'data/quantized')  # кэш int8-весов
+ML_WARMUP_ON_START = os.getenv('ML_WARMUP_ON_START', 'true').lower() == 'true'  # прогрев в фоне после старта
+
+# Генерация: модель в отдельном процессе, запросы объединяются в батчи
+GENERATION_BATCH_SIZE = int(os.getenv('GENERATION_BATCH_SIZE', 8))  # максимум запросов в батче
+GENERATION_BATCH_WAIT_MS = float(os.getenv('GENERATION_BATCH_WAIT_MS', 20))  # окно сбора батча
+GENERATION_MAX_NEW_TOKENS = int(os.getenv('GENERATION_MAX_NEW_TOKENS', 200))
+GENERATION_MAX_INPUT_TOKENS = int(os.getenv('GENERATION_MAX_INPUT_TOKENS', 1024))  # промпт обрезается
+GENERATION_PREFIX_CACHE = os.getenv('GENERATION_PREFIX_CACHE', 'true').lower() == 'true'  # KV-кэш BASE_CONTEXT
+GENERATION_TIMEOUT = float(os.getenv('GENERATION_TIMEOUT', 60))  # сек ожидания ответа воркера
+GENERATION_START_TIMEOUT = float(os.getenv('GENERATION_START_TIMEOUT', 600))  # сек на загрузку модели
+GENERATION_STREAM_INTERVAL_MS = float(os.getenv('GENERATION_STREAM_INTERVAL_MS', 300))  # частота частичных ответов
+
+# Потоковый вывод ответа модели в Telegram: заглушка, затем правки не чаще интервала
+STREAM_RESPONSES = os.getenv('STREAM_RESPONSES', 'true').lower() == 'true'
+STREAM_EDIT_INTERVAL = float(os.getenv('STREAM_EDIT_INTERVAL', 1.5))  # сек между edit_message_text в чате
+STREAM_PLACEHOLDER = os.getenv('STREAM_PLACEHOLDER', '✍️ Печатаю ответ...')
+
+# Промпт модели: преамбула, справка FAQ и история в пределах бюджета токенов
+PROMPT_TOKEN_BUDGET = int(os.getenv('PROMPT_TOKEN_BUDGET', GENERATION_MAX_INPUT_TOKENS))
+PROMPT_TOKENIZER = os.getenv('PROMPT_TOKENIZER', 'auto')  # auto | model | estimate (по длине текста)
+PROMPT_TOKEN_CACHE_SIZE = int(os.getenv('PROMPT_TOKEN_CACHE_SIZE', 10000))  # кэш длин текстов вне истории
+PROMPT_REFERENCE_THRESHOLD = float(os.getenv('PROMPT_REFERENCE_THRESHOLD', 0.1))  # уверенность справки FAQ
+
+# Обработка сообщений ChatManager в пуле потоков
+CHAT_WORKERS = int(os.getenv('CHAT_WORKERS', 4))  # одновременно обрабатываемых сообщений
+CHAT_DEADLINE = float(os.getenv('CHAT_DEADLINE', 20))  # сек до запасного ответа (FAQ/тема/оператор)
+# Если ответ уже показывается по частям, ждем его дольше: сек от начала обработки
+CHAT_STREAM_DEADLINE = float(os.getenv('CHAT_STREAM_DEADLINE', GENERATION_TIMEOUT))
+
+# Поиск по FAQ: bm25 — BM25 по основам слов с откатом на ключевые слова, keywords — только ключевые слова
+FAQ_RETRIEVAL_MODE = os.getenv('FAQ_RETRIEVAL_MODE', 'bm25').lower()
+FAQ_RETRIEVAL_THRESHOLD = float(os.getenv('FAQ_RETRIEVAL_THRESHOLD', 0.3))  # минимальная уверенность 0..1
+
+# Кэш ответов ChatManager, не зависящих от контекста (FAQ, перевод на оператора)
+RESPONSE_CACHE_SIZE = int(os.getenv('RESPONSE_CACHE_SIZE', 10000))
+RESPONSE_CACHE_TTL = int(os.getenv('RESPONSE_CACHE_TTL', 3600))  # сек
+
+# Хранилище диалогов ChatManager
+CONVERSATION_HISTORY_SIZE = int(os.getenv('CONVERSATION_HISTORY_SIZE', 10))  # сообщений на пользователя
+CONVERSATION_MAX_USERS = int(os.getenv('CONVERSATION_MAX_USERS', 50000))
+CONVERSATION_TTL = int(os.getenv('CONVERSATION_TTL', 6 * 3600))  # сек без активности
+CONVERSATION_MAX_BYTES = int(os.getenv('CONVERSATION_MAX_BYTES', 64 * 1024 * 1024))
\ No newline at end of file
@@ -0,0 +1,167 @@
+# app/database/cache.py
+import logging
+import threading
+import time
+from collections import OrderedDict
+from typing import Optional
+
+from app.config import (
+    REDIS_URL,
+    SUBSCRIPTION_CACHE_SIZE,
+    SUBSCRIPTION_CACHE_TTL,
+    SUBSCRIPTION_CACHE_REDIS,
+    SUBSCRIPTION_CACHE_CHANNEL,
+)
+
+logger = logging.getLogger(__name__)
+
+MISSING = object()
+
+
+class TTLCache:
+    """Потокобезопасный LRU-кэш с ограничением размера и временем жизни записей"""
+
+    def __init__(self, maxsize: int, ttl: float):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key, default=MISSING):
+        now = time.monotonic()
+        with self._lock:
+            item = self._data.get(key)
+            if item is None or item[1] < now:
+                if item is not None:
+                    del self._data[key]
+                self.misses += 1
+                return default
+            self._data.move_to_end(key)
+            self.hits += 1
+            return item[0]
+
+    def set(self, key, value):
+        with self._lock:
+            self._data[key] = (value, time.monotonic() + self.ttl)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def pop(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+
+class SubscriptionCache:
+    """
+    Кэш статуса подписки по user_id (read-through в менеджерах БД).
+    Запись через add_subscriber/unsubscribe обновляет кэш и, если включено,
+    рассылает user_id через Redis pub/sub, чтобы другие процессы сбросили запись.
+
+    Каждая запись и сброс увеличивают версию пользователя (счётчики
+    разбиты на stripes корзин по user_id, память не растет). Read-through
+    берет версию до чтения из БД и кладет результат в кэш, только если
+    версия не изменилась: иначе прочитанный статус мог устареть.
+    """
+
+    def __init__(self, maxsize: int = SUBSCRIPTION_CACHE_SIZE,
+                 ttl: float = SUBSCRIPTION_CACHE_TTL,
+                 redis_url: Optional[str] = REDIS_URL if SUBSCRIPTION_CACHE_REDIS else None,
+                 channel: str = SUBSCRIPTION_CACHE_CHANNEL,
+                 stripes: int = 1024):
+        self.cache = TTLCache(maxsize, ttl)
+        self.redis_url = redis_url
+        self.channel = channel
+        self._redis = None
+        self._versions = [0] * stripes
+        self._lock = threading.Lock()
+        self._listener = None
+        # Слушатель запускается сразу: иначе сбросы, пришедшие до первого
+        # чтения, были бы потеряны
+        if self.redis_url:
+            self._listener = threading.Thread(
+                target=self._listen, name="subscription-cache-listener", daemon=True
+            )
+            self._listener.start()
+
+    def _stripe(self, user_id: int) -> int:
+        return hash(user_id) % len(self._versions)
+
+    def get(self, user_id: int) -> Optional[bool]:
+        """Статус из кэша или None, если его нужно прочитать из БД"""
+        value = self.cache.get(user_id)
+        return None if value is MISSING else value
+
+    def version(self, user_id: int) -> int:
+        """Версия записи пользователя (взять до чтения из БД, см. fill)"""
+        return self._versions[self._stripe(user_id)]
+
+    def fill(self, user_id: int, is_subscribed: bool, version: int) -> bool:
+        """Сохранить статус, прочитанный из БД, если с version его никто не менял"""
+        with self._lock:
+            if self._versions[self._stripe(user_id)] != version:
+                return False
+            self.cache.set(user_id, is_subscribed)
+            return True
+
+    def set(self, user_id: int, is_subscribed: bool, publish: bool = False):
+        """Сохранить статус после записи в БД; publish=True — сообщить другим процессам"""
+        with self._lock:
+            self._versions[self._stripe(user_id)] += 1
+            self.cache.set(user_id, is_subscribed)
+        if publish:
+            self._publish(user_id)
+
+    def invalidate(self, user_id: int):
+        with self._lock:
+            self._versions[self._stripe(user_id)] += 1
+            self.cache.pop(user_id)
+
+    def clear(self):
+        """Сбросить весь кэш (чтения, начатые до сброса, в кэш не попадут)"""
+        with self._lock:
+            self._versions = [version + 1 for version in self._versions]
+            self.cache.clear()
+
+    def _client(self):
+        if self._redis is None:
+            import redis
+            self._redis = redis.Redis.from_url(self.redis_url)
+        return self._redis
+
+    def _publish(self, user_id: int):
+        if not self.redis_url:
+            return
+        try:
+            self._client().publish(self.channel, str(user_id))
+        except Exception as e:
+            logger.warning(f"Error publishing subscription invalidation: {e}")
+
+    def _listen(self):
+        """Сбрасывать записи, изменённые в других процессах"""
+        while True:
+            try:
+                pubsub = self._client().pubsub(ignore_subscribe_messages=True)
+                pubsub.subscribe(self.channel)
+                # После (пере)подключения сообщения могли быть пропущены
+                self.clear()
+                for message in pubsub.listen():
+                    try:
+                        self.invalidate(int(message['data']))
+                    except (TypeError, ValueError):
+                        continue
+            except Exception as e:
+                logger.warning(f"Subscription cache listener error: {e}")
+                time.sleep(5)
+
+
+subscription_cache = SubscriptionCache()
@@ -0,0 +1,72 @@
+# app/database/concurrency.py
+"""
+Профиль конкурентного доступа к SQLite: одну bot.db используют
+одновременно контейнеры silkway-bot и admin-bot.
+"""
+import logging
+import random
+
+from sqlalchemy import event
+from sqlalchemy.exc import OperationalError
+
+from app.config import (
+    SQLITE_JOURNAL_MODE,
+    SQLITE_SYNCHRONOUS,
+    SQLITE_CACHE_SIZE_KB,
+    SQLITE_MMAP_SIZE,
+    SQLITE_BUSY_TIMEOUT_MS,
+    DB_LOCK_RETRIES,
+    DB_LOCK_RETRY_BASE_DELAY,
+    DB_LOCK_RETRY_MAX_DELAY,
+)
+
+logger = logging.getLogger(__name__)
+
+
+def sqlite_connect_args() -> dict:
+    """Параметры драйвера: ожидание блокировки вместо немедленной ошибки"""
+    return {
+        'check_same_thread': False,
+        'timeout': SQLITE_BUSY_TIMEOUT_MS / 1000,
+    }
+
+
+def apply_sqlite_pragmas(engine, read_only: bool = False):
+    """
+    Настроить каждое новое соединение движка:
+    WAL (читатели не блокируют писателя), synchronous, кэш, mmap, busy_timeout.
+    Соединения read-only дополнительно переводятся в query_only.
+    """
+    @event.listens_for(engine, "connect")
+    def _on_connect(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        cursor.execute(f"PRAGMA busy_timeout = {SQLITE_BUSY_TIMEOUT_MS}")
+        if not read_only:
+            # Режим журнала хранится в самом файле БД, его меняет только писатель
+            cursor.execute(f"PRAGMA journal_mode = {SQLITE_JOURNAL_MODE}")
+        cursor.execute(f"PRAGMA synchronous = {SQLITE_SYNCHRONOUS}")
+        cursor.execute(f"PRAGMA cache_size = -{SQLITE_CACHE_SIZE_KB}")
+        cursor.execute(f"PRAGMA mmap_size = {SQLITE_MMAP_SIZE}")
+        cursor.execute("PRAGMA temp_store = MEMORY")
+        if read_only:
+            cursor.execute("PRAGMA query_only = ON")
+        cursor.close()
+
+
+def is_lock_error(exc: Exception) -> bool:
+    """Ошибка конкурентного доступа SQLite (database is locked / busy)"""
+    if not isinstance(exc, OperationalError):
+        return False
+    message = str(exc.orig if exc.orig is not None else exc).lower()
+    return 'locked' in message or 'busy' in message
+
+
+def lock_retry_delay(attempt: int) -> float:
+    """Экспоненциальная задержка с полным джиттером для попытки attempt (с 0)"""
+    cap = min(DB_LOCK_RETRY_MAX_DELAY, DB_LOCK_RETRY_BASE_DELAY * 2 ** attempt)
+    return random.uniform(0, cap)
+
+
+def should_retry(exc: Exception, attempt: int) -> bool:
+    """Повторять ли единицу работы после ошибки exc на попытке attempt"""
+    return is_lock_error(exc) and attempt < DB_LOCK_RETRIES
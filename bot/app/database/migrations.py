@@ -0,0 +1,166 @@
+# app/database/migrations.py
+"""
+Версионные миграции схемы БД.
+
+Миграции только добавляют объекты (индексы, таблицы, колонки) и не трогают
+данные, поэтому их можно применять к рабочей bot.db. Применённые версии
+хранятся в таблице schema_migrations.
+
+Каждая миграция применяется в своей транзакции BEGIN IMMEDIATE: блокировка
+записи берется до чтения schema_migrations, поэтому процесс, стартовавший
+одновременно с другим, дождется его и увидит уже применённую версию.
+Схему готовит основной бот при старте (init_database) или команда ниже.
+
+Запуск вручную:
+    python -m app.database.migrations [DATABASE_URL]
+"""
+import asyncio
+import logging
+import sys
+import time
+from datetime import datetime
+
+from sqlalchemy import text
+
+from app.database.concurrency import lock_retry_delay, should_retry
+
+logger = logging.getLogger(__name__)
+
+# (версия, название, SQL-команды). Новые миграции добавляются только в конец.
+MIGRATIONS = [
+    (1, 'access path indexes', [
+        "CREATE INDEX IF NOT EXISTS ix_interactions_user_id_created_at "
+        "ON interactions (user_id, created_at)",
+        "CREATE INDEX IF NOT EXISTS ix_operator_sessions_user_id "
+        "ON operator_sessions (user_id)",
+        "CREATE INDEX IF NOT EXISTS ix_operator_sessions_status_updated_at "
+        "ON operator_sessions (status, updated_at)",
+        "CREATE INDEX IF NOT EXISTS ix_operator_sessions_status_created_at "
+        "ON operator_sessions (status, created_at)",
+        "CREATE INDEX IF NOT EXISTS ix_operator_sessions_status_last_activity "
+        "ON operator_sessions (status, last_activity)",
+        "ANALYZE",
+    ]),
+    (2, 'subscriber keyset index', [
+        "CREATE INDEX IF NOT EXISTS ix_subscribers_is_active_id "
+        "ON subscribers (is_active, id)",
+    ]),
+    (3, 'subscriber counters', [
+        "CREATE TABLE IF NOT EXISTS counters ("
+        "name VARCHAR(50) NOT NULL PRIMARY KEY, "
+        "value INTEGER NOT NULL)",
+        "INSERT OR REPLACE INTO counters (name, value) "
+        "SELECT 'subscribers_total', COUNT(*) FROM subscribers",
+        "INSERT OR REPLACE INTO counters (name, value) "
+        "SELECT 'subscribers_active', COUNT(*) FROM subscribers WHERE is_active = 1",
+    ]),
+]
+
+
+def _ensure_version_table(conn):
+    conn.execute(text(
+        "CREATE TABLE IF NOT EXISTS schema_migrations ("
+        "version INTEGER PRIMARY KEY, "
+        "name VARCHAR(100), "
+        "applied_at DATETIME)"
+    ))
+
+
+def get_applied_versions(conn) -> set:
+    """Версии миграций, уже применённые к БД"""
+    _ensure_version_table(conn)
+    return {row[0] for row in conn.execute(text("SELECT version FROM schema_migrations"))}
+
+
+def _apply(conn, version: int, name: str, statements: list) -> bool:
+    """
+    Применить одну миграцию в открытой транзакции conn.
+    Returns: False, если версия уже применена (например, другим процессом)
+    """
+    if version in get_applied_versions(conn):
+        return False
+    logger.info(f"Applying migration {version}: {name}")
+    for statement in statements:
+        conn.execute(text(statement))
+    conn.execute(
+        text("INSERT OR IGNORE INTO schema_migrations (version, name, applied_at) "
+             "VALUES (:version, :name, :applied_at)"),
+        {'version': version, 'name': name, 'applied_at': datetime.utcnow()}
+    )
+    return True
+
+
+def run_migrations(conn) -> list:
+    """
+    Применить недостающие миграции в рамках соединения conn.
+    Вызывающий отвечает за транзакцию (engine.begin() / conn.run_sync()).
+    Returns: список применённых версий
+    """
+    return [
+        version for version, name, statements in MIGRATIONS
+        if _apply(conn, version, name, statements)
+    ]
+
+
+def migrate(engine) -> list:
+    """
+    Применить недостающие миграции, каждую в своей транзакции BEGIN IMMEDIATE.
+    Если БД заблокирована другим процессом, миграция повторяется с джиттером.
+    Returns: список применённых версий
+    """
+    done = []
+    for version, name, statements in MIGRATIONS:
+        attempt = 0
+        while True:
+            try:
+                with engine.connect() as conn:
+                    conn.exec_driver_sql("BEGIN IMMEDIATE")
+                    if _apply(conn, version, name, statements):
+                        done.append(version)
+                    conn.commit()
+                break
+            except Exception as e:
+                if not should_retry(e, attempt):
+                    raise
+                delay = lock_retry_delay(attempt)
+                logger.warning(f"Database is locked, migration {version} retry {attempt + 1} in {delay:.3f}s")
+                time.sleep(delay)
+                attempt += 1
+    return done
+
+
+async def amigrate(engine) -> list:
+    """Асинхронный вариант migrate для AsyncEngine"""
+    done = []
+    for version, name, statements in MIGRATIONS:
+        attempt = 0
+        while True:
+            try:
+                async with engine.connect() as conn:
+                    await conn.exec_driver_sql("BEGIN IMMEDIATE")
+                    if await conn.run_sync(_apply, version, name, statements):
+                        done.append(version)
+                    await conn.commit()
+                break
+            except Exception as e:
+                if not should_retry(e, attempt):
+                    raise
+                delay = lock_retry_delay(attempt)
+                logger.warning(f"Database is locked, migration {version} retry {attempt + 1} in {delay:.3f}s")
+                await asyncio.sleep(delay)
+                attempt += 1
+    return done
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    from sqlalchemy import create_engine
+    from app.config import DATABASE_URL
+    from app.database.models import Base
+    from app.database.operations import resolve_db_path
+
+    db_path = resolve_db_path(sys.argv[1] if len(sys.argv) > 1 else DATABASE_URL)
+    engine = create_engine(f'sqlite:///{db_path}')
+    Base.metadata.create_all(engine)
+    applied = migrate(engine)
+    print(f"Applied migrations: {applied or 'none'}")
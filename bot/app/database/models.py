@@ -1,5 +1,5 @@
 # app/database/models.py
-from sqlalchemy import Column, Integer, String, DateTime, Text, Boolean
+from sqlalchemy import Column, Integer, String, DateTime, Text, Boolean, Index
 from sqlalchemy.ext.declarative import declarative_base
 from datetime import datetime
 
@@ -7,6 +7,10 @@ Base = declarative_base()
 
 class Interaction(Base):
     __tablename__ = 'interactions'
+    __table_args__ = (
+        # get_user_interactions: WHERE user_id ORDER BY created_at DESC
+        Index('ix_interactions_user_id_created_at', 'user_id', 'created_at'),
+    )
     
     id = Column(Integer, primary_key=True)
     user_id = Column(Integer)
@@ -18,6 +22,15 @@ class Interaction(Base):
 
 class OperatorSession(Base):
     __tablename__ = 'operator_sessions'
+    __table_args__ = (
+        # Смена статуса и активность ищут сессию по user_id
+        Index('ix_operator_sessions_user_id', 'user_id'),
+        # Списки заявок: WHERE status ORDER BY updated_at / created_at
+        Index('ix_operator_sessions_status_updated_at', 'status', 'updated_at'),
+        Index('ix_operator_sessions_status_created_at', 'status', 'created_at'),
+        # get_inactive_sessions: WHERE status AND last_activity < ?
+        Index('ix_operator_sessions_status_last_activity', 'status', 'last_activity'),
+    )
     
     id = Column(Integer, primary_key=True)
     user_id = Column(Integer)
@@ -33,9 +46,20 @@ class OperatorSession(Base):
 
 class Subscriber(Base):
     __tablename__ = 'subscribers'
+    __table_args__ = (
+        # Рассылка: WHERE is_active AND id > ? ORDER BY id (keyset-пагинация)
+        Index('ix_subscribers_is_active_id', 'is_active', 'id'),
+    )
     
     id = Column(Integer, primary_key=True)
     user_id = Column(Integer, unique=True)
     username = Column(String(100))
     subscribed_at = Column(DateTime, default=datetime.utcnow)
     is_active = Column(Boolean, default=True)
+
+class Counter(Base):
+    """Счетчики, поддерживаемые в той же транзакции, что и изменения данных"""
+    __tablename__ = 'counters'
+
+    name = Column(String(50), primary_key=True)
+    value = Column(Integer, nullable=False, default=0)
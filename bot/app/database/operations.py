@@ -1,42 +1,211 @@
 # app/database/operations.py
-from sqlalchemy import create_engine, inspect
-from sqlalchemy.orm import sessionmaker
+from sqlalchemy import create_engine, inspect, select, func, update, tuple_
+from sqlalchemy.orm import sessionmaker, scoped_session
+from sqlalchemy.pool import AsyncAdaptedQueuePool
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+from contextlib import contextmanager
 from datetime import datetime, timedelta
+import asyncio
 import os
 import logging
+import threading
+import time
 
-from app.database.models import Base, Interaction, OperatorSession, Subscriber
-from app.config import DATABASE_URL
+from app.database.models import Base, Interaction, OperatorSession, Subscriber, Counter
+from app.database.writer import get_interaction_writer, close_interaction_writers
+from app.database.migrations import amigrate, migrate
+from app.database.cache import subscription_cache
+from app.database.concurrency import (
+    apply_sqlite_pragmas, sqlite_connect_args, lock_retry_delay, should_retry
+)
+from app.config import (
+    DATABASE_URL, DB_POOL_SIZE, DB_MAX_OVERFLOW, DB_POOL_TIMEOUT, DB_POOL_RECYCLE,
+    SQLITE_BUSY_TIMEOUT_MS, BROADCAST_CHUNK_SIZE
+)
 
 logger = logging.getLogger(__name__)
 
+# Имена счетчиков в таблице counters
+SUBSCRIBERS_TOTAL = 'subscribers_total'
+SUBSCRIBERS_ACTIVE = 'subscribers_active'
+
+# Реестр движков и менеджеров на процесс: один пул соединений на файл БД
+_registry_lock = threading.Lock()
+_engines = {}
+_managers = {}
+
+
+def resolve_db_path(db_url: str) -> str:
+    """Получить абсолютный путь к файлу SQLite и создать его директорию"""
+    # Получаем путь к файлу БД
+    db_path = db_url.replace('sqlite:///', '')
+
+    # Если путь не абсолютный, делаем его относительно корня проекта
+    if not os.path.isabs(db_path):
+        db_path = os.path.join('/app', db_path)
+
+    # Создаем директорию для БД, если её нет
+    db_dir = os.path.dirname(db_path)
+    os.makedirs(db_dir, exist_ok=True)
+    return db_path
+
+
+def _pool_options() -> dict:
+    """Настройки пула соединений из конфига"""
+    return dict(
+        pool_size=DB_POOL_SIZE,
+        max_overflow=DB_MAX_OVERFLOW,
+        pool_timeout=DB_POOL_TIMEOUT,
+        pool_recycle=DB_POOL_RECYCLE,
+        pool_pre_ping=True,
+    )
+
+
+def _counter_delta(name: str, delta: int):
+    """UPDATE счетчика на delta (выполняется в транзакции изменения данных)"""
+    return update(Counter).where(Counter.name == name).values(value=Counter.value + delta)
+
+
+def _counter_value(name: str):
+    return select(Counter.value).where(Counter.name == name)
+
+
+def _subscriber_counts():
+    """Реальные COUNT(*) для сверки счетчиков"""
+    return {
+        SUBSCRIBERS_TOTAL: select(func.count(Subscriber.id)),
+        SUBSCRIBERS_ACTIVE: select(func.count(Subscriber.id)).where(Subscriber.is_active == True),  # noqa: E712
+    }
+
+
+def _sessions_page_query(status: str, limit: int, after=None, before=None):
+    """
+    Keyset-запрос страницы сессий по (updated_at, id), от новых к старым.
+    after/before - ключ последней/первой строки текущей страницы.
+    Берем limit + 1 строк, чтобы узнать, есть ли страница дальше.
+    """
+    key = tuple_(OperatorSession.updated_at, OperatorSession.id)
+    stmt = select(OperatorSession).where(OperatorSession.status == status)
+    if before is not None:
+        stmt = stmt.where(key > tuple_(*before)).order_by(
+            OperatorSession.updated_at.asc(), OperatorSession.id.asc()
+        )
+    else:
+        if after is not None:
+            stmt = stmt.where(key < tuple_(*after))
+        stmt = stmt.order_by(OperatorSession.updated_at.desc(), OperatorSession.id.desc())
+    return stmt.limit(limit + 1)
+
+
+def _sessions_page(rows, limit: int, after=None, before=None):
+    """Returns: (sessions, has_prev, has_next)"""
+    has_more = len(rows) > limit
+    rows = list(rows[:limit])
+    if before is not None:
+        rows.reverse()
+        return rows, has_more, True
+    return rows, after is not None, has_more
+
+
+def get_engine(db_url: str, read_only: bool = False):
+    """
+    Получить общий для процесса движок для db_url.
+    Движок (и его пул) создается один раз. Таблицы и миграции здесь
+    не применяются: схему готовит основной бот при старте (init_database).
+    """
+    db_path = resolve_db_path(db_url)
+    with _registry_lock:
+        engine = _engines.get((db_path, read_only))
+        if engine is None:
+            engine = create_engine(
+                f'sqlite:///{db_path}',
+                connect_args=sqlite_connect_args(),
+                **_pool_options()
+            )
+            apply_sqlite_pragmas(engine, read_only=read_only)
+            _engines[(db_path, read_only)] = engine
+        return engine
+
+
+def get_db_manager(db_url: str = DATABASE_URL, read_only: bool = False) -> 'DatabaseManager':
+    """Получить общий для процесса DatabaseManager для db_url"""
+    with _registry_lock:
+        manager = _managers.get((db_url, read_only))
+    if manager is None:
+        manager = DatabaseManager(db_url, read_only=read_only)
+        with _registry_lock:
+            manager = _managers.setdefault((db_url, read_only), manager)
+    return manager
+
+
+def dispose_engines():
+    """Дописать отложенные записи и закрыть все пулы соединений (при остановке процесса)"""
+    close_interaction_writers()
+    with _registry_lock:
+        for engine in _engines.values():
+            engine.dispose()
+        _engines.clear()
+        _managers.clear()
+
+
 class DatabaseManager:
-    def __init__(self, db_url: str):
-        """Инициализация подключения к БД"""
-        try:
-            # Получаем путь к файлу БД
-            db_path = db_url.replace('sqlite:///', '')
-            
-            # Если путь не абсолютный, делаем его относительно корня проекта
-            if not os.path.isabs(db_path):
-                db_path = os.path.join('/app', db_path)
-            
-            # Создаем директорию для БД, если её нет
-            db_dir = os.path.dirname(db_path)
-            os.makedirs(db_dir, exist_ok=True)
-            
-            # Создаем подключение
-            self.engine = create_engine(f'sqlite:///{db_path}')
-            Session = sessionmaker(bind=self.engine)
-            self.session = Session()
-            
-            # Создаем таблицы при инициализации
-            self.init_database()
-            
+    def __init__(self, db_url: str, read_only: bool = False):
+        """
+        Инициализация подключения к БД.
+        read_only: соединения в режиме query_only для процессов, которые только читают
+        """
+        try:
+            # Движок и пул берем из реестра, сессия - своя на каждый поток
+            self.read_only = read_only
+            self.engine = get_engine(db_url, read_only=read_only)
+            self.Session = scoped_session(
+                sessionmaker(bind=self.engine, expire_on_commit=False)
+            )
+            # История диалогов пишется пачками в фоновом потоке
+            self.writer = None if read_only else get_interaction_writer(self.engine)
         except Exception as e:
             logger.error(f"Error initializing database: {e}")
             raise
 
+    @property
+    def session(self):
+        """Сессия текущего потока"""
+        return self.Session()
+
+    @contextmanager
+    def session_scope(self):
+        """
+        Единица работы: сессия текущего потока, commit при успехе,
+        rollback при ошибке, освобождение соединения в пул в конце.
+        """
+        session = self.Session()
+        try:
+            yield session
+            session.commit()
+        except Exception:
+            session.rollback()
+            raise
+        finally:
+            self.Session.remove()
+
+    def run_in_session(self, work):
+        """
+        Выполнить work(session) как единицу работы.
+        Если БД заблокирована другим процессом, повторить целиком с джиттером.
+        """
+        attempt = 0
+        while True:
+            try:
+                with self.session_scope() as session:
+                    return work(session)
+            except Exception as e:
+                if not should_retry(e, attempt):
+                    raise
+                delay = lock_retry_delay(attempt)
+                logger.warning(f"Database is locked, retry {attempt + 1} in {delay:.3f}s")
+                time.sleep(delay)
+                attempt += 1
+
     # Метод для обновления схемы БД (использовать только при необходимости)
     def update_schema(self):
         """Обновление схемы базы данных"""
@@ -52,51 +221,73 @@ class DatabaseManager:
                          message_type: str = "text", success: bool = True):
         """
         Сохранение диалога (пользователь -> бот / бот -> пользователь).
+        Запись отложенная: строка уходит в очередь InteractionWriter.
         """
         try:
-            interaction = Interaction(
-                user_id=user_id,
-                message=message,
-                response=response,
-                message_type=message_type,
-                success=success
-            )
-            self.session.add(interaction)
-            self.session.commit()
+            self.writer.put(user_id, message, response, message_type, success)
         except Exception as e:
             logger.error(f"Error saving interaction: {e}")
-            self.session.rollback()
 
     def create_operator_session(self, user_id: int, message: str = None):
         """Создать (или обновить существующую) сессию оператора."""
-        try:
-            sess_obj = self.session.query(OperatorSession).filter_by(user_id=user_id).first()
+        def work(session):
+            sess_obj = session.query(OperatorSession).filter_by(user_id=user_id).first()
             if not sess_obj:
                 sess_obj = OperatorSession(
                     user_id=user_id,
                     status='pending',
                     last_message=message or "Нет сообщения"  # Добавляем значение по умолчанию
                 )
-                self.session.add(sess_obj)
+                session.add(sess_obj)
             else:
                 sess_obj.status = 'pending'
                 sess_obj.last_message = message or sess_obj.last_message
                 sess_obj.updated_at = datetime.utcnow()
-            self.session.commit()
             return sess_obj
+
+        try:
+            return self.run_in_session(work)
         except Exception as e:
             logger.error(f"Error create_operator_session: {e}")
-            self.session.rollback()
             return None
 
+    def _set_session_status(self, user_id: int, status: str):
+        """Сменить статус сессии оператора"""
+        def work(session):
+            sess_obj = session.query(OperatorSession).filter_by(user_id=user_id).first()
+            if sess_obj:
+                sess_obj.status = status
+                sess_obj.updated_at = datetime.utcnow()
+
+        self.run_in_session(work)
+
+    def _get_sessions(self, *criteria, order_by=None):
+        """Выбрать сессии оператора по условиям"""
+        def work(session):
+            query = session.query(OperatorSession).filter(*criteria)
+            if order_by is not None:
+                query = query.order_by(order_by)
+            return query.all()
+
+        return self.run_in_session(work)
+
+    def get_sessions_page(self, status: str, limit: int = 10, after=None, before=None):
+        """
+        Страница сессий в статусе status (keyset-пагинация по updated_at, id).
+        Returns: (sessions, has_prev, has_next)
+        """
+        try:
+            stmt = _sessions_page_query(status, limit, after, before)
+            rows = self.run_in_session(lambda session: session.scalars(stmt).all())
+            return _sessions_page(rows, limit, after, before)
+        except Exception as e:
+            logger.error(f"Error get_sessions_page: {e}")
+            return [], False, False
+
     def get_pending_sessions(self):
         """Список пользователей, которые в статусе 'pending'."""
         try:
-            return (
-                self.session.query(OperatorSession)
-                .filter(OperatorSession.status == 'pending')
-                .all()
-            )
+            return self._get_sessions(OperatorSession.status == 'pending')
         except Exception as e:
             logger.error(f"Error get_pending_sessions: {e}")
             return []
@@ -104,35 +295,23 @@ class DatabaseManager:
     def set_session_active(self, user_id: int):
         """Перевести сессию в active."""
         try:
-            sess_obj = self.session.query(OperatorSession).filter_by(user_id=user_id).first()
-            if sess_obj:
-                sess_obj.status = 'active'
-                sess_obj.updated_at = datetime.utcnow()
-                self.session.commit()
+            self._set_session_status(user_id, 'active')
         except Exception as e:
             logger.error(f"Error set_session_active: {e}")
-            self.session.rollback()
 
     def close_session(self, user_id: int):
         """Закрыть сессию (status='closed')."""
         try:
-            sess_obj = self.session.query(OperatorSession).filter_by(user_id=user_id).first()
-            if sess_obj:
-                sess_obj.status = 'closed'
-                sess_obj.updated_at = datetime.utcnow()
-                self.session.commit()
+            self._set_session_status(user_id, 'closed')
         except Exception as e:
             logger.error(f"Error close_session: {e}")
-            self.session.rollback()
 
     def get_answered_sessions(self):
         """Получить отвеченные сессии"""
         try:
-            return (
-                self.session.query(OperatorSession)
-                .filter(OperatorSession.status == 'answered')
-                .order_by(OperatorSession.updated_at.desc())
-                .all()
+            return self._get_sessions(
+                OperatorSession.status == 'answered',
+                order_by=OperatorSession.updated_at.desc()
             )
         except Exception as e:
             logger.error(f"Error get_answered_sessions: {e}")
@@ -141,11 +320,9 @@ class DatabaseManager:
     def get_unanswered_sessions(self):
         """Получить неотвеченные сессии"""
         try:
-            return (
-                self.session.query(OperatorSession)
-                .filter(OperatorSession.status == 'pending')
-                .order_by(OperatorSession.created_at.desc())
-                .all()
+            return self._get_sessions(
+                OperatorSession.status == 'pending',
+                order_by=OperatorSession.created_at.desc()
             )
         except Exception as e:
             logger.error(f"Error get_unanswered_sessions: {e}")
@@ -154,25 +331,20 @@ class DatabaseManager:
     def set_session_answered(self, user_id: int):
         """Пометить сессию как отвеченную"""
         try:
-            sess_obj = self.session.query(OperatorSession).filter_by(user_id=user_id).first()
-            if sess_obj:
-                sess_obj.status = 'answered'
-                sess_obj.updated_at = datetime.utcnow()
-                self.session.commit()
+            self._set_session_status(user_id, 'answered')
         except Exception as e:
             logger.error(f"Error set_session_answered: {e}")
-            self.session.rollback()
 
-    def get_user_interactions(self, user_id: int, limit: int = 5):
-        """Получить последние сообщения пользователя"""
+    def get_user_interactions(self, user_id: int, limit: int = 5, message_types=None):
+        """Получить последние сообщения пользователя (опционально только типов message_types)"""
+        def work(session):
+            query = session.query(Interaction).filter_by(user_id=user_id)
+            if message_types:
+                query = query.filter(Interaction.message_type.in_(message_types))
+            return query.order_by(Interaction.created_at.desc()).limit(limit).all()
+
         try:
-            return (
-                self.session.query(Interaction)
-                .filter_by(user_id=user_id)
-                .order_by(Interaction.created_at.desc())
-                .limit(limit)
-                .all()
-            )
+            return self.run_in_session(work)
         except Exception as e:
             logger.error(f"Error get_user_interactions: {e}")
             return []
@@ -180,37 +352,29 @@ class DatabaseManager:
     def set_session_in_progress(self, user_id: int):
         """Перевести сессию в статус 'в процессе'"""
         try:
-            sess_obj = self.session.query(OperatorSession).filter_by(user_id=user_id).first()
-            if sess_obj:
-                sess_obj.status = 'in_progress'
-                sess_obj.updated_at = datetime.utcnow()
-                self.session.commit()
+            self._set_session_status(user_id, 'in_progress')
         except Exception as e:
             logger.error(f"Error set_session_in_progress: {e}")
-            self.session.rollback()
 
     def update_last_activity(self, user_id: int):
         """Обновить время последней активности"""
-        try:
-            sess_obj = self.session.query(OperatorSession).filter_by(user_id=user_id).first()
+        def work(session):
+            sess_obj = session.query(OperatorSession).filter_by(user_id=user_id).first()
             if sess_obj:
                 sess_obj.last_activity = datetime.utcnow()
-                self.session.commit()
+
+        try:
+            self.run_in_session(work)
         except Exception as e:
             logger.error(f"Error update_last_activity: {e}")
-            self.session.rollback()
 
     def get_inactive_sessions(self, hours=12):
         """Получить неактивные сессии"""
         try:
             inactive_time = datetime.utcnow() - timedelta(hours=hours)
-            return (
-                self.session.query(OperatorSession)
-                .filter(
-                    OperatorSession.status == 'in_progress',
-                    OperatorSession.last_activity < inactive_time
-                )
-                .all()
+            return self._get_sessions(
+                OperatorSession.status == 'in_progress',
+                OperatorSession.last_activity < inactive_time
             )
         except Exception as e:
             logger.error(f"Error get_inactive_sessions: {e}")
@@ -219,11 +383,9 @@ class DatabaseManager:
     def get_in_progress_sessions(self):
         """Получить сессии в процессе"""
         try:
-            return (
-                self.session.query(OperatorSession)
-                .filter(OperatorSession.status == 'in_progress')
-                .order_by(OperatorSession.updated_at.desc())
-                .all()
+            return self._get_sessions(
+                OperatorSession.status == 'in_progress',
+                order_by=OperatorSession.updated_at.desc()
             )
         except Exception as e:
             logger.error(f"Error get_in_progress_sessions: {e}")
@@ -232,8 +394,9 @@ class DatabaseManager:
     def init_database(self):
         """Инициализация базы данных"""
         try:
-            # Создаем все таблицы из моделей
+            # Создаем все таблицы из моделей и применяем миграции
             Base.metadata.create_all(self.engine)
+            migrate(self.engine)
             logger.info("Database initialized successfully")
         except Exception as e:
             logger.error(f"Error initializing database: {e}")
@@ -241,45 +404,53 @@ class DatabaseManager:
 
     def add_subscriber(self, user_id: int, username: str = None) -> bool:
         """Добавление нового подписчика"""
-        try:
+        def work(session):
             # Проверяем, существует ли уже такой подписчик
             subscriber = (
-                self.session.query(Subscriber)
+                session.query(Subscriber)
                 .filter_by(user_id=user_id)
                 .first()
             )
-            
+
             if subscriber:
                 # Если существует, обновляем данные
+                if not subscriber.is_active:
+                    session.execute(_counter_delta(SUBSCRIBERS_ACTIVE, 1))
                 subscriber.is_active = True
                 subscriber.username = username
             else:
                 # Если нет, создаем нового
-                subscriber = Subscriber(
+                session.add(Subscriber(
                     user_id=user_id,
                     username=username,
                     is_active=True
-                )
-                self.session.add(subscriber)
-                
-            self.session.commit()
+                ))
+                session.execute(_counter_delta(SUBSCRIBERS_TOTAL, 1))
+                session.execute(_counter_delta(SUBSCRIBERS_ACTIVE, 1))
+
+        try:
+            self.run_in_session(work)
+            subscription_cache.set(user_id, True, publish=True)
             return True
-            
         except Exception as e:
             logger.error(f"Error adding subscriber: {e}")
-            self.session.rollback()
             return False
 
     def check_subscription(self, user_id: int) -> bool:
-        """Проверка подписки пользователя"""
+        """Проверка подписки пользователя (сначала по кэшу)"""
+        cached = subscription_cache.get(user_id)
+        if cached is not None:
+            return cached
+        # Версия до чтения: запись, завершившаяся во время чтения, не будет затерта
+        version = subscription_cache.version(user_id)
         try:
-            subscriber = (
-                self.session.query(Subscriber)
+            is_subscribed = self.run_in_session(lambda session: bool(
+                session.query(Subscriber.id)
                 .filter_by(user_id=user_id, is_active=True)
                 .first()
-            )
-            return bool(subscriber)
-            
+            ))
+            subscription_cache.fill(user_id, is_subscribed, version)
+            return is_subscribed
         except Exception as e:
             logger.error(f"Error checking subscription: {e}")
             return False
@@ -287,24 +458,57 @@ class DatabaseManager:
     def get_active_subscribers(self):
         """Получить список активных подписчиков"""
         try:
-            subscribers = (
-                self.session.query(Subscriber)
+            subscribers = self.run_in_session(lambda session: (
+                session.query(Subscriber)
                 .filter_by(is_active=True)
                 .all()
-            )
+            ))
             logger.info(f"Found {len(subscribers)} active subscribers")
-            # Логируем ID подписчиков для отладки
-            subscriber_ids = [s.user_id for s in subscribers]
-            logger.info(f"Subscriber IDs: {subscriber_ids}")
             return subscribers
         except Exception as e:
             logger.error(f"Error getting active subscribers: {e}")
             return []
 
+    def iter_active_subscriber_ids(self, chunk_size: int = BROADCAST_CHUNK_SIZE):
+        """
+        Потоково выдать user_id активных подписчиков пачками по chunk_size.
+        Keyset-пагинация по Subscriber.id: каждая пачка - отдельный короткий запрос,
+        в памяти не больше одной пачки.
+        """
+        last_id = 0
+        while True:
+            try:
+                rows = self.run_in_session(lambda session: (
+                    session.query(Subscriber.id, Subscriber.user_id)
+                    .filter(Subscriber.is_active == True, Subscriber.id > last_id)  # noqa: E712
+                    .order_by(Subscriber.id)
+                    .limit(chunk_size)
+                    .all()
+                ))
+            except Exception as e:
+                logger.error(f"Error iterating active subscribers after id {last_id}: {e}")
+                return
+            if not rows:
+                return
+            last_id = rows[-1][0]
+            yield [user_id for _, user_id in rows]
+            if len(rows) < chunk_size:
+                return
+
+    def _get_counter(self, name: str) -> int:
+        """Значение счетчика; если его еще нет, считаем по таблице"""
+        def work(session):
+            value = session.scalar(_counter_value(name))
+            if value is None:
+                value = session.scalar(_subscriber_counts()[name])
+            return value
+
+        return self.run_in_session(work)
+
     def get_subscribers_count(self):
         """Получить общее количество подписчиков"""
         try:
-            return self.session.query(Subscriber).count()
+            return self._get_counter(SUBSCRIBERS_TOTAL)
         except Exception as e:
             logger.error(f"Error getting subscribers count: {e}")
             return 0
@@ -312,44 +516,528 @@ class DatabaseManager:
     def get_active_subscribers_count(self):
         """Получить количество активных подписчиков"""
         try:
-            return (
-                self.session.query(Subscriber)
-                .filter_by(is_active=True)
-                .count()
-            )
+            return self._get_counter(SUBSCRIBERS_ACTIVE)
         except Exception as e:
             logger.error(f"Error getting active subscribers count: {e}")
             return 0
 
+    def reconcile_counters(self) -> dict:
+        """
+        Сверить счетчики с реальным COUNT(*) и исправить расхождения.
+        Returns: {имя: (было, стало)} для исправленных счетчиков
+        """
+        def work(session):
+            drift = {}
+            for name, count_query in _subscriber_counts().items():
+                actual = session.scalar(count_query)
+                stored = session.scalar(_counter_value(name))
+                if stored != actual:
+                    session.merge(Counter(name=name, value=actual))
+                    drift[name] = (stored, actual)
+            return drift
+
+        try:
+            drift = self.run_in_session(work)
+            if drift:
+                logger.warning(f"Counters reconciled: {drift}")
+            return drift
+        except Exception as e:
+            logger.error(f"Error reconciling counters: {e}")
+            return {}
+
     def unsubscribe(self, user_id: int) -> bool:
         """Отписка пользователя от рассылки"""
-        try:
+        def work(session):
             subscriber = (
-                self.session.query(Subscriber)
+                session.query(Subscriber)
                 .filter_by(user_id=user_id)
                 .first()
             )
-            
+            if not subscriber:
+                return False
+            if subscriber.is_active:
+                session.execute(_counter_delta(SUBSCRIBERS_ACTIVE, -1))
+            subscriber.is_active = False
+            return True
+
+        try:
+            if not self.run_in_session(work):
+                return False
+            subscription_cache.set(user_id, False, publish=True)
+            logger.info(f"User {user_id} unsubscribed successfully")
+            return True
+        except Exception as e:
+            logger.error(f"Error unsubscribing user {user_id}: {e}")
+            return False
+
+class AsyncDatabaseManager:
+    """
+    Асинхронный вариант DatabaseManager (AsyncEngine + aiosqlite).
+    Методы повторяют DatabaseManager, но не блокируют event loop бота.
+    Каждый вызов работает в собственной AsyncSession.
+    """
+
+    def __init__(self, db_url: str, read_only: bool = False,
+                 migrate: bool = True, writer: bool = True):
+        """
+        Инициализация асинхронного подключения к БД.
+        read_only: соединения в режиме query_only (списки и статистика админ-бота)
+        migrate: init_database создает таблицы и применяет миграции
+            (False - схему готовит другой процесс, например, основной бот)
+        writer: запускать общий writer истории диалогов (нужен только для save_interaction)
+        """
+        try:
+            db_path = resolve_db_path(db_url)
+            self.read_only = read_only
+            self.migrate = migrate and not read_only
+            # Движок привязан к event loop, поэтому он свой у каждого экземпляра
+            self.engine = create_async_engine(
+                f'sqlite+aiosqlite:///{db_path}',
+                poolclass=AsyncAdaptedQueuePool,
+                connect_args={'timeout': SQLITE_BUSY_TIMEOUT_MS / 1000},
+                **_pool_options()
+            )
+            apply_sqlite_pragmas(self.engine.sync_engine, read_only=read_only)
+            # expire_on_commit=False: объекты остаются читаемыми после закрытия сессии
+            self.async_session = async_sessionmaker(self.engine, expire_on_commit=False)
+            # История диалогов пишется пачками общим для процесса writer'ом
+            self.writer = get_interaction_writer(get_engine(db_url)) if writer and not read_only else None
+        except Exception as e:
+            logger.error(f"Error initializing async database: {e}")
+            raise
+
+    async def init_database(self):
+        """Инициализация базы данных"""
+        if not self.migrate:
+            return
+        try:
+            async with self.engine.begin() as conn:
+                await conn.run_sync(Base.metadata.create_all)
+            await amigrate(self.engine)
+            logger.info("Database initialized successfully")
+        except Exception as e:
+            logger.error(f"Error initializing database: {e}")
+            raise
+
+    # Метод для обновления схемы БД (использовать только при необходимости)
+    async def update_schema(self):
+        """Обновление схемы базы данных"""
+        try:
+            async with self.engine.begin() as conn:
+                await conn.run_sync(Base.metadata.drop_all)
+                await conn.run_sync(Base.metadata.create_all)
+            logger.info("Database schema updated successfully")
+        except Exception as e:
+            logger.error(f"Error updating database schema: {e}")
+            raise
+
+    async def close(self):
+        """Закрыть пул соединений"""
+        await self.engine.dispose()
+
+    async def run_in_session(self, work):
+        """
+        Выполнить await work(session) как единицу работы в новой AsyncSession.
+        Если БД заблокирована другим процессом, повторить целиком с джиттером.
+        """
+        attempt = 0
+        while True:
+            try:
+                async with self.async_session() as session:
+                    result = await work(session)
+                    await session.commit()
+                    return result
+            except Exception as e:
+                if not should_retry(e, attempt):
+                    raise
+                delay = lock_retry_delay(attempt)
+                logger.warning(f"Database is locked, retry {attempt + 1} in {delay:.3f}s")
+                await asyncio.sleep(delay)
+                attempt += 1
+
+    async def save_interaction(self, user_id: int, message: str, response: str = None,
+                               message_type: str = "text", success: bool = True):
+        """
+        Сохранение диалога (пользователь -> бот / бот -> пользователь).
+        Запись отложенная: строка уходит в очередь InteractionWriter.
+        """
+        if self.writer is None:
+            logger.error("Error saving interaction: database manager has no writer")
+            return
+        try:
+            await self.writer.aput(user_id, message, response, message_type, success)
+        except Exception as e:
+            logger.error(f"Error saving interaction: {e}")
+
+    async def create_operator_session(self, user_id: int, message: str = None):
+        """Создать (или обновить существующую) сессию оператора."""
+        async def work(session):
+            sess_obj = await session.scalar(
+                select(OperatorSession).filter_by(user_id=user_id).limit(1)
+            )
+            if not sess_obj:
+                sess_obj = OperatorSession(
+                    user_id=user_id,
+                    status='pending',
+                    last_message=message or "Нет сообщения"
+                )
+                session.add(sess_obj)
+            else:
+                sess_obj.status = 'pending'
+                sess_obj.last_message = message or sess_obj.last_message
+                sess_obj.updated_at = datetime.utcnow()
+            return sess_obj
+
+        try:
+            return await self.run_in_session(work)
+        except Exception as e:
+            logger.error(f"Error create_operator_session: {e}")
+            return None
+
+    async def _set_session_status(self, user_id: int, status: str):
+        """Сменить статус сессии оператора"""
+        async def work(session):
+            sess_obj = await session.scalar(
+                select(OperatorSession).filter_by(user_id=user_id).limit(1)
+            )
+            if sess_obj:
+                sess_obj.status = status
+                sess_obj.updated_at = datetime.utcnow()
+
+        await self.run_in_session(work)
+
+    async def _get_sessions(self, *criteria, order_by=None):
+        """Выбрать сессии оператора по условиям"""
+        stmt = select(OperatorSession).where(*criteria)
+        if order_by is not None:
+            stmt = stmt.order_by(order_by)
+
+        async def work(session):
+            return (await session.scalars(stmt)).all()
+
+        return await self.run_in_session(work)
+
+    async def get_sessions_page(self, status: str, limit: int = 10, after=None, before=None):
+        """
+        Страница сессий в статусе status (keyset-пагинация по updated_at, id).
+        Returns: (sessions, has_prev, has_next)
+        """
+        stmt = _sessions_page_query(status, limit, after, before)
+
+        async def work(session):
+            return (await session.scalars(stmt)).all()
+
+        try:
+            rows = await self.run_in_session(work)
+            return _sessions_page(rows, limit, after, before)
+        except Exception as e:
+            logger.error(f"Error get_sessions_page: {e}")
+            return [], False, False
+
+    async def get_pending_sessions(self):
+        """Список пользователей, которые в статусе 'pending'."""
+        try:
+            return await self._get_sessions(OperatorSession.status == 'pending')
+        except Exception as e:
+            logger.error(f"Error get_pending_sessions: {e}")
+            return []
+
+    async def set_session_active(self, user_id: int):
+        """Перевести сессию в active."""
+        try:
+            await self._set_session_status(user_id, 'active')
+        except Exception as e:
+            logger.error(f"Error set_session_active: {e}")
+
+    async def close_session(self, user_id: int):
+        """Закрыть сессию (status='closed')."""
+        try:
+            await self._set_session_status(user_id, 'closed')
+        except Exception as e:
+            logger.error(f"Error close_session: {e}")
+
+    async def get_answered_sessions(self):
+        """Получить отвеченные сессии"""
+        try:
+            return await self._get_sessions(
+                OperatorSession.status == 'answered',
+                order_by=OperatorSession.updated_at.desc()
+            )
+        except Exception as e:
+            logger.error(f"Error get_answered_sessions: {e}")
+            return []
+
+    async def get_unanswered_sessions(self):
+        """Получить неотвеченные сессии"""
+        try:
+            return await self._get_sessions(
+                OperatorSession.status == 'pending',
+                order_by=OperatorSession.created_at.desc()
+            )
+        except Exception as e:
+            logger.error(f"Error get_unanswered_sessions: {e}")
+            return []
+
+    async def set_session_answered(self, user_id: int):
+        """Пометить сессию как отвеченную"""
+        try:
+            await self._set_session_status(user_id, 'answered')
+        except Exception as e:
+            logger.error(f"Error set_session_answered: {e}")
+
+    async def get_user_interactions(self, user_id: int, limit: int = 5, message_types=None):
+        """Получить последние сообщения пользователя (опционально только типов message_types)"""
+        stmt = select(Interaction).filter_by(user_id=user_id)
+        if message_types:
+            stmt = stmt.where(Interaction.message_type.in_(message_types))
+        stmt = stmt.order_by(Interaction.created_at.desc()).limit(limit)
+
+        async def work(session):
+            return (await session.scalars(stmt)).all()
+
+        try:
+            return await self.run_in_session(work)
+        except Exception as e:
+            logger.error(f"Error get_user_interactions: {e}")
+            return []
+
+    async def set_session_in_progress(self, user_id: int):
+        """Перевести сессию в статус 'в процессе'"""
+        try:
+            await self._set_session_status(user_id, 'in_progress')
+        except Exception as e:
+            logger.error(f"Error set_session_in_progress: {e}")
+
+    async def update_last_activity(self, user_id: int):
+        """Обновить время последней активности"""
+        async def work(session):
+            sess_obj = await session.scalar(
+                select(OperatorSession).filter_by(user_id=user_id).limit(1)
+            )
+            if sess_obj:
+                sess_obj.last_activity = datetime.utcnow()
+
+        try:
+            await self.run_in_session(work)
+        except Exception as e:
+            logger.error(f"Error update_last_activity: {e}")
+
+    async def get_inactive_sessions(self, hours=12):
+        """Получить неактивные сессии"""
+        try:
+            inactive_time = datetime.utcnow() - timedelta(hours=hours)
+            return await self._get_sessions(
+                OperatorSession.status == 'in_progress',
+                OperatorSession.last_activity < inactive_time
+            )
+        except Exception as e:
+            logger.error(f"Error get_inactive_sessions: {e}")
+            return []
+
+    async def get_in_progress_sessions(self):
+        """Получить сессии в процессе"""
+        try:
+            return await self._get_sessions(
+                OperatorSession.status == 'in_progress',
+                order_by=OperatorSession.updated_at.desc()
+            )
+        except Exception as e:
+            logger.error(f"Error get_in_progress_sessions: {e}")
+            return []
+
+    async def add_subscriber(self, user_id: int, username: str = None) -> bool:
+        """Добавление нового подписчика"""
+        async def work(session):
+            subscriber = await session.scalar(
+                select(Subscriber).filter_by(user_id=user_id).limit(1)
+            )
             if subscriber:
-                subscriber.is_active = False
-                self.session.commit()
-                logger.info(f"User {user_id} unsubscribed successfully")
-                return True
-            
+                if not subscriber.is_active:
+                    await session.execute(_counter_delta(SUBSCRIBERS_ACTIVE, 1))
+                subscriber.is_active = True
+                subscriber.username = username
+            else:
+                session.add(Subscriber(
+                    user_id=user_id,
+                    username=username,
+                    is_active=True
+                ))
+                await session.execute(_counter_delta(SUBSCRIBERS_TOTAL, 1))
+                await session.execute(_counter_delta(SUBSCRIBERS_ACTIVE, 1))
+
+        try:
+            await self.run_in_session(work)
+            subscription_cache.set(user_id, True, publish=True)
+            return True
+        except Exception as e:
+            logger.error(f"Error adding subscriber: {e}")
             return False
+
+    async def check_subscription(self, user_id: int) -> bool:
+        """Проверка подписки пользователя (сначала по кэшу)"""
+        cached = subscription_cache.get(user_id)
+        if cached is not None:
+            return cached
+        # Версия до чтения: запись, завершившаяся во время чтения, не будет затерта
+        version = subscription_cache.version(user_id)
+
+        async def work(session):
+            return await session.scalar(
+                select(Subscriber.id).filter_by(user_id=user_id, is_active=True).limit(1)
+            ) is not None
+
+        try:
+            is_subscribed = await self.run_in_session(work)
+            subscription_cache.fill(user_id, is_subscribed, version)
+            return is_subscribed
+        except Exception as e:
+            logger.error(f"Error checking subscription: {e}")
+            return False
+
+    async def get_active_subscribers(self):
+        """Получить список активных подписчиков"""
+        async def work(session):
+            return (await session.scalars(
+                select(Subscriber).filter_by(is_active=True)
+            )).all()
+
+        try:
+            subscribers = await self.run_in_session(work)
+            logger.info(f"Found {len(subscribers)} active subscribers")
+            return subscribers
+        except Exception as e:
+            logger.error(f"Error getting active subscribers: {e}")
+            return []
+
+    async def iter_active_subscriber_ids(self, chunk_size: int = BROADCAST_CHUNK_SIZE):
+        """
+        Потоково выдать user_id активных подписчиков пачками по chunk_size.
+        Keyset-пагинация по Subscriber.id: каждая пачка - отдельный короткий запрос,
+        в памяти не больше одной пачки.
+        """
+        last_id = 0
+        while True:
+            stmt = (
+                select(Subscriber.id, Subscriber.user_id)
+                .where(Subscriber.is_active == True, Subscriber.id > last_id)  # noqa: E712
+                .order_by(Subscriber.id)
+                .limit(chunk_size)
+            )
+
+            async def work(session):
+                return (await session.execute(stmt)).all()
+
+            try:
+                rows = await self.run_in_session(work)
+            except Exception as e:
+                logger.error(f"Error iterating active subscribers after id {last_id}: {e}")
+                return
+            if not rows:
+                return
+            last_id = rows[-1][0]
+            yield [user_id for _, user_id in rows]
+            if len(rows) < chunk_size:
+                return
+
+    async def _get_counter(self, name: str) -> int:
+        """Значение счетчика; если его еще нет, считаем по таблице"""
+        async def work(session):
+            value = await session.scalar(_counter_value(name))
+            if value is None:
+                value = await session.scalar(_subscriber_counts()[name])
+            return value
+
+        return await self.run_in_session(work)
+
+    async def get_subscribers_count(self):
+        """Получить общее количество подписчиков"""
+        try:
+            return await self._get_counter(SUBSCRIBERS_TOTAL)
+        except Exception as e:
+            logger.error(f"Error getting subscribers count: {e}")
+            return 0
+
+    async def get_active_subscribers_count(self):
+        """Получить количество активных подписчиков"""
+        try:
+            return await self._get_counter(SUBSCRIBERS_ACTIVE)
+        except Exception as e:
+            logger.error(f"Error getting active subscribers count: {e}")
+            return 0
+
+    async def reconcile_counters(self) -> dict:
+        """
+        Сверить счетчики с реальным COUNT(*) и исправить расхождения.
+        Returns: {имя: (было, стало)} для исправленных счетчиков
+        """
+        async def work(session):
+            drift = {}
+            for name, count_query in _subscriber_counts().items():
+                actual = await session.scalar(count_query)
+                stored = await session.scalar(_counter_value(name))
+                if stored != actual:
+                    await session.merge(Counter(name=name, value=actual))
+                    drift[name] = (stored, actual)
+            return drift
+
+        try:
+            drift = await self.run_in_session(work)
+            if drift:
+                logger.warning(f"Counters reconciled: {drift}")
+            return drift
+        except Exception as e:
+            logger.error(f"Error reconciling counters: {e}")
+            return {}
+
+    async def unsubscribe(self, user_id: int) -> bool:
+        """Отписка пользователя от рассылки"""
+        async def work(session):
+            subscriber = await session.scalar(
+                select(Subscriber).filter_by(user_id=user_id).limit(1)
+            )
+            if not subscriber:
+                return False
+            if subscriber.is_active:
+                await session.execute(_counter_delta(SUBSCRIBERS_ACTIVE, -1))
+            subscriber.is_active = False
+            return True
+
+        try:
+            if not await self.run_in_session(work):
+                return False
+            subscription_cache.set(user_id, False, publish=True)
+            logger.info(f"User {user_id} unsubscribed successfully")
+            return True
         except Exception as e:
             logger.error(f"Error unsubscribing user {user_id}: {e}")
-            self.session.rollback()
             return False
 
 def save_interaction(user_id: int, message: str, response: str = None,
                     message_type: str = "text", success: bool = True):
     """
     Сохранение диалога (пользователь -> бот / бот -> пользователь).
+    Использует общий для процесса DatabaseManager.
+    """
+    try:
+        get_db_manager(DATABASE_URL).save_interaction(
+            user_id=user_id,
+            message=message,
+            response=response,
+            message_type=message_type,
+            success=success
+        )
+    except Exception as e:
+        logger.error(f"Error saving interaction: {e}")
+
+
+async def asave_interaction(user_id: int, message: str, response: str = None,
+                            message_type: str = "text", success: bool = True):
+    """
+    Асинхронный вариант save_interaction для хендлеров: строка ставится
+    в очередь writer'а без блокировки event loop.
     """
     try:
-        db = DatabaseManager(DATABASE_URL)
-        db.save_interaction(
+        await get_db_manager(DATABASE_URL).writer.aput(
             user_id=user_id,
             message=message,
             response=response,
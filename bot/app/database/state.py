@@ -0,0 +1,308 @@
+# app/database/state.py
+"""
+Хранилища состояния основного бота: история диалогов ChatManager,
+флаги ожидания ввода (BotHandlers.code_context) и окна rate_limit.
+
+По умолчанию состояние живёт в памяти процесса. STATE_BACKEND=redis
+выносит его в Redis (REDIS_URL), и тогда основной бот можно запускать
+несколькими воркерами. Обычная операция Redis-хранилищ — один конвейер
+(pipeline), т.е. один сетевой обмен. Второй обмен нужен в двух случаях:
+восстановление пустой истории из БД и откат счётчика отклонённого
+запроса в rate_limit.
+"""
+import json
+import logging
+import threading
+import time
+from collections import OrderedDict
+from typing import List, Optional
+
+from app.ai.conversation import ConversationStore, Message, load_history
+from app.database.cache import TTLCache
+from app.config import (
+    REDIS_URL,
+    STATE_BACKEND,
+    STATE_REDIS_PREFIX,
+    STATE_FLAG_TTL,
+    RATE_LIMIT_MAX_KEYS,
+    RATE_LIMIT_SWEEP_INTERVAL,
+    CONVERSATION_HISTORY_SIZE,
+    CONVERSATION_MAX_USERS,
+    CONVERSATION_TTL,
+)
+
+logger = logging.getLogger(__name__)
+
+
+# ----- В памяти процесса -----
+
+class MemoryFlagStore:
+    """Флаги пользователя с временем жизни (например, ожидание ввода кода)"""
+
+    def __init__(self, ttl: float = STATE_FLAG_TTL, maxsize: int = CONVERSATION_MAX_USERS):
+        self.cache = TTLCache(maxsize, ttl)
+
+    async def get(self, user_id: int) -> bool:
+        return self.cache.get(user_id, False)
+
+    async def set(self, user_id: int):
+        self.cache.set(user_id, True)
+
+    async def pop(self, user_id: int):
+        self.cache.pop(user_id)
+
+
+def window_estimate(previous: int, current: int, now: float, period: float) -> float:
+    """
+    Оценка числа запросов за последние period секунд по счётчикам
+    текущего и предыдущего окна (sliding window counter).
+    """
+    weight = 1 - (now % period) / period
+    return previous * weight + current
+
+
+class RateWindow:
+    """Счётчики скользящего окна одного ключа (без __dict__)"""
+    __slots__ = ('window', 'previous', 'current', 'expires')
+
+    def __init__(self, window: int):
+        self.window = window
+        self.previous = 0
+        self.current = 0
+        self.expires = 0.0
+
+
+class MemoryRateLimitStore:
+    """
+    Скользящее окно запросов: не больше limit запросов за period секунд.
+    Проверка за O(1), на ключ - два счётчика. Неактивные ключи удаляются
+    раз в sweep_interval, число ключей ограничено max_keys (LRU).
+    """
+
+    def __init__(self, max_keys: int = RATE_LIMIT_MAX_KEYS,
+                 sweep_interval: float = RATE_LIMIT_SWEEP_INTERVAL):
+        self.max_keys = max_keys
+        self.sweep_interval = sweep_interval
+        self._windows = OrderedDict()
+        self._lock = threading.Lock()
+        self._next_sweep = time.monotonic() + sweep_interval
+
+    def __len__(self) -> int:
+        return len(self._windows)
+
+    def _sweep(self, now: float):
+        """Удалить ключи, у которых истекли оба окна"""
+        for key in [k for k, w in self._windows.items() if w.expires <= now]:
+            del self._windows[key]
+        self._next_sweep = now + self.sweep_interval
+
+    async def hit(self, key: str, limit: int, period: float, cost: int = 1) -> bool:
+        """Учесть запрос стоимостью cost; Returns: False, если лимит превышен"""
+        now = time.monotonic()
+        index = int(now // period)
+        with self._lock:
+            if now >= self._next_sweep:
+                self._sweep(now)
+            state = self._windows.get(key)
+            if state is None:
+                state = RateWindow(index)
+                self._windows[key] = state
+                if len(self._windows) > self.max_keys:
+                    self._windows.popitem(last=False)
+            else:
+                self._windows.move_to_end(key)
+                if state.window != index:
+                    state.previous = state.current if state.window == index - 1 else 0
+                    state.current = 0
+                    state.window = index
+            if window_estimate(state.previous, state.current, now, period) + cost > limit:
+                return False
+            state.current += cost
+            state.expires = (index + 2) * period
+            return True
+
+
+class MemoryStateBackend:
+    """Состояние в памяти одного процесса (значение по умолчанию)"""
+
+    def __init__(self):
+        self._rate_limits = MemoryRateLimitStore()
+
+    def conversations(self, db_manager=None) -> ConversationStore:
+        return ConversationStore(db_manager)
+
+    def flags(self, name: str, ttl: float = STATE_FLAG_TTL) -> MemoryFlagStore:
+        return MemoryFlagStore(ttl)
+
+    def rate_limits(self) -> MemoryRateLimitStore:
+        return self._rate_limits
+
+
+# ----- Redis -----
+
+class RedisConversationStore:
+    """
+    История диалогов в Redis: список из history_size последних сообщений
+    на пользователя с TTL. Пустая история восстанавливается из interactions
+    (отдельным конвейером после запроса к БД).
+    Интерфейс совпадает с ConversationStore: синхронный клиент, методы
+    вызываются только из потоков ChatManager, не из event loop.
+    """
+
+    def __init__(self, client, db_manager=None, prefix: str = STATE_REDIS_PREFIX,
+                 history_size: int = CONVERSATION_HISTORY_SIZE, ttl: int = CONVERSATION_TTL):
+        self.client = client
+        self.db_manager = db_manager
+        self.prefix = f"{prefix}conversation:"
+        self.history_size = history_size
+        self.ttl = ttl
+
+    def _key(self, user_id: int) -> str:
+        return f"{self.prefix}{user_id}"
+
+    @staticmethod
+    def _dump(message: Message) -> str:
+        return json.dumps([message.role, message.content, message.tokens], ensure_ascii=False)
+
+    @staticmethod
+    def _load(raw) -> Message:
+        # Записи старого формата - без числа токенов
+        return Message(*json.loads(raw))
+
+    def _rehydrate(self, user_id: int) -> List[Message]:
+        """Дописать историю из БД в начало списка (новые сообщения остаются в конце)"""
+        messages = load_history(self.db_manager, user_id, self.history_size)
+        if messages:
+            key = self._key(user_id)
+            pipe = self.client.pipeline()
+            pipe.lpush(key, *[self._dump(m) for m in reversed(messages)])
+            pipe.ltrim(key, -self.history_size, -1)
+            pipe.expire(key, self.ttl)
+            pipe.execute()
+        return messages
+
+    def append(self, user_id: int, content: str, role: str = "user", tokens: Optional[int] = None):
+        """Добавить сообщение в историю пользователя"""
+        key = self._key(user_id)
+        pipe = self.client.pipeline()
+        pipe.rpush(key, self._dump(Message(role, content, tokens)))
+        pipe.ltrim(key, -self.history_size, -1)
+        pipe.expire(key, self.ttl)
+        length = pipe.execute()[0]
+        if length == 1:
+            # Истории не было (первое сообщение или истёк TTL)
+            self._rehydrate(user_id)
+
+    def get(self, user_id: int, limit: int = None) -> List[Message]:
+        """Последние limit сообщений пользователя (все, если limit не задан)"""
+        pipe = self.client.pipeline()
+        pipe.lrange(self._key(user_id), -(limit or self.history_size), -1)
+        pipe.expire(self._key(user_id), self.ttl)
+        raw, _ = pipe.execute()
+        if not raw:
+            messages = self._rehydrate(user_id)
+            return messages[-limit:] if limit else messages
+        return [self._load(item) for item in raw]
+
+    def clear(self, user_id: int):
+        """Удалить историю пользователя из Redis"""
+        self.client.delete(self._key(user_id))
+
+
+class RedisFlagStore:
+    """Флаги пользователя в Redis (ключ с TTL на каждого пользователя)"""
+
+    def __init__(self, client, name: str, prefix: str = STATE_REDIS_PREFIX,
+                 ttl: float = STATE_FLAG_TTL):
+        self.client = client
+        self.prefix = f"{prefix}{name}:"
+        self.ttl = int(ttl)
+
+    async def get(self, user_id: int) -> bool:
+        return bool(await self.client.exists(f"{self.prefix}{user_id}"))
+
+    async def set(self, user_id: int):
+        await self.client.set(f"{self.prefix}{user_id}", 1, ex=self.ttl)
+
+    async def pop(self, user_id: int):
+        await self.client.delete(f"{self.prefix}{user_id}")
+
+
+class RedisRateLimitStore:
+    """
+    Скользящее окно запросов в Redis (счётчики текущего и предыдущего окна).
+    Счётчик увеличивается в том же конвейере, что и чтение окна; отклонённый
+    запрос откатывает его отдельной командой (только при превышении лимита).
+    """
+
+    def __init__(self, client, prefix: str = STATE_REDIS_PREFIX):
+        self.client = client
+        self.prefix = f"{prefix}ratelimit:"
+
+    async def hit(self, key: str, limit: int, period: float, cost: int = 1) -> bool:
+        """Учесть запрос стоимостью cost; Returns: False, если лимит превышен"""
+        now = time.time()
+        index = int(now // period)
+        current_key = f"{self.prefix}{key}:{index}"
+        pipe = self.client.pipeline()
+        pipe.get(f"{self.prefix}{key}:{index - 1}")
+        pipe.incrby(current_key, cost)
+        pipe.expire(current_key, int(2 * period) + 1)
+        previous, current, _ = await pipe.execute()
+        if window_estimate(int(previous or 0), current - cost, now, period) + cost > limit:
+            # Отклонённый запрос не занимает место в окне
+            await self.client.decrby(current_key, cost)
+            return False
+        return True
+
+
+class RedisStateBackend:
+    """
+    Состояние в Redis, общее для всех воркеров основного бота.
+    client / async_client можно передать явно (например, fakeredis).
+    """
+
+    def __init__(self, url: str = REDIS_URL, client=None, async_client=None,
+                 prefix: str = STATE_REDIS_PREFIX):
+        if client is None or async_client is None:
+            import redis
+            import redis.asyncio
+            client = client or redis.Redis.from_url(url)
+            async_client = async_client or redis.asyncio.Redis.from_url(url)
+        self.client = client
+        self.async_client = async_client
+        self.prefix = prefix
+        self._rate_limits = RedisRateLimitStore(async_client, prefix)
+
+    def conversations(self, db_manager=None) -> RedisConversationStore:
+        return RedisConversationStore(self.client, db_manager, self.prefix)
+
+    def flags(self, name: str, ttl: float = STATE_FLAG_TTL) -> RedisFlagStore:
+        return RedisFlagStore(self.async_client, name, self.prefix, ttl)
+
+    def rate_limits(self) -> RedisRateLimitStore:
+        return self._rate_limits
+
+
+_backend = None
+_backend_lock = threading.Lock()
+
+
+def get_state_backend():
+    """Бэкенд состояния процесса (по STATE_BACKEND: memory или redis)"""
+    global _backend
+    with _backend_lock:
+        if _backend is None:
+            if STATE_BACKEND == 'redis':
+                _backend = RedisStateBackend()
+            else:
+                _backend = MemoryStateBackend()
+            logger.info(f"State backend: {type(_backend).__name__}")
+        return _backend
+
+
+def set_state_backend(backend: Optional[object]):
+    """Подменить бэкенд состояния (None — выбрать заново по настройкам)"""
+    global _backend
+    with _backend_lock:
+        _backend = backend
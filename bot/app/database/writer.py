@@ -0,0 +1,200 @@
+# app/database/writer.py
+import asyncio
+import atexit
+import logging
+import queue
+import threading
+import time
+from datetime import datetime
+
+from sqlalchemy import insert
+
+from app.database.models import Interaction
+from app.database.concurrency import lock_retry_delay, should_retry
+from app.config import (
+    INTERACTION_BATCH_SIZE,
+    INTERACTION_FLUSH_INTERVAL_MS,
+    INTERACTION_QUEUE_MAXSIZE,
+    INTERACTION_PUT_TIMEOUT,
+)
+
+logger = logging.getLogger(__name__)
+
+_STOP = object()
+
+_writers_lock = threading.Lock()
+_writers = {}
+
+
+class InteractionWriter:
+    """
+    Отложенная запись Interaction (write-behind).
+    Строки копятся в ограниченной очереди и пишутся фоновым потоком
+    одной транзакцией на каждые batch_size строк или flush_interval_ms.
+    """
+
+    def __init__(self, engine, batch_size: int = INTERACTION_BATCH_SIZE,
+                 flush_interval_ms: int = INTERACTION_FLUSH_INTERVAL_MS,
+                 maxsize: int = INTERACTION_QUEUE_MAXSIZE,
+                 put_timeout: float = INTERACTION_PUT_TIMEOUT):
+        self.engine = engine
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval_ms / 1000
+        self.put_timeout = put_timeout
+        self.queue = queue.Queue(maxsize=maxsize)
+        self.flushed = 0
+        self.batches = 0
+        self._closed = False
+        self._thread = threading.Thread(
+            target=self._run, name="interaction-writer", daemon=True
+        )
+        self._thread.start()
+
+    @staticmethod
+    def _row(user_id: int, message: str, response: str = None,
+             message_type: str = "text", success: bool = True) -> dict:
+        # Время фиксируем при постановке в очередь, а не при записи
+        return {
+            'user_id': user_id,
+            'message': message,
+            'response': response,
+            'message_type': message_type,
+            'success': success,
+            'created_at': datetime.utcnow(),
+        }
+
+    def put(self, user_id: int, message: str, response: str = None,
+            message_type: str = "text", success: bool = True):
+        """
+        Поставить строку в очередь. Если очередь заполнена, ждем до put_timeout
+        (backpressure), после чего пишем строку синхронно, чтобы не потерять её.
+        """
+        self._put_row(self._row(user_id, message, response, message_type, success))
+
+    async def aput(self, user_id: int, message: str, response: str = None,
+                   message_type: str = "text", success: bool = True):
+        """Асинхронный put: при заполненной очереди ждет в потоке, не блокируя event loop"""
+        row = self._row(user_id, message, response, message_type, success)
+        try:
+            if self._closed:
+                raise queue.Full
+            self.queue.put_nowait(row)
+        except queue.Full:
+            await asyncio.to_thread(self._put_row, row)
+            return
+        self._after_put()
+
+    def _put_row(self, row: dict):
+        if self._closed:
+            # Writer остановлен - пишем сразу
+            self._write([row])
+            return
+        try:
+            self.queue.put(row, timeout=self.put_timeout)
+        except queue.Full:
+            logger.warning("Interaction queue is full, writing synchronously")
+            self._write([row])
+            return
+        self._after_put()
+
+    def _after_put(self):
+        # close() мог завершить последний проход по очереди между проверкой
+        # _closed и постановкой строки: тогда дописываем очередь сами.
+        # _closed выставляется до последнего прохода, поэтому строка не теряется
+        if self._closed:
+            self._flush_remaining()
+
+    def _write(self, rows: list):
+        """Записать пачку строк одной транзакцией (с повтором при блокировке БД)"""
+        attempt = 0
+        while True:
+            try:
+                with self.engine.begin() as conn:
+                    conn.execute(insert(Interaction), rows)
+                self.flushed += len(rows)
+                self.batches += 1
+                return
+            except Exception as e:
+                if not should_retry(e, attempt):
+                    if len(rows) > 1:
+                        # Одна плохая строка не должна терять всю пачку
+                        logger.warning(f"Error writing {len(rows)} interactions, writing one by one: {e}")
+                        for row in rows:
+                            self._write([row])
+                    else:
+                        logger.error(f"Error writing interaction of user {rows[0]['user_id']}: {e}")
+                    return
+                time.sleep(lock_retry_delay(attempt))
+                attempt += 1
+
+    def _run(self):
+        stopping = False
+        while not stopping:
+            item = self.queue.get()
+            if item is _STOP:
+                break
+            rows = [item]
+            deadline = time.monotonic() + self.flush_interval
+            while len(rows) < self.batch_size:
+                timeout = deadline - time.monotonic()
+                if timeout <= 0:
+                    break
+                try:
+                    item = self.queue.get(timeout=timeout)
+                except queue.Empty:
+                    break
+                if item is _STOP:
+                    stopping = True
+                    break
+                rows.append(item)
+            self._write(rows)
+
+        # Дописываем всё, что осталось в очереди после сигнала остановки
+        self._flush_remaining()
+
+    def _flush_remaining(self):
+        rows = []
+        while True:
+            try:
+                item = self.queue.get_nowait()
+            except queue.Empty:
+                break
+            if item is not _STOP:
+                rows.append(item)
+        for i in range(0, len(rows), self.batch_size):
+            self._write(rows[i:i + self.batch_size])
+
+    def close(self, timeout: float = None):
+        """Остановить поток, дописав все строки из очереди"""
+        if self._closed:
+            return
+        self._closed = True
+        self.queue.put(_STOP)
+        self._thread.join(timeout)
+        # Строки, успевшие попасть в очередь во время остановки
+        self._flush_remaining()
+        logger.info(
+            f"Interaction writer stopped: {self.flushed} rows in {self.batches} transactions"
+        )
+
+
+def get_interaction_writer(engine) -> InteractionWriter:
+    """Получить общий для процесса writer для движка"""
+    with _writers_lock:
+        writer = _writers.get(id(engine))
+        if writer is None:
+            writer = InteractionWriter(engine)
+            _writers[id(engine)] = writer
+        return writer
+
+
+def close_interaction_writers():
+    """Дописать очереди всех writer'ов (при остановке процесса)"""
+    with _writers_lock:
+        writers = list(_writers.values())
+        _writers.clear()
+    for writer in writers:
+        writer.close()
+
+
+atexit.register(close_interaction_writers)
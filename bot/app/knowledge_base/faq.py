@@ -1,74 +1,39 @@
 # knowledge_base/faq.py
+import logging
+import os
+import threading
+import time
+from functools import lru_cache
 from typing import Optional, Dict, List
 
+from app.config import KNOWLEDGE_BASE_PATH, KNOWLEDGE_BASE_RELOAD_INTERVAL, PROMPT_REFERENCE_THRESHOLD
+from app.knowledge_base.loader import KnowledgeBase, load_knowledge_base
+from app.knowledge_base.matcher import KnowledgeMatch
+
+logger = logging.getLogger(__name__)
+
+
 class FAQ:
-    def __init__(self):
+    def __init__(self, path: str = KNOWLEDGE_BASE_PATH):
         """Инициализация базы знаний"""
-        self.faq_data = {
-            'доставка': {
-                'keywords': ['доставка', 'курьер', 'домой', 'получить заказ'],
-                'response': ("У нас имеется сервис «доставка до двери», чтобы оставить заявку:\n"
-                           "1. Перейдите в раздел «Заказы»\n"
-                           "2. Выберите «Прибыл в пункт выдачи»\n"
-                           "3. Поставьте галочку «доставка до двери»\n"
-                           "4. Заполните адрес и оплатите")
-            },
-            'график': {
-                'keywords': ['график', 'работаете', 'время работы', 'до скольки'],
-                'response': ("График работы складов:\n"
-                           "Уточнить график: 87055188988")
-            },
-            'возврат': {
-                'keywords': ['возврат', 'вернуть', 'брак', 'недостача', 'возместить'],
-                'response': ("Варианты возврата:\n"
-                           "- Брак товара\n"
-                           "- Товар поврежден\n"
-                           "- Несоответствие описанию\n"
-                           "- Неверный размер/цвет\n"
-                           "- Недостача\n\n")
-            },
-            'поступление': {
-                'keywords': ['поступили', 'пришли', 'поступление', 'где товар', 'где мой товар', 'где заказ', 'пришел ли'],
-                'response': ("Поступившие товары смотрите в нашем мобильном приложении в разделе "
-                           "«Заказы» - «Прибыл в пункт выдачи». Если в этом статусе есть товары, "
-                           "значит ваш заказ поступил и его можно забрать из пункта выдачи.")
-            },
-            'карта': {
-                'keywords': ['карта', 'банковская карта', 'срок карты', 'поменять карту', 'новая карта'],
-                'response': ("Если срок действия банковской карты истек, необходимо добавить новую карту в Pinduoduo.\n")
-            },
-            'неизвестные_товары': {
-                'keywords': ['неизвестные товары', 'неизвестный товар', 'попал в неизвестные'],
-                'response': ("Если товар попал в неизвестные, это значит, что магазин неправильно напечатал ID код "
-                           "или он стерся при транспортировке. Не волнуйтесь - мы получили ваш товар и знаем, что он ваш, "
-                           "просто он временно не отображается в списке. Вы сможете получить его в пункте выдачи, "
-                           "наш менеджер свяжется с вами, как только товар поступит.")
-            },
-            'другой_пользователь': {
-                'keywords': ['другой пользователь', 'добавлен другим', 'чужой пользователь'],
-                'response': ("Если товар добавлен другим пользователем, это означает, что при сканировании "
-                           "на складе в Китае произошла ошибка. Пожалуйста:\n"
-                           "1. Напишите нам трек-код\n"
-                           "2. Отправьте фото товара\n"
-                           "Наши менеджеры исправят ошибку, и товар будет выдан вам согласно трек-коду. "
-                           "Менеджер свяжется с вами, как только получит товар.")
-            },
-            'недостача': {
-                'keywords': ['недостача', 'не хватает', 'неполная поставка', 'недостаточно'],
-                'response': ("Если в посылке не хватает товара:\n"
-                           "1. Свяжитесь с магазином в маркетплейсе\n"
-                           "2. Сообщите о недостаче\n"
-                           "3. Оставьте заявку на дополнительную отправку или возврат денег\n\n")
-            },
-            'неправильный_заказ': {
-                'keywords': ['неправильный заказ', 'не тот товар', 'ошибка в заказе', 'неверный товар'],
-                'response': ("Если вы получили неправильный товар или его качество не соответствует описанию:\n"
-                           "1. Свяжитесь с магазином в маркетплейсе\n"
-                           "2. Опишите проблему\n"
-                           "3. Оставьте заявку на возврат денег\n\n")
-            }
-        }
-    
+        self.path = path
+        # Текущий снимок базы знаний; при перезагрузке подменяется целиком
+        self.kb: KnowledgeBase = load_knowledge_base(path)
+        # Версия базы знаний: растет при каждой перезагрузке (сбрасывает кэш ответов)
+        self.version = 1
+        self._reload_lock = threading.Lock()
+        self._watcher = None
+        # mtime файла, который не удалось загрузить (не повторяем ошибку на каждой проверке)
+        self._failed_mtime = None
+
+    @property
+    def faq_data(self) -> Dict[str, dict]:
+        return self.kb.faq_data
+
+    def match(self, message: str) -> KnowledgeMatch:
+        """Все категории FAQ и темы, найденные в сообщении за один проход"""
+        return self.kb.matcher.match(message)
+
     def get_response(self, message: str) -> Optional[str]:
         """
         Поиск ответа на вопрос пользователя
@@ -77,18 +42,80 @@ class FAQ:
         Returns:
             str: ответ из базы знаний или None если ответ не найден
         """
-        message = message.lower()
-        
-        # Проверяем каждую категорию
-        for category in self.faq_data.values():
-            if any(keyword in message for keyword in category['keywords']):
-                return category['response']
-        
+        kb = self.kb
+        category = kb.faq_category(message, kb.matcher.match(message))
+        if category:
+            return kb.faq_data[category]['response']
+
+        return None
+
+    def get_reference(self, message: str, threshold: float = PROMPT_REFERENCE_THRESHOLD) -> Optional[str]:
+        """
+        Ответ ближайшей записи FAQ как справка для промпта модели.
+        Порог ниже, чем для прямого ответа: модель сама решает, подходит ли справка
+        """
+        kb = self.kb
+        if kb.retriever is None:
+            return None
+        results = kb.retriever.search(message, top=1)
+        if results and results[0][1] >= threshold:
+            return kb.faq_data[results[0][0]]['response']
         return None
-    
+
     def get_faq_list(self) -> str:
         """Получение списка частых вопросов"""
         faq_list = "Частые вопросы:\n\n"
         for i, (topic, data) in enumerate(self.faq_data.items(), 1):
             faq_list += f"{i}. {topic.capitalize()}\n"
-        return faq_list
\ No newline at end of file
+        return faq_list
+
+    def reload(self) -> bool:
+        """
+        Перечитать файл базы знаний и атомарно подменить снимок.
+        При ошибке в файле остается прежняя версия.
+        """
+        with self._reload_lock:
+            try:
+                kb = load_knowledge_base(self.path)
+            except Exception as e:
+                logger.error(f"Error reloading knowledge base from {self.path}: {e}")
+                return False
+            self.kb = kb
+            self.version += 1
+            logger.info(f"Knowledge base reloaded: file version {kb.version}")
+            return True
+
+    def reload_if_changed(self) -> bool:
+        """Перезагрузить базу знаний, если файл изменился"""
+        try:
+            mtime = os.stat(self.path).st_mtime
+        except OSError as e:
+            logger.error(f"Error checking knowledge base file: {e}")
+            return False
+        if mtime in (self.kb.mtime, self._failed_mtime):
+            return False
+        if not self.reload():
+            self._failed_mtime = mtime
+            return False
+        return True
+
+    def start_watcher(self, interval: float = KNOWLEDGE_BASE_RELOAD_INTERVAL):
+        """Следить за файлом базы знаний в фоновом потоке"""
+        if interval <= 0 or self._watcher is not None:
+            return
+
+        def watch():
+            while True:
+                time.sleep(interval)
+                self.reload_if_changed()
+
+        self._watcher = threading.Thread(target=watch, name="knowledge-base-watcher", daemon=True)
+        self._watcher.start()
+
+
+@lru_cache(maxsize=1)
+def get_faq() -> FAQ:
+    """Общий для процесса экземпляр базы знаний"""
+    faq = FAQ()
+    faq.start_watcher()
+    return faq
@@ -0,0 +1,73 @@
+# knowledge_base/intent.py
+"""
+Определение намерения пользователя.
+
+Сообщение нормализуется и классифицируется ровно один раз; результат
+(Intent) передаётся дальше в ChatManager и SilkwayAI вместо повторных
+проверок FAQ и тем на каждом шаге.
+"""
+import re
+from dataclasses import dataclass
+from typing import Optional
+
+from app.knowledge_base.faq import FAQ, get_faq
+from app.knowledge_base.matcher import KnowledgeMatch
+
+
+_PUNCTUATION = re.compile(r'[^\w\s]+')
+
+
+def normalize_text(text: str) -> str:
+    """Нижний регистр и одиночные пробелы"""
+    return ' '.join(text.lower().split())
+
+
+def normalize_query(text: str) -> str:
+    """
+    Как normalize_text, но без знаков препинания. По этой строке сообщение
+    классифицируется, и она же - ключ кэша ответов: ответ из кэша
+    должен зависеть только от ключа.
+    """
+    return ' '.join(_PUNCTUATION.sub(' ', text.lower()).split())
+
+
+@dataclass
+class Intent:
+    """Результат классификации сообщения"""
+    text: str
+    normalized: str
+    match: KnowledgeMatch
+    faq_category: Optional[str] = None
+    faq_response: Optional[str] = None
+
+    @property
+    def topic(self) -> Optional[str]:
+        """Первая найденная тема (в порядке объявления)"""
+        return self.match.topics[0] if self.match.topics else None
+
+    @property
+    def allowed(self) -> bool:
+        """Вопрос относится к FAQ или к разрешенным темам"""
+        return bool(self.faq_category or self.match.topics)
+
+    @property
+    def needs_operator(self) -> bool:
+        return not self.allowed
+
+
+class IntentResolver:
+    """Классификация сообщений по общей базе знаний"""
+
+    def __init__(self, faq: FAQ = None):
+        self.faq = faq or get_faq()
+
+    def resolve(self, text: str) -> Intent:
+        normalized = normalize_query(text)
+        # Один снимок базы знаний на всю классификацию (она может перезагружаться)
+        kb = self.faq.kb
+        match = kb.matcher.match(normalized)
+        intent = Intent(text=text, normalized=normalized, match=match)
+        intent.faq_category = kb.faq_category(normalized, match)
+        if intent.faq_category:
+            intent.faq_response = kb.faq_data[intent.faq_category]['response']
+        return intent
@@ -0,0 +1,85 @@
+# knowledge_base/loader.py
+"""
+Загрузка базы знаний из knowledge.json.
+
+Файл содержит ответы FAQ, темы и их ключевые слова, ответы по темам
+и ответы на кнопки меню. При загрузке он проверяется и компилируется
+в неизменяемый снимок KnowledgeBase (с готовым матчером и индексом
+BM25), который FAQ атомарно подменяет при перезагрузке.
+"""
+import json
+import os
+from dataclasses import dataclass
+from typing import Dict, List, Optional
+
+from app.config import KNOWLEDGE_BASE_PATH, FAQ_RETRIEVAL_MODE
+from app.knowledge_base.matcher import KnowledgeMatch, KnowledgeMatcher
+from app.knowledge_base.retrieval import BM25Index, build_faq_index
+
+
+@dataclass(frozen=True)
+class KnowledgeBase:
+    """Скомпилированный снимок базы знаний"""
+    version: int
+    faq_data: Dict[str, dict]
+    topic_keywords: Dict[str, List[str]]
+    topic_responses: Dict[str, str]
+    prompt_topics: List[str]
+    callback_responses: Dict[str, str]
+    matcher: KnowledgeMatcher
+    retriever: Optional[BM25Index]
+    path: str
+    mtime: float
+
+    def faq_category(self, text: str, match: KnowledgeMatch) -> Optional[str]:
+        """
+        Категория FAQ для сообщения: лучшая запись BM25 с достаточной
+        уверенностью, иначе первая категория по ключевым словам.
+        """
+        if self.retriever is not None:
+            category = self.retriever.best(text)
+            if category:
+                return category
+        return match.faq_categories[0] if match.faq_categories else None
+
+
+def _validate(data: dict):
+    """Проверить структуру файла; ValueError с описанием ошибки"""
+    if not isinstance(data.get('version'), int):
+        raise ValueError("'version' must be an integer")
+    for category, entry in data.get('faq', {}).items():
+        if not isinstance(entry.get('keywords'), list) or not isinstance(entry.get('response'), str):
+            raise ValueError(f"faq '{category}' must have 'keywords' list and 'response' string")
+    for topic, keywords in data.get('topics', {}).items():
+        if not isinstance(keywords, list):
+            raise ValueError(f"topic '{topic}' keywords must be a list")
+    for section in ('topic_responses', 'callback_responses'):
+        for key, value in data.get(section, {}).items():
+            if not isinstance(value, str):
+                raise ValueError(f"{section} '{key}' must be a string")
+    if not isinstance(data.get('prompt_topics', []), list):
+        raise ValueError("'prompt_topics' must be a list")
+
+
+def load_knowledge_base(path: str = KNOWLEDGE_BASE_PATH) -> KnowledgeBase:
+    """Прочитать, проверить и скомпилировать базу знаний из файла"""
+    mtime = os.stat(path).st_mtime
+    with open(path, encoding='utf-8') as f:
+        data = json.load(f)
+    _validate(data)
+
+    faq_data = data.get('faq', {})
+    topic_keywords = data.get('topics', {})
+    prompt_topics = data.get('prompt_topics', [])
+    return KnowledgeBase(
+        version=data['version'],
+        faq_data=faq_data,
+        topic_keywords=topic_keywords,
+        topic_responses=data.get('topic_responses', {}),
+        prompt_topics=prompt_topics,
+        callback_responses=data.get('callback_responses', {}),
+        matcher=KnowledgeMatcher(faq_data, topic_keywords, prompt_topics),
+        retriever=build_faq_index(faq_data) if FAQ_RETRIEVAL_MODE == 'bm25' else None,
+        path=str(path),
+        mtime=mtime,
+    )
@@ -0,0 +1,107 @@
+# knowledge_base/matcher.py
+"""
+Поиск ключевых слов базы знаний за один проход по сообщению.
+
+Все ключевые слова FAQ, тем SilkwayAI и тем промпта (prompt_topics)
+компилируются в один автомат Ахо-Корасик, поэтому стоимость поиска
+пропорциональна длине сообщения, а не числу ключевых слов.
+"""
+from dataclasses import dataclass, field
+from typing import Dict, List
+
+FAQ_CATEGORY = 'faq'
+TOPIC = 'topic'
+PROMPT_TOPIC = 'prompt'
+
+
+class KeywordMatcher:
+    """Автомат Ахо-Корасик: все вхождения набора подстрок за один проход"""
+
+    def __init__(self):
+        self._goto: List[Dict[str, int]] = [{}]
+        self._fail: List[int] = [0]
+        self._out: List[list] = [[]]
+        self._built = False
+
+    def add(self, keyword: str, label):
+        """Добавить ключевое слово с меткой, возвращаемой при совпадении"""
+        state = 0
+        for char in keyword:
+            next_state = self._goto[state].get(char)
+            if next_state is None:
+                next_state = len(self._goto)
+                self._goto[state][char] = next_state
+                self._goto.append({})
+                self._fail.append(0)
+                self._out.append([])
+            state = next_state
+        self._out[state].append(label)
+        self._built = False
+
+    def build(self):
+        """Построить суффиксные ссылки (обход в ширину)"""
+        queue = list(self._goto[0].values())
+        for state in queue:
+            self._fail[state] = 0
+        for state in queue:
+            for char, next_state in self._goto[state].items():
+                queue.append(next_state)
+                fail = self._fail[state]
+                while fail and char not in self._goto[fail]:
+                    fail = self._fail[fail]
+                fail = self._goto[fail].get(char, 0)
+                self._fail[next_state] = fail
+                # Совпадения суффикса наследуются, чтобы не ходить по ссылкам при поиске
+                self._out[next_state] = self._out[next_state] + self._out[fail]
+        self._built = True
+
+    def find(self, text: str) -> set:
+        """Метки всех ключевых слов, входящих в text"""
+        if not self._built:
+            self.build()
+        goto, fail, out = self._goto, self._fail, self._out
+        found = set()
+        state = 0
+        for char in text:
+            while state and char not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(char, 0)
+            if out[state]:
+                found.update(out[state])
+        return found
+
+
+@dataclass
+class KnowledgeMatch:
+    """Совпадения в сообщении (в порядке объявления в базе знаний)"""
+    faq_categories: List[str] = field(default_factory=list)
+    topics: List[str] = field(default_factory=list)
+    prompt_topics: List[str] = field(default_factory=list)
+
+
+class KnowledgeMatcher:
+    """Общий матчер категорий FAQ, тем SilkwayAI и тем PromptManager"""
+
+    def __init__(self, faq_data: dict, topic_keywords: dict, prompt_topics: list):
+        self.matcher = KeywordMatcher()
+        # Метка (вид, порядковый номер, название): порядок задает приоритет категорий
+        for order, (category, data) in enumerate(faq_data.items()):
+            for keyword in data['keywords']:
+                self.matcher.add(keyword.lower(), (FAQ_CATEGORY, order, category))
+        for order, (topic, keywords) in enumerate(topic_keywords.items()):
+            for keyword in keywords:
+                self.matcher.add(keyword.lower(), (TOPIC, order, topic))
+        for order, topic in enumerate(prompt_topics):
+            self.matcher.add(topic.lower(), (PROMPT_TOPIC, order, topic))
+        self.matcher.build()
+
+    def match(self, text: str) -> KnowledgeMatch:
+        result = KnowledgeMatch()
+        lists = {
+            FAQ_CATEGORY: result.faq_categories,
+            TOPIC: result.topics,
+            PROMPT_TOPIC: result.prompt_topics,
+        }
+        for kind, _, name in sorted(self.matcher.find(text.lower())):
+            lists[kind].append(name)
+        return result
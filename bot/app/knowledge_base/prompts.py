@@ -11,24 +11,23 @@ class PromptManager:
     "Извините, я могу помочь только с вопросами по доставке и работе компании."
     """
     
-    ALLOWED_TOPICS = [
-        "доставка",
-        "заказ",
-        "товар",
-        "адрес",
-        "склад",
-        "статус",
-        "трек",
-        "возврат",
-        # Можно легко добавлять новые темы
-    ]
-    
     @classmethod
     def is_allowed_topic(cls, text):
         """Проверка, относится ли вопрос к разрешенным темам"""
-        return any(topic in text.lower() for topic in cls.ALLOWED_TOPICS)
+        # Темы хранятся в базе знаний (prompt_topics в knowledge.json)
+        from app.knowledge_base.faq import get_faq
+        return bool(get_faq().match(text).prompt_topics)
     
     @classmethod
-    def get_prompt(cls, user_input):
-        """Формирование полного промпта с контекстом"""
-        return f"{cls.BASE_CONTEXT}\n\nВопрос: {user_input}\nОтвет:"
\ No newline at end of file
+    def get_prompt(cls, user_input, history="", reference=""):
+        """
+        Формирование полного промпта с контекстом.
+        Преамбула всегда в начале: на нее рассчитан KV-кэш движка генерации
+        """
+        parts = [cls.BASE_CONTEXT]
+        if reference:
+            parts.append(f"Справка: {reference}")
+        if history:
+            parts.append(f"История диалога:\n{history}")
+        parts.append(f"Вопрос: {user_input}\nОтвет:")
+        return "\n\n".join(parts)
\ No newline at end of file
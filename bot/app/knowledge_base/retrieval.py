@@ -0,0 +1,185 @@
+# knowledge_base/retrieval.py
+"""
+Лексический поиск по FAQ: BM25 по стеммированным русским токенам.
+
+Веса BM25 всех пар (термин, запись FAQ) считаются один раз при загрузке
+базы знаний и хранятся в CSR-матрице NumPy (строка = термин), поэтому
+оценка запроса - это сложение нескольких строк матрицы, без цикла по
+записям.
+"""
+import math
+import re
+from collections import Counter
+from functools import lru_cache
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from app.config import FAQ_RETRIEVAL_THRESHOLD
+
+BM25_K1 = 1.5
+BM25_B = 0.75
+# Вес ключевых слов записи относительно текста ответа
+KEYWORD_WEIGHT = 3
+# Запрос короче MIN_QUERY_TERMS терминов оценивается так, будто недостающие
+# термины - редкие и не найдены: одно частое слово ("заказ") не дает
+# высокой уверенности, одно редкое - дает не больше половины
+MIN_QUERY_TERMS = 2
+
+_TOKEN = re.compile(r'[a-zа-я0-9]+')
+
+STOPWORDS = frozenset("""
+и в во на с со к ко у о об от из за по до для при про без под над через
+а но да или ли же бы то как так что чтобы это этот эта эти тот та те
+я ты он она оно мы вы они меня мне мной тебя тебе нас нам вас вам их им
+его ее ей него нее ним ней них мой моя мое мои мою свой свою свои ваш ваша
+уже еще вот там тут здесь тоже также очень просто можно нужно надо
+здравствуйте привет пожалуйста спасибо добрый день вечер утро
+""".split())
+
+# ----- Стеммер Портера для русского языка (Snowball) -----
+
+_RV = re.compile(r'^(.*?[аеиоуыэюя])(.*)$')
+_PERFECTIVE_GERUND = re.compile(r'((ив|ивши|ившись|ыв|ывши|ывшись)|((?<=[ая])(в|вши|вшись)))$')
+_REFLEXIVE = re.compile(r'(с[яь])$')
+_ADJECTIVE = re.compile(
+    r'(ее|ие|ые|ое|ими|ыми|ей|ий|ый|ой|ем|им|ым|ом|его|ого|ему|ому|их|ых|ую|юю|ая|яя|ою|ею)$'
+)
+_PARTICIPLE = re.compile(r'((ивш|ывш|ующ)|((?<=[ая])(ем|нн|вш|ющ|щ)))$')
+_VERB = re.compile(
+    r'((ила|ыла|ена|ейте|уйте|ите|или|ыли|ей|уй|ил|ыл|им|ым|ен|ило|ыло|ено|ят|ует|уют|ит|ыт|ены|'
+    r'ить|ыть|ишь|ую|ю)|((?<=[ая])(ла|на|ете|йте|ли|й|л|ем|н|ло|но|ет|ют|ны|ть|ешь|нно)))$'
+)
+_NOUN = re.compile(
+    r'(а|ев|ов|ие|ье|е|иями|ями|ами|еи|ии|и|ией|ей|ой|ий|й|иям|ям|ием|ем|ам|ом|о|у|ах|иях|ях|ы|ь|'
+    r'ию|ью|ю|ия|ья|я)$'
+)
+_DERIVATIONAL = re.compile(r'.*[^аеиоуыэюя]+[аеиоуыэюя].*ость?$')
+_DERIVATIONAL_SUFFIX = re.compile(r'ость?$')
+_SUPERLATIVE = re.compile(r'(ейше|ейш)$')
+_I = re.compile(r'и$')
+_SOFT_SIGN = re.compile(r'ь$')
+_NN = re.compile(r'нн$')
+
+
+@lru_cache(maxsize=50000)
+def stem(word: str) -> str:
+    """Основа русского слова (слова на латинице и числа не меняются)"""
+    match = _RV.match(word)
+    if not match:
+        return word
+    prefix, rv = match.groups()
+
+    temp = _PERFECTIVE_GERUND.sub('', rv, 1)
+    if temp == rv:
+        rv = _REFLEXIVE.sub('', rv, 1)
+        temp = _ADJECTIVE.sub('', rv, 1)
+        if temp != rv:
+            rv = _PARTICIPLE.sub('', temp, 1)
+        else:
+            temp = _VERB.sub('', rv, 1)
+            rv = _NOUN.sub('', rv, 1) if temp == rv else temp
+    else:
+        rv = temp
+
+    rv = _I.sub('', rv, 1)
+    if _DERIVATIONAL.match(rv):
+        rv = _DERIVATIONAL_SUFFIX.sub('', rv, 1)
+
+    temp = _SOFT_SIGN.sub('', rv, 1)
+    if temp == rv:
+        rv = _NN.sub('н', _SUPERLATIVE.sub('', rv, 1), 1)
+    else:
+        rv = temp
+    return prefix + rv
+
+
+def tokenize(text: str) -> List[str]:
+    """Стеммированные токены текста без стоп-слов"""
+    words = _TOKEN.findall(text.lower().replace('ё', 'е'))
+    return [stem(word) for word in words if word not in STOPWORDS]
+
+
+class BM25Index:
+    """BM25 по набору документов с предвычисленными весами терминов"""
+
+    def __init__(self, documents: Dict[str, List[str]], k1: float = BM25_K1, b: float = BM25_B):
+        self.keys = list(documents)
+        self.k1 = k1
+        n_docs = len(self.keys)
+        counts = [Counter(tokens) for tokens in documents.values()]
+        lengths = np.array([len(tokens) for tokens in documents.values()], dtype=np.float32)
+        avg_length = float(lengths.mean()) if n_docs and lengths.sum() else 1.0
+
+        postings: Dict[str, List[Tuple[int, int]]] = {}
+        for doc_id, counter in enumerate(counts):
+            for term, tf in counter.items():
+                postings.setdefault(term, []).append((doc_id, tf))
+
+        self.vocabulary = {term: i for i, term in enumerate(postings)}
+        self.idf = np.zeros(len(postings), dtype=np.float32)
+        # Терм, которого нет в базе: максимальный idf (снижает уверенность)
+        self.unknown_idf = math.log(1 + (n_docs + 0.5) / 0.5)
+
+        indptr = [0]
+        indices, data = [], []
+        for term, term_postings in postings.items():
+            df = len(term_postings)
+            idf = math.log(1 + (n_docs - df + 0.5) / (df + 0.5))
+            self.idf[self.vocabulary[term]] = idf
+            for doc_id, tf in term_postings:
+                norm = k1 * (1 - b + b * lengths[doc_id] / avg_length)
+                indices.append(doc_id)
+                data.append(idf * tf * (k1 + 1) / (tf + norm))
+            indptr.append(len(indices))
+
+        self.indptr = np.array(indptr, dtype=np.int64)
+        self.indices = np.array(indices, dtype=np.int32)
+        self.data = np.array(data, dtype=np.float32)
+        self.n_docs = n_docs
+
+    def scores(self, tokens: List[str]) -> Tuple[np.ndarray, float]:
+        """
+        Оценки BM25 всех документов для запроса и верхняя граница оценки
+        (сумма idf * (k1 + 1) по терминам запроса, не меньше чем
+        для MIN_QUERY_TERMS терминов).
+        """
+        scores = np.zeros(self.n_docs, dtype=np.float32)
+        upper = max(0, MIN_QUERY_TERMS - len(tokens)) * self.unknown_idf * (self.k1 + 1)
+        for term, qtf in Counter(tokens).items():
+            term_id = self.vocabulary.get(term)
+            if term_id is None:
+                upper += self.unknown_idf * (self.k1 + 1) * qtf
+                continue
+            start, end = self.indptr[term_id], self.indptr[term_id + 1]
+            scores[self.indices[start:end]] += self.data[start:end] * qtf
+            upper += float(self.idf[term_id]) * (self.k1 + 1) * qtf
+        return scores, upper
+
+    def search(self, text: str, top: int = 3) -> List[Tuple[str, float]]:
+        """Лучшие документы: [(ключ, уверенность 0..1)]"""
+        tokens = tokenize(text)
+        if not tokens or not self.n_docs:
+            return []
+        scores, upper = self.scores(tokens)
+        best = np.argsort(-scores)[:top]
+        return [(self.keys[i], float(scores[i]) / upper) for i in best if scores[i] > 0]
+
+    def best(self, text: str, threshold: float = FAQ_RETRIEVAL_THRESHOLD) -> Optional[str]:
+        """Лучший документ с уверенностью не ниже threshold или None"""
+        results = self.search(text, top=1)
+        if results and results[0][1] >= threshold:
+            return results[0][0]
+        return None
+
+
+def build_faq_index(faq_data: Dict[str, dict]) -> BM25Index:
+    """Индекс записей FAQ: название, ключевые слова (с весом) и текст ответа"""
+    documents = {}
+    for category, entry in faq_data.items():
+        tokens = tokenize(category.replace('_', ' '))
+        for keyword in entry['keywords']:
+            tokens.extend(tokenize(keyword) * KEYWORD_WEIGHT)
+        tokens.extend(tokenize(entry['response']))
+        documents[category] = tokens
+    return BM25Index(documents)
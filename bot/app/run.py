@@ -1,4 +1,5 @@
 import os
+import time
 import asyncio
 import logging
 from fastapi import FastAPI, Request, HTTPException
@@ -11,8 +12,10 @@ from fastapi.middleware.cors import CORSMiddleware
 from concurrent.futures import ThreadPoolExecutor
 
 from app.bot.handlers import BotHandlers
-from app.database.operations import DatabaseManager
+from app.database.operations import AsyncDatabaseManager, get_db_manager, dispose_engines
 from app.ai.chat import ChatManager
+from app.knowledge_base.faq import get_faq
+from app.config import BOT_CONCURRENT_UPDATES, ML_WARMUP_ON_START
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
@@ -22,20 +25,78 @@ TELEGRAM_TOKEN = os.getenv("TELEGRAM_TOKEN", "")
 DATABASE_URL = os.getenv("DATABASE_URL", "sqlite:///bot.db")
 SECRET_KEY = os.getenv("SECRET_KEY", "MYSECRET")
 
-# Инициализируем менеджер БД
-db_manager = DatabaseManager(DATABASE_URL)
+# Объекты бота создаются в init_bot(), а не при импорте: процесс-воркер
+# генерации (spawn) заново импортирует главный модуль как __mp_main__
+# и не должен поднимать второй бот, пулы БД и writer'ы
+db_manager = None
+async_db_manager = None
+api_db_manager = None
+application = None
+chat_manager = None
+bot_handlers = None
 
-# Создаём Telegram-приложение (application) глобально
-application = ApplicationBuilder().token(TELEGRAM_TOKEN).build()
 
-chat_manager = ChatManager(db_manager)
+def warm_up_models():
+    """Загрузить модели OCR и ИИ заранее, чтобы первый запрос не ждал их"""
+    started = time.monotonic()
+    try:
+        chat_manager.warm_up()
+        bot_handlers.address_checker.warm_up()
+        logger.info(f"Models warmed up in {time.monotonic() - started:.1f}s")
+    except Exception as e:
+        logger.error(f"Error warming up models: {e}")
+
+
+async def on_startup(application):
+    await async_db_manager.init_database()
+    if ML_WARMUP_ON_START:
+        # В фоне: бот начинает принимать обновления, не дожидаясь загрузки моделей
+        asyncio.get_running_loop().run_in_executor(None, warm_up_models)
+
+
+async def on_shutdown(application):
+    chat_manager.close()
+    await async_db_manager.close()
+    dispose_engines()
+
+
+def build_application(token: str = TELEGRAM_TOKEN):
+    """
+    Telegram-приложение. Обновления обрабатываются параллельно
+    (не больше BOT_CONCURRENT_UPDATES): медленная генерация одного
+    пользователя не задерживает остальных, а лимиты задает допуск.
+    """
+    return (
+        ApplicationBuilder()
+        .token(token)
+        .concurrent_updates(BOT_CONCURRENT_UPDATES)
+        .post_init(on_startup)
+        .post_shutdown(on_shutdown)
+        .build()
+    )
 
-bot_handlers = BotHandlers(
-    chat_manager=chat_manager,
-    db_manager=db_manager
-)
 
-bot_handlers.register_handlers(application)
+def init_bot():
+    """Создать менеджеры БД, Telegram-приложение и обработчики"""
+    global db_manager, async_db_manager, api_db_manager, application, chat_manager, bot_handlers
+    # Инициализируем менеджер БД (общий пул соединений на процесс)
+    db_manager = get_db_manager(DATABASE_URL)
+    # Асинхронный менеджер БД для хендлеров (не блокирует event loop)
+    async_db_manager = AsyncDatabaseManager(DATABASE_URL)
+    # FastAPI работает в отдельном потоке со своим event loop — отдельный пул
+    api_db_manager = AsyncDatabaseManager(DATABASE_URL)
+
+    application = build_application()
+
+    chat_manager = ChatManager(db_manager)
+
+    bot_handlers = BotHandlers(
+        chat_manager=chat_manager,
+        db_manager=async_db_manager
+    )
+
+    bot_handlers.register_handlers(application)
+
 
 # ----- FastAPI -----
 app = FastAPI()
@@ -67,7 +128,7 @@ async def send_admin_message(data: AdminMessage, request: Request):
             text=data.text
         )
         # Сохраняем в базе
-        db_manager.save_interaction(
+        await api_db_manager.save_interaction(
             user_id=data.user_id,
             message="[ADMIN REPLY]",
             response=data.text,
@@ -79,12 +140,30 @@ async def send_admin_message(data: AdminMessage, request: Request):
         logger.error(f"Error sending admin message: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.get("/admin/cache_stats")
+async def cache_stats(request: Request):
+    """Счётчики кэша ответов ChatManager"""
+    if request.query_params.get('secret') != SECRET_KEY:
+        raise HTTPException(status_code=403, detail="Invalid secret key")
+    return chat_manager.response_cache.stats()
+
+@app.post("/admin/reload_kb")
+async def reload_knowledge_base(request: Request):
+    """Перечитать файл базы знаний без перезапуска"""
+    if request.query_params.get('secret') != SECRET_KEY:
+        raise HTTPException(status_code=403, detail="Invalid secret key")
+    faq = get_faq()
+    if not await asyncio.to_thread(faq.reload):
+        raise HTTPException(status_code=500, detail="Knowledge base file is invalid, see logs")
+    return {"status": "ok", "version": faq.kb.version}
+
 @app.get("/health")
 async def health_check():
     return {"status": "ok"}
 
 # Запуск Telegram Polling + FastAPI вместе
 def main():
+    init_bot()
     nest_asyncio.apply()
     
     # Создаем новый event loop
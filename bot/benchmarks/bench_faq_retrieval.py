@@ -0,0 +1,185 @@
+"""
+Офлайн-оценка поиска по FAQ: точность и задержка BM25 против ключевых слов.
+
+    python benchmarks/bench_faq_retrieval.py --db data/bot.db --entries 3000
+    python benchmarks/bench_faq_retrieval.py --threshold 0.25
+
+Разметка берётся из истории interactions: ответ 'ai', совпадающий с ответом
+записи FAQ, даёт метку этой записи, остальные ответы 'ai' - метку "не FAQ".
+Сообщения, переведённые на оператора (operator_redirect), не размечены:
+для них показывается, сколько из них BM25 закрыл бы ответом FAQ (с примерами
+для ручной проверки). Дополнительно всегда оцениваются перефразировки
+из SAMPLES. Задержка меряется на синтетической базе из --entries записей.
+"""
+import argparse
+import os
+import random
+import sqlite3
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+import numpy as np  # noqa: E402
+
+from app.knowledge_base.loader import load_knowledge_base  # noqa: E402
+from app.knowledge_base.retrieval import build_faq_index, tokenize  # noqa: E402
+
+# Перефразировки вопросов клиентов: (сообщение, ожидаемая запись FAQ или None)
+SAMPLES = [
+    ("где мой товар", "поступление"),
+    ("где мои заказы, пришли?", "поступление"),
+    ("пришли ли мои посылки", "поступление"),
+    ("поступил ли мой заказ", "поступление"),
+    ("товары уже поступили?", "поступление"),
+    ("как заказать доставку на дом", "доставка"),
+    ("можно курьером?", "доставка"),
+    ("доставите до двери?", "доставка"),
+    ("хочу получить заказ дома", "доставка"),
+    ("хочу вернуть бракованный товар", "возврат"),
+    ("пришел брак, как вернуть деньги", "возврат"),
+    ("как оформить возврат", "возврат"),
+    ("можно возместить стоимость", "возврат"),
+    ("у меня истек срок банковской карты", "карта"),
+    ("как поменять карту", "карта"),
+    ("добавить новую карту", "карта"),
+    ("товар попал в неизвестные", "неизвестные_товары"),
+    ("мой заказ в неизвестных товарах", "неизвестные_товары"),
+    ("в посылке не хватает вещей", "недостача"),
+    ("пришла неполная посылка", "недостача"),
+    ("до скольки вы работаете", "график"),
+    ("какой у вас график", "график"),
+    ("время работы склада", "график"),
+    ("во сколько открываетесь", "график"),
+    ("мне прислали не тот товар", "неправильный_заказ"),
+    ("ошибка в заказе, неверный товар", "неправильный_заказ"),
+    ("товар добавлен другим пользователем", "другой_пользователь"),
+    ("мой товар у чужого пользователя", "другой_пользователь"),
+    ("расскажи анекдот", None),
+    ("какая погода в Алматы", None),
+    ("как оплатить заказ", None),
+    ("сколько стоит доставка из китая за кг", None),
+    ("позовите оператора", None),
+    ("какой трек номер у посылки", None),
+    ("привет", None),
+    ("где находится ваш склад", None),
+]
+
+
+def load_history(db_path: str, limit: int):
+    """(размеченные сообщения, сообщения переведенные на оператора) из interactions"""
+    kb = load_knowledge_base()
+    by_response = {entry['response']: category for category, entry in kb.faq_data.items()}
+    conn = sqlite3.connect(f'file:{db_path}?mode=ro', uri=True)
+    rows = conn.execute(
+        "SELECT message, response, message_type FROM interactions "
+        "WHERE message_type IN ('ai', 'operator_redirect') AND message IS NOT NULL "
+        "ORDER BY id DESC LIMIT ?", (limit,)
+    ).fetchall()
+    conn.close()
+    labeled, redirected = [], []
+    for message, response, message_type in rows:
+        if message_type == 'ai':
+            labeled.append((message, by_response.get(response)))
+        else:
+            redirected.append(message)
+    return labeled, redirected
+
+
+def keyword_category(kb, text):
+    categories = kb.matcher.match(text).faq_categories
+    return categories[0] if categories else None
+
+
+def bm25_category(kb, index, text, threshold):
+    category = index.best(text, threshold)
+    return category or keyword_category(kb, text)
+
+
+def evaluate(kb, index, samples, threshold):
+    keyword_ok = sum(keyword_category(kb, q) == expected for q, expected in samples)
+    bm25_ok = 0
+    errors = []
+    for q, expected in samples:
+        actual = bm25_category(kb, index, q, threshold)
+        if actual == expected:
+            bm25_ok += 1
+        else:
+            errors.append((q, expected, actual))
+    return keyword_ok, bm25_ok, errors
+
+
+def synthetic_index(kb, entries: int):
+    """Индекс из entries записей: реальные записи плюс записи из слов реальных ответов"""
+    rnd = random.Random(entries)
+    words = [w for entry in kb.faq_data.values() for w in entry['response'].split() if w.isalpha()]
+    faq_data = dict(kb.faq_data)
+    for i in range(len(faq_data), entries):
+        faq_data[f'entry_{i}'] = {
+            'keywords': [' '.join(rnd.sample(words, 2)) for _ in range(4)],
+            'response': ' '.join(rnd.choices(words, k=40)),
+        }
+    return build_faq_index(faq_data)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--db', help='bot.db с историей interactions')
+    parser.add_argument('--limit', type=int, default=50000, help='сообщений из истории')
+    parser.add_argument('--threshold', type=float, default=None)
+    parser.add_argument('--entries', type=int, nargs='+', default=[len(SAMPLES), 1000, 3000])
+    parser.add_argument('--queries', type=int, default=2000)
+    args = parser.parse_args()
+
+    kb = load_knowledge_base()
+    index = build_faq_index(kb.faq_data)
+    from app.config import FAQ_RETRIEVAL_THRESHOLD
+    threshold = FAQ_RETRIEVAL_THRESHOLD if args.threshold is None else args.threshold
+
+    datasets = [('samples', SAMPLES)]
+    redirected = []
+    if args.db:
+        labeled, redirected = load_history(args.db, args.limit)
+        datasets.append(('interactions', labeled))
+
+    print(f"threshold={threshold}")
+    for name, samples in datasets:
+        if not samples:
+            continue
+        keyword_ok, bm25_ok, errors = evaluate(kb, index, samples, threshold)
+        print(f"{name}: {len(samples)} messages, "
+              f"keywords {keyword_ok / len(samples):.1%}, bm25 {bm25_ok / len(samples):.1%}")
+        for q, expected, actual in errors[:10]:
+            print(f"    {q!r}: expected {expected}, got {actual}")
+
+    if redirected:
+        answered = [(q, index.best(q, threshold)) for q in redirected]
+        answered = [(q, c) for q, c in answered if c]
+        print(f"operator_redirect: {len(redirected)} messages, "
+              f"bm25 would answer {len(answered) / len(redirected):.1%}")
+        for q, category in answered[:10]:
+            print(f"    {q!r} -> {category}")
+
+    queries = [q for q, _ in SAMPLES]
+    if redirected:
+        queries += redirected
+    rnd = random.Random(0)
+    queries = [rnd.choice(queries) for _ in range(args.queries)]
+    # Стеммер кэширует основы; прогреваем, чтобы мерить поиск в установившемся режиме
+    for q in set(queries):
+        tokenize(q)
+
+    print(f"\n{'entries':>8} {'mean, us':>10} {'p99, us':>10}")
+    for entries in args.entries:
+        big_index = synthetic_index(kb, entries)
+        timings = []
+        for q in queries:
+            start = time.perf_counter()
+            big_index.best(q, threshold)
+            timings.append(time.perf_counter() - start)
+        timings = np.array(timings) * 1e6
+        print(f"{entries:>8} {timings.mean():>10.1f} {np.percentile(timings, 99):>10.1f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,81 @@
+"""
+Пропускная способность движка генерации с батчингом и без.
+
+    python benchmarks/bench_generation.py
+    python benchmarks/bench_generation.py --batch 1 4 8 16 --clients 16 --requests 64
+    python benchmarks/bench_generation.py --model IlyaGusev/saiga2_7b_lora --requests 16
+
+По умолчанию используется маленькая GPT-2 со случайными весами
+(tiny_random_lm), поэтому скачивать модель не нужно и всё работает на CPU.
+--clients потоков одновременно отправляют запросы; для каждого размера
+батча печатаются пропускная способность, задержки и средний размер батча.
+"""
+import argparse
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+import numpy as np  # noqa: E402
+
+from app.ai.engine import GenerationEngine, load_pretrained, tiny_random_lm  # noqa: E402
+from app.knowledge_base.prompts import PromptManager  # noqa: E402
+
+QUESTIONS = [
+    "Сколько стоит доставка одного килограмма из Китая?",
+    "Когда придет мой заказ, если его отправили неделю назад?",
+    "Можно ли отправить посылку с электроникой?",
+    "Как узнать статус заказа?",
+    "Почему мой товар долго лежит на складе?",
+    "Какие сроки доставки в Караганду?",
+]
+
+
+def run(engine: GenerationEngine, clients: int, requests: int, max_new_tokens: int, temperature: float):
+    def one(i):
+        start = time.perf_counter()
+        engine.generate(PromptManager.get_prompt(QUESTIONS[i % len(QUESTIONS)]),
+                        max_new_tokens=max_new_tokens, temperature=temperature, timeout=600)
+        return time.perf_counter() - start
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=clients) as pool:
+        latencies = np.array(list(pool.map(one, range(requests))))
+    return time.perf_counter() - started, latencies
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--model', help='путь или имя модели (по умолчанию случайная tiny GPT-2)')
+    parser.add_argument('--batch', type=int, nargs='+', default=[1, 4, 8])
+    parser.add_argument('--wait-ms', type=float, default=20)
+    parser.add_argument('--clients', type=int, default=8)
+    parser.add_argument('--requests', type=int, default=48)
+    parser.add_argument('--max-new-tokens', type=int, default=32)
+    parser.add_argument('--temperature', type=float, default=0.7)
+    args = parser.parse_args()
+
+    loader, loader_args = (load_pretrained, (args.model,)) if args.model else (tiny_random_lm, ())
+    print(f"model={args.model or 'tiny-random'} clients={args.clients} requests={args.requests} "
+          f"max_new_tokens={args.max_new_tokens} wait={args.wait_ms}ms")
+    print(f"{'batch':>6} {'req/s':>8} {'p50, s':>8} {'p95, s':>8} {'mean batch':>11}")
+    for batch in args.batch:
+        engine = GenerationEngine(loader, loader_args, max_batch_size=batch, max_wait_ms=args.wait_ms)
+        engine.start()
+        try:
+            # Прогрев: первый вызов generate заметно медленнее
+            engine.generate(QUESTIONS[0], max_new_tokens=2)
+            engine.completed = engine.batches = 0
+            elapsed, latencies = run(engine, args.clients, args.requests,
+                                     args.max_new_tokens, args.temperature)
+            stats = engine.stats()
+        finally:
+            engine.close()
+        print(f"{batch:>6} {args.requests / elapsed:>8.1f} {np.percentile(latencies, 50):>8.2f} "
+              f"{np.percentile(latencies, 95):>8.2f} {stats['mean_batch_size']:>11.2f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,129 @@
+"""
+Бенчмарк индексов: время типовых запросов до и после миграций.
+
+    python benchmarks/bench_indexes.py --rows 10000000 --db /tmp/bench.db
+
+Создаёт БД со схемой без индексов (как в старой bot.db), наполняет её
+синтетическими данными, замеряет запросы, применяет миграции и замеряет снова.
+"""
+import argparse
+import os
+import random
+import sqlite3
+import sys
+import time
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from sqlalchemy import create_engine, inspect, text  # noqa: E402
+
+from app.database.models import Base  # noqa: E402
+from app.database.migrations import migrate  # noqa: E402
+
+STATUSES = ['pending', 'in_progress', 'answered', 'closed']
+
+QUERIES = {
+    'get_user_interactions': (
+        "SELECT * FROM interactions WHERE user_id = :uid "
+        "ORDER BY created_at DESC LIMIT 5"
+    ),
+    'session_by_user_id': (
+        "SELECT * FROM operator_sessions WHERE user_id = :uid LIMIT 1"
+    ),
+    'get_answered_sessions': (
+        "SELECT * FROM operator_sessions WHERE status = 'answered' "
+        "ORDER BY updated_at DESC LIMIT 50"
+    ),
+    'get_unanswered_sessions': (
+        "SELECT * FROM operator_sessions WHERE status = 'pending' "
+        "ORDER BY created_at DESC LIMIT 50"
+    ),
+    'get_inactive_sessions': (
+        "SELECT * FROM operator_sessions WHERE status = 'in_progress' "
+        "AND last_activity < :ts"
+    ),
+}
+
+
+def populate(db_path, rows, users, sessions):
+    conn = sqlite3.connect(db_path)
+    conn.execute("PRAGMA journal_mode=OFF")
+    conn.execute("PRAGMA synchronous=OFF")
+    start = datetime(2024, 1, 1)
+    chunk = 100_000
+    for offset in range(0, rows, chunk):
+        batch = [
+            (random.randrange(users), 'вопрос', 'ответ', 'text', 1,
+             start + timedelta(seconds=offset + i))
+            for i in range(min(chunk, rows - offset))
+        ]
+        conn.executemany(
+            "INSERT INTO interactions (user_id, message, response, message_type, success, created_at) "
+            "VALUES (?, ?, ?, ?, ?, ?)", batch
+        )
+    conn.executemany(
+        "INSERT INTO operator_sessions (user_id, status, last_message, created_at, updated_at, last_activity) "
+        "VALUES (?, ?, ?, ?, ?, ?)",
+        [
+            (uid, random.choice(STATUSES), 'вопрос',
+             start + timedelta(minutes=uid), start + timedelta(minutes=2 * uid),
+             start + timedelta(minutes=3 * uid))
+            for uid in random.sample(range(users), min(sessions, users))
+        ]
+    )
+    conn.commit()
+    conn.close()
+
+
+def measure(engine, users, repeat):
+    results = {}
+    with engine.connect() as conn:
+        for name, sql in QUERIES.items():
+            started = time.perf_counter()
+            for _ in range(repeat):
+                conn.execute(text(sql), {
+                    'uid': random.randrange(users),
+                    'ts': datetime(2024, 6, 1),
+                }).fetchall()
+            results[name] = (time.perf_counter() - started) / repeat * 1000
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--rows', type=int, default=10_000_000)
+    parser.add_argument('--users', type=int, default=200_000)
+    parser.add_argument('--sessions', type=int, default=50_000)
+    parser.add_argument('--repeat', type=int, default=20)
+    parser.add_argument('--db', default='/tmp/bench_indexes.db')
+    args = parser.parse_args()
+
+    if os.path.exists(args.db):
+        os.remove(args.db)
+    engine = create_engine(f'sqlite:///{args.db}')
+    Base.metadata.create_all(engine)
+    # Убираем индексы, чтобы получить схему старой bot.db
+    with engine.begin() as conn:
+        for table in ('interactions', 'operator_sessions'):
+            for index in inspect(engine).get_indexes(table):
+                conn.execute(text(f"DROP INDEX {index['name']}"))
+
+    print(f"Populating {args.rows} interactions...")
+    populate(args.db, args.rows, args.users, args.sessions)
+
+    before = measure(engine, args.users, args.repeat)
+    started = time.perf_counter()
+    migrate(engine)
+    migration_time = time.perf_counter() - started
+    after = measure(engine, args.users, args.repeat)
+
+    print(f"Migration time: {migration_time:.1f} s")
+    print(f"{'query':<26}{'before, ms':>12}{'after, ms':>12}{'speedup':>10}")
+    for name in QUERIES:
+        speedup = before[name] / after[name] if after[name] else float('inf')
+        print(f"{name:<26}{before[name]:>12.3f}{after[name]:>12.3f}{speedup:>9.0f}x")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,81 @@
+"""
+Бенчмарк поиска ключевых слов: перебор any(keyword in text) против
+KnowledgeMatcher (Ахо-Корасик) при росте числа записей FAQ.
+
+    python benchmarks/bench_matcher.py --entries 10 100 1000 --messages 2000
+"""
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from app.knowledge_base.loader import load_knowledge_base  # noqa: E402
+from app.knowledge_base.matcher import KnowledgeMatcher  # noqa: E402
+
+WORDS = [
+    'где', 'мой', 'заказ', 'товар', 'пришел', 'склад', 'когда', 'доставка',
+    'курьер', 'оплата', 'карта', 'возврат', 'брак', 'привет', 'спасибо',
+    'трек', 'номер', 'адрес', 'график', 'сегодня', 'почему', 'долго',
+]
+
+
+KB = load_knowledge_base()
+
+
+def synthetic_faq(entries: int) -> dict:
+    """FAQ из knowledge.json плюс синтетические категории до entries записей"""
+    rnd = random.Random(entries)
+    data = dict(KB.faq_data)
+    for i in range(len(data), entries):
+        keywords = [
+            f"{rnd.choice(WORDS)} {rnd.choice(WORDS)}{i}" for _ in range(5)
+        ]
+        data[f'category_{i}'] = {'keywords': keywords, 'response': f'ответ {i}'}
+    return data
+
+
+def brute_force(faq_data: dict, text: str):
+    text = text.lower()
+    for category in faq_data.values():
+        if any(keyword in text for keyword in category['keywords']):
+            return category['response']
+    return None
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--entries', type=int, nargs='+', default=[10, 100, 1000])
+    parser.add_argument('--messages', type=int, default=2000)
+    args = parser.parse_args()
+
+    rnd = random.Random(0)
+    messages = [
+        ' '.join(rnd.choice(WORDS) for _ in range(rnd.randint(3, 20)))
+        for _ in range(args.messages)
+    ]
+
+    print(f"{'entries':>8} {'brute, us/msg':>14} {'matcher, us/msg':>16}")
+    for entries in args.entries:
+        faq_data = synthetic_faq(entries)
+        matcher = KnowledgeMatcher(faq_data, KB.topic_keywords, KB.prompt_topics)
+
+        start = time.perf_counter()
+        expected = [brute_force(faq_data, m) for m in messages]
+        brute = (time.perf_counter() - start) / len(messages) * 1e6
+
+        start = time.perf_counter()
+        actual = []
+        for m in messages:
+            categories = matcher.match(m).faq_categories
+            actual.append(faq_data[categories[0]]['response'] if categories else None)
+        fast = (time.perf_counter() - start) / len(messages) * 1e6
+
+        assert actual == expected
+        print(f"{entries:>8} {brute:>14.1f} {fast:>16.1f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,92 @@
+"""
+Время до первого токена (TTFT) с KV-кэшем BASE_CONTEXT и без него.
+
+    python benchmarks/bench_prefix_cache.py
+    python benchmarks/bench_prefix_cache.py --hidden 1024 --layers 8 --batch 1 4 8
+    python benchmarks/bench_prefix_cache.py --model path/to/local/model --quantization int8
+
+TTFT меряется как время generate с max_new_tokens=1 (prefill плюс один
+шаг) для промптов PromptManager.get_prompt. Без --model используется
+случайная tiny LLaMA. В последней колонке - доля жадных ответов
+(--check-tokens токенов), совпавших с генерацией без кэша.
+"""
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+import numpy as np  # noqa: E402
+
+from app.ai.engine import PrefixCache, _generate, load_pretrained, tiny_random_lm  # noqa: E402
+from app.config import AI_MODEL_QUANTIZATION_MODES  # noqa: E402
+from app.knowledge_base.prompts import PromptManager  # noqa: E402
+
+QUESTIONS = [
+    "Сколько стоит доставка одного килограмма из Китая?",
+    "Когда придет мой заказ, если его отправили неделю назад?",
+    "Можно ли отправить посылку с электроникой?",
+    "Как узнать статус заказа?",
+    "Почему мой товар долго лежит на складе?",
+    "Какие сроки доставки в Караганду?",
+    "Где находится пункт выдачи?",
+    "Как оплатить доставку картой?",
+]
+
+
+def timed(fn, repeat: int) -> np.ndarray:
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - start)
+    return np.array(timings) * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--model', help='локальная модель (по умолчанию случайная tiny LLaMA)')
+    parser.add_argument('--quantization', default='none', choices=AI_MODEL_QUANTIZATION_MODES)
+    parser.add_argument('--hidden', type=int, default=512)
+    parser.add_argument('--layers', type=int, default=4)
+    parser.add_argument('--batch', type=int, nargs='+', default=[1, 4])
+    parser.add_argument('--repeat', type=int, default=10)
+    parser.add_argument('--check-tokens', type=int, default=8)
+    parser.add_argument('--max-input-tokens', type=int, default=2048)
+    args = parser.parse_args()
+
+    import torch
+    if args.model:
+        tokenizer, model = load_pretrained(args.model, args.quantization)
+    else:
+        tokenizer, model = tiny_random_lm(hidden_size=args.hidden, layers=args.layers)
+    tokenizer.padding_side = 'left'
+    model.eval()
+
+    started = time.perf_counter()
+    prefix = PrefixCache(tokenizer, model, PromptManager.BASE_CONTEXT)
+    print(f"model={args.model or f'tiny-llama hidden={args.hidden} layers={args.layers}'} "
+          f"threads={torch.get_num_threads()}")
+    print(f"prefix: {len(prefix)} tokens, computed in {(time.perf_counter() - started) * 1000:.0f} ms")
+    print(f"{'batch':>6} {'full, ms':>9} {'cached, ms':>11} {'speedup':>8} {'same tokens':>12}")
+
+    for batch in args.batch:
+        prompts = [PromptManager.get_prompt(QUESTIONS[i % len(QUESTIONS)]) for i in range(batch)]
+        suffixes = [prefix.suffix(p) for p in prompts]
+
+        def full(limit=1):
+            return _generate(tokenizer, model, prompts, [limit] * batch, 0, args.max_input_tokens)
+
+        def cached(limit=1):
+            return _generate(tokenizer, model, suffixes, [limit] * batch, 0, args.max_input_tokens, prefix)
+
+        full(), cached()  # прогрев
+        full_ms = np.median(timed(full, args.repeat))
+        cached_ms = np.median(timed(cached, args.repeat))
+        same = np.mean([a == b for a, b in zip(full(args.check_tokens), cached(args.check_tokens))])
+        print(f"{batch:>6} {full_ms:>9.1f} {cached_ms:>11.1f} {full_ms / cached_ms:>7.1f}x {same:>12.0%}")
+
+
+if __name__ == '__main__':
+    main()
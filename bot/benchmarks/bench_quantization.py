@@ -0,0 +1,123 @@
+"""
+Генерация на CPU: fp32 против динамического int8-квантования.
+
+    python benchmarks/bench_quantization.py
+    python benchmarks/bench_quantization.py --hidden 1024 --layers 8 --prompts 8
+    python benchmarks/bench_quantization.py --model path/to/local/model
+
+Без --model создается маленькая модель LLaMA со случайными весами
+(tiny_random_lm) и сохраняется во временный каталог, так что обе ветки
+загружаются через load_pretrained, как в боте. Каждый режим запускается
+в отдельном процессе: время загрузки, задержка ответа, токены/с
+и RSS процесса после генерации. int8 запускается дважды - с пустым кэшем
+(квантование) и с готовым кэшем на диске. Жадная генерация позволяет
+сравнить ответы int8 с fp32.
+"""
+import argparse
+import multiprocessing
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+PROMPTS = [
+    "Вопрос: Сколько стоит доставка одного килограмма из Китая?\nОтвет:",
+    "Вопрос: Когда придет мой заказ?\nОтвет:",
+    "Вопрос: Как узнать статус посылки по трек-номеру?\nОтвет:",
+    "Вопрос: Можно ли отправить электронику?\nОтвет:",
+]
+
+
+def rss_mb() -> float:
+    """Текущий RSS процесса, МБ"""
+    with open('/proc/self/status') as f:
+        for line in f:
+            if line.startswith('VmRSS:'):
+                return int(line.split()[1]) / 1024
+    import resource
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def run_mode(model_path: str, quantization: str, prompts: int, max_new_tokens: int, threads: int) -> dict:
+    """Замер одного режима (выполняется в отдельном процессе)"""
+    import torch
+    from app.ai.engine import load_pretrained
+
+    torch.set_num_threads(threads)
+    baseline = rss_mb()
+    started = time.perf_counter()
+    tokenizer, model = load_pretrained(model_path, quantization)
+    model.eval()
+    load_time = time.perf_counter() - started
+
+    latencies, tokens, outputs = [], 0, []
+    with torch.inference_mode():
+        for i in range(prompts + 1):
+            inputs = tokenizer(PROMPTS[i % len(PROMPTS)], return_tensors='pt')
+            started = time.perf_counter()
+            output = model.generate(**inputs, max_new_tokens=max_new_tokens, do_sample=False,
+                                    pad_token_id=tokenizer.eos_token_id)
+            elapsed = time.perf_counter() - started
+            new_tokens = output[0, inputs['input_ids'].shape[1]:]
+            if i == 0:
+                continue  # прогрев
+            latencies.append(elapsed)
+            tokens += len(new_tokens)
+            outputs.append(new_tokens.tolist())
+    return {
+        'load': load_time,
+        'latency': sum(latencies) / len(latencies),
+        'tokens_per_s': tokens / sum(latencies),
+        'rss': rss_mb(),
+        'rss_delta': rss_mb() - baseline,
+        'outputs': outputs,
+    }
+
+
+def save_tiny_model(path: str, hidden: int, layers: int):
+    from app.ai.engine import tiny_random_lm
+    tokenizer, model = tiny_random_lm(hidden_size=hidden, layers=layers)
+    tokenizer.save_pretrained(path)
+    model.save_pretrained(path)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--model', help='локальная модель (по умолчанию случайная tiny LLaMA)')
+    parser.add_argument('--hidden', type=int, default=512)
+    parser.add_argument('--layers', type=int, default=4)
+    parser.add_argument('--prompts', type=int, default=4)
+    parser.add_argument('--max-new-tokens', type=int, default=32)
+    parser.add_argument('--threads', type=int, default=os.cpu_count())
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix='bench_quant_')
+    # Пустой кэш квантованных весов; процессы-замеры унаследуют переменную
+    os.environ['AI_MODEL_QUANTIZED_CACHE_DIR'] = os.path.join(workdir, 'cache')
+    model_path = args.model
+    if not model_path:
+        model_path = os.path.join(workdir, 'model')
+        save_tiny_model(model_path, args.hidden, args.layers)
+
+    print(f"model={args.model or f'tiny-llama hidden={args.hidden} layers={args.layers}'} "
+          f"prompts={args.prompts} max_new_tokens={args.max_new_tokens} threads={args.threads}")
+    print(f"{'mode':>12} {'load, s':>8} {'latency, s':>11} {'tokens/s':>9} {'RSS, MB':>8} "
+          f"{'model, MB':>10} {'same as fp32':>13}")
+    context = multiprocessing.get_context('spawn')
+    reference = None
+    for name, quantization in [('fp32', 'none'), ('int8 cold', 'int8'), ('int8 cached', 'int8')]:
+        with context.Pool(1) as pool:
+            result = pool.apply(run_mode, (model_path, quantization, args.prompts,
+                                           args.max_new_tokens, args.threads))
+        if reference is None:
+            reference = result['outputs']
+        same = sum(a == b for a, b in zip(result['outputs'], reference)) / len(reference)
+        print(f"{name:>12} {result['load']:>8.2f} {result['latency']:>11.3f} "
+              f"{result['tokens_per_s']:>9.1f} {result['rss']:>8.0f} {result['rss_delta']:>10.0f} "
+              f"{same:>13.0%}")
+
+
+if __name__ == '__main__':
+    main()
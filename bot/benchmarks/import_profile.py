@@ -0,0 +1,94 @@
+"""
+Профиль времени импорта точек входа контейнеров.
+
+    python benchmarks/import_profile.py
+    python benchmarks/import_profile.py --top 30 --module app.admin_bot.main
+
+Каждый модуль импортируется в отдельном процессе с python -X importtime.
+Отчет: общее время импорта, самые дорогие пакеты (собственное время их модулей)
+и тяжелые ML-зависимости, оказавшиеся в sys.modules (для админ-бота
+их быть не должно). Код выхода 1, если админ-бот импортировал хотя бы одну.
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+BOT_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+
+HEAVY_MODULES = ['torch', 'transformers', 'easyocr', 'cv2', 'scipy', 'pandas']
+
+# Модуль -> должен ли он обходиться без тяжелых зависимостей
+DEFAULT_MODULES = {
+    'app.run': False,
+    'app.admin_bot.main': True,
+}
+
+
+def profile(module: str) -> dict:
+    code = (
+        "import sys, json\n"
+        f"import {module}\n"
+        f"print(json.dumps([m for m in {HEAVY_MODULES!r} if m in sys.modules]))\n"
+    )
+    env = dict(os.environ)
+    # Точки входа запускаются как app/run.py, поэтому app/ тоже в sys.path
+    env['PYTHONPATH'] = os.pathsep.join([BOT_DIR, os.path.join(BOT_DIR, 'app')])
+    env.setdefault('TELEGRAM_TOKEN', '123456:profile')
+    env.setdefault('ADMIN_BOT_TOKEN', '123456:profile')
+    env.setdefault('DATABASE_URL', f"sqlite:///{os.path.join(tempfile.gettempdir(), 'import_profile.db')}")
+    env.setdefault('ML_WARMUP_ON_START', 'false')
+    env.setdefault('KNOWLEDGE_BASE_RELOAD_INTERVAL', '0')
+
+    started = time.perf_counter()
+    proc = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', code],
+        capture_output=True, text=True, env=env, cwd=BOT_DIR
+    )
+    wall = time.perf_counter() - started
+    if proc.returncode != 0:
+        raise RuntimeError(f"import {module} failed:\n{proc.stderr[-2000:]}")
+
+    # Собственное время импорта, сложенное по пакетам верхнего уровня (telegram, sqlalchemy, ...)
+    packages = {}
+    for line in proc.stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        self_us, _, name = line[len('import time:'):].split('|', 2)
+        package = name.strip().split('.')[0]
+        packages[package] = packages.get(package, 0) + int(self_us)
+
+    return {
+        'module': module,
+        'wall': wall,
+        'packages': sorted(packages.items(), key=lambda item: -item[1]),
+        'heavy': json.loads(proc.stdout.strip().splitlines()[-1]),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--module', action='append', help='модуль для профилирования (можно несколько)')
+    parser.add_argument('--top', type=int, default=15)
+    args = parser.parse_args()
+
+    modules = {m: DEFAULT_MODULES.get(m, False) for m in args.module} if args.module else DEFAULT_MODULES
+    failed = False
+    for module, must_be_light in modules.items():
+        report = profile(module)
+        total = sum(us for _, us in report['packages'])
+        print(f"\n== {module}: {report['wall']:.2f}s wall, {total / 1e6:.2f}s in imports")
+        for name, us in report['packages'][:args.top]:
+            print(f"  {us / 1000:>9.1f} ms  {name}")
+        print(f"  heavy modules loaded: {', '.join(report['heavy']) or 'none'}")
+        if must_be_light and report['heavy']:
+            print(f"  ERROR: {module} must not import {', '.join(report['heavy'])}")
+            failed = True
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+    main()
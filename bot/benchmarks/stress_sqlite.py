@@ -0,0 +1,146 @@
+"""
+Стресс-тест общей bot.db двумя процессами, как в docker-compose:
+процесс основного бота пишет, процесс админ-бота читает списки через read-only соединения.
+
+    python benchmarks/stress_sqlite.py --seconds 30 --writes-per-sec 200
+    python benchmarks/stress_sqlite.py --legacy   # старые настройки: rollback-журнал, без ожидания
+
+Код выхода 1, если хотя бы одна операция завершилась ошибкой блокировки.
+"""
+import argparse
+import asyncio
+import logging
+import multiprocessing
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+LEGACY_ENV = {
+    'SQLITE_JOURNAL_MODE': 'DELETE',
+    'SQLITE_SYNCHRONOUS': 'FULL',
+    'SQLITE_BUSY_TIMEOUT_MS': '0',
+    'DB_LOCK_RETRIES': '0',
+}
+
+
+class LockErrorCounter(logging.Handler):
+    """Считает ошибки блокировки, которые менеджеры БД пишут в лог"""
+
+    def __init__(self):
+        super().__init__(level=logging.ERROR)
+        self.count = 0
+
+    def emit(self, record):
+        if 'locked' in record.getMessage() or 'busy' in record.getMessage():
+            self.count += 1
+
+
+def _setup(env):
+    os.environ.update(env)
+    counter = LockErrorCounter()
+    logging.getLogger().addHandler(counter)
+    logging.getLogger().setLevel(logging.ERROR)
+    return counter
+
+
+def writer_process(db_url, env, seconds, rate, users, result):
+    counter = _setup(env)
+    from app.database.operations import AsyncDatabaseManager, dispose_engines
+
+    async def run():
+        db = AsyncDatabaseManager(db_url)
+        await db.init_database()
+        ops = 0
+        deadline = time.monotonic() + seconds
+        while time.monotonic() < deadline:
+            started = time.monotonic()
+            user_id = random.randrange(users)
+            action = random.random()
+            if action < 0.4:
+                await db.save_interaction(user_id, 'вопрос', 'ответ')
+            elif action < 0.6:
+                await db.create_operator_session(user_id, 'вопрос')
+            elif action < 0.8:
+                await db.set_session_in_progress(user_id)
+                await db.update_last_activity(user_id)
+            else:
+                await db.add_subscriber(user_id, f'user{user_id}')
+            ops += 1
+            await asyncio.sleep(max(0.0, 1 / rate - (time.monotonic() - started)))
+        await db.close()
+        return ops
+
+    ops = asyncio.run(run())
+    dispose_engines()
+    result.put(('writer', ops, counter.count))
+
+
+def reader_process(db_url, env, seconds, result):
+    counter = _setup(env)
+    from app.database.operations import AsyncDatabaseManager
+
+    async def run():
+        db = AsyncDatabaseManager(db_url, read_only=True)
+        ops = 0
+        deadline = time.monotonic() + seconds
+        while time.monotonic() < deadline:
+            await db.get_pending_sessions()
+            await db.get_in_progress_sessions()
+            await db.get_answered_sessions()
+            await db.get_inactive_sessions()
+            await db.get_subscribers_count()
+            await db.get_active_subscribers_count()
+            ops += 6
+        await db.close()
+        return ops
+
+    result.put(('reader', asyncio.run(run()), counter.count))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--seconds', type=float, default=20)
+    parser.add_argument('--writes-per-sec', type=float, default=200)
+    parser.add_argument('--users', type=int, default=5000)
+    parser.add_argument('--db', default='/tmp/stress_sqlite.db')
+    parser.add_argument('--legacy', action='store_true')
+    args = parser.parse_args()
+
+    for suffix in ('', '-wal', '-shm', '-journal'):
+        if os.path.exists(args.db + suffix):
+            os.remove(args.db + suffix)
+    db_url = f'sqlite:///{args.db}'
+    env = LEGACY_ENV if args.legacy else {}
+
+    # Схема создаётся до старта читателя, как при обычном запуске контейнеров
+    init = multiprocessing.get_context('spawn')
+    result = init.Queue()
+    prepared = init.Process(target=writer_process, args=(db_url, env, 0, 1, 1, result))
+    prepared.start()
+    result.get()
+    prepared.join()
+
+    processes = [
+        init.Process(target=writer_process,
+                     args=(db_url, env, args.seconds, args.writes_per_sec, args.users, result)),
+        init.Process(target=reader_process, args=(db_url, env, args.seconds, result)),
+    ]
+    for process in processes:
+        process.start()
+    stats = [result.get() for _ in processes]
+    for process in processes:
+        process.join()
+
+    total_errors = 0
+    for name, ops, errors in sorted(stats):
+        print(f"{name:<8} operations: {ops:>8}  lock errors: {errors}")
+        total_errors += errors
+    print(f"profile: {'legacy' if args.legacy else 'concurrent'}, total lock errors: {total_errors}")
+    sys.exit(1 if total_errors else 0)
+
+
+if __name__ == '__main__':
+    main()
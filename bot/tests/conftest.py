@@ -0,0 +1,26 @@
+# tests/conftest.py
+import os
+import sys
+import tempfile
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# Как в контейнере: пакет app и модули внутри него (import config)
+sys.path[:0] = [ROOT, os.path.join(ROOT, 'app')]
+
+os.environ.setdefault('TELEGRAM_TOKEN', '123456:TEST')
+os.environ.setdefault('DATABASE_URL', f"sqlite:///{tempfile.mkdtemp()}/test.db")
+os.environ.setdefault('KNOWLEDGE_BASE_RELOAD_INTERVAL', '0')
+os.environ.setdefault('AI_MODEL_ENABLED', 'false')
+os.environ.setdefault('STATE_BACKEND', 'memory')
+
+
+@pytest.fixture
+def db_manager():
+    from app.config import DATABASE_URL
+    from app.database.operations import get_db_manager
+
+    manager = get_db_manager(DATABASE_URL)
+    manager.init_database()
+    return manager
@@ -0,0 +1,71 @@
+# tests/test_admission.py
+import asyncio
+
+from app.bot.admission import BUSY_MESSAGE, OVERLOADED_MESSAGE, AdmissionController
+from app.database.state import MemoryStateBackend, set_state_backend
+
+
+class SlowStateBackend(MemoryStateBackend):
+    """Бюджет проверяется с задержкой, как в Redis"""
+
+    def rate_limits(self):
+        store = super().rate_limits()
+
+        class Slow:
+            async def hit(self, *args, **kwargs):
+                await asyncio.sleep(0.01)
+                return await store.hit(*args, **kwargs)
+
+        return Slow()
+
+
+def controller(concurrency=1, max_waiting=1, user_concurrency=1):
+    return AdmissionController(
+        policy={'handler': {'cost': 1, 'queue': 'work'}},
+        queues={'work': {'concurrency': concurrency, 'max_waiting': max_waiting}},
+        user_budget=100, user_period=60, user_concurrency=user_concurrency,
+    )
+
+
+def test_user_slot_reserved_before_budget_check():
+    set_state_backend(SlowStateBackend())
+    try:
+        admission = controller()
+
+        async def scenario():
+            return await asyncio.gather(admission.check('handler', 1), admission.check('handler', 1))
+
+        assert sorted(asyncio.run(scenario()), key=str) == [None, BUSY_MESSAGE]
+    finally:
+        set_state_backend(None)
+
+
+def test_queue_capacity_is_not_oversubscribed():
+    set_state_backend(SlowStateBackend())
+    try:
+        admission = controller(concurrency=1, max_waiting=1)
+
+        async def scenario():
+            results = await asyncio.gather(*(admission.check('handler', user) for user in range(4)))
+            queue = admission.queues['work']
+            return results, queue.waiting
+
+        results, waiting = asyncio.run(scenario())
+        # Место занимают до проверки бюджета: ожидающих не больше max_waiting + concurrency
+        assert results.count(None) == 2
+        assert results.count(OVERLOADED_MESSAGE) == 2
+        assert waiting == 2
+    finally:
+        set_state_backend(None)
+
+
+def test_run_releases_reservation():
+    admission = controller()
+
+    async def scenario():
+        assert await admission.check('handler', 1) is None
+        assert await admission.run('handler', 1, lambda: asyncio.sleep(0, result='ok')) == 'ok'
+        queue = admission.queues['work']
+        return queue.active, queue.waiting, admission._in_flight
+
+    assert asyncio.run(scenario()) == (0, 0, {})
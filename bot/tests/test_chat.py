@@ -0,0 +1,74 @@
+# tests/test_chat.py
+import asyncio
+import time
+from types import SimpleNamespace
+
+from app.ai.chat import ChatManager
+
+
+def slow_answer(delay: float, stream: bool):
+    def process_message(user_id, message, cancel=None, on_partial=None, intent=None):
+        if stream and on_partial:
+            on_partial("Доставка")
+        deadline = time.monotonic() + delay
+        while time.monotonic() < deadline:
+            if cancel is not None and cancel.is_set():
+                return "отменено", True
+            time.sleep(0.01)
+        return "Доставка занимает 10 дней", False
+    return process_message
+
+
+def test_deadline_gives_fallback_without_stream(db_manager, monkeypatch):
+    chat = ChatManager(db_manager)
+    monkeypatch.setattr(chat, "process_message", slow_answer(0.5, stream=False))
+    monkeypatch.setattr(chat, "fallback_response", lambda *args, **kwargs: ("запасной", True))
+
+    result = asyncio.run(chat.aprocess_message(1, "вопрос", deadline=0.1, on_partial=lambda text: None,
+                                               stream_deadline=5))
+    assert result == ("запасной", True)
+
+
+def test_streamed_answer_outlives_deadline(db_manager, monkeypatch):
+    chat = ChatManager(db_manager)
+    monkeypatch.setattr(chat, "process_message", slow_answer(0.5, stream=True))
+    monkeypatch.setattr(chat, "fallback_response", lambda *args, **kwargs: ("запасной", True))
+    partials = []
+
+    result = asyncio.run(chat.aprocess_message(1, "вопрос", deadline=0.1, on_partial=partials.append,
+                                               stream_deadline=5))
+    assert result == ("Доставка занимает 10 дней", False)
+    assert partials == ["Доставка"]
+
+    # stream_deadline тоже ограничен
+    result = asyncio.run(chat.aprocess_message(1, "вопрос", deadline=0.1, on_partial=partials.append,
+                                               stream_deadline=0.2))
+    assert result == ("запасной", True)
+
+
+def test_message_is_classified_once(db_manager, monkeypatch):
+    chat = ChatManager(db_manager)
+    resolve = chat.intents.resolve
+    calls = []
+
+    def counting_resolve(message):
+        calls.append(message)
+        return resolve(message)
+    monkeypatch.setattr(chat.intents, "resolve", counting_resolve)
+
+    async def scenario():
+        intent, needs_generation = await chat.aclassify("Как узнать статус заказа?")
+        return await chat.aprocess_message(2, "Как узнать статус заказа?", intent=intent)
+
+    response, needs_operator = asyncio.run(scenario())
+    assert response
+    assert len(calls) == 1
+
+
+def test_fallback_tries_every_topic(db_manager):
+    chat = ChatManager(db_manager)
+    # У первой темы нет заготовленного ответа, у второй есть
+    intent = SimpleNamespace(faq_response=None, match=SimpleNamespace(topics=["оплата", "трекинг"]))
+    response, needs_operator = chat.fallback_response(3, "оплата и статус", intent=intent)
+    assert response == chat.faq.kb.topic_responses["трекинг"]
+    assert not needs_operator
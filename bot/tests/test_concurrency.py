@@ -0,0 +1,52 @@
+# tests/test_concurrency.py
+import asyncio
+
+from telegram import User
+from telegram.ext import TypeHandler
+
+from app.config import BOT_CONCURRENT_UPDATES
+
+
+def test_updates_are_processed_concurrently(monkeypatch):
+    from app.run import build_application
+
+    async def scenario():
+        application = build_application("123456:TEST")
+        assert application.concurrent_updates == BOT_CONCURRENT_UPDATES
+
+        # Без сети: initialize() запрашивает getMe
+        async def get_me(bot, *args, **kwargs):
+            bot._bot_user = User(1, "bot", True, username="test_bot")
+            return bot._bot_user
+        monkeypatch.setattr(type(application.bot), "get_me", get_me)
+
+        # Второе обновление должно начаться, пока первое еще ждет
+        barrier = asyncio.Barrier(2)
+        done = []
+
+        async def handler(update, context):
+            await asyncio.wait_for(barrier.wait(), 5)
+            done.append(update)
+
+        application.add_handler(TypeHandler(int, handler))
+        async with application:
+            await application.start()
+            await application.update_queue.put(1)
+            await application.update_queue.put(2)
+            for _ in range(100):
+                if len(done) == 2:
+                    break
+                await asyncio.sleep(0.05)
+            await application.stop()
+        return sorted(done)
+
+    assert asyncio.run(scenario()) == [1, 2]
+
+
+def test_import_builds_nothing():
+    # Воркер генерации (spawn) импортирует run.py как __mp_main__
+    import app.run as run
+
+    assert run.application is None
+    assert run.chat_manager is None
+    assert run.db_manager is None
@@ -0,0 +1,123 @@
+# tests/test_engine.py
+import multiprocessing
+import threading
+import time
+from concurrent.futures import CancelledError, TimeoutError as FutureTimeoutError
+
+import pytest
+
+pytest.importorskip("transformers")
+
+from app.ai.engine import CancelToken, GenerationEngine, PrefixCache, _generate, tiny_random_lm  # noqa: E402
+from app.knowledge_base.prompts import PromptManager  # noqa: E402
+
+QUESTIONS = [
+    "Сколько стоит доставка одного килограмма из Китая?",
+    "Как узнать статус заказа?",
+    "Можно ли отправить посылку с электроникой?",
+    "Где находится пункт выдачи?",
+]
+
+# Жадная генерация такой длины на tiny-модели идет несколько секунд
+LONG = 1500
+
+
+def wait_for(condition, timeout: float = 5.0) -> bool:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if condition():
+            return True
+        time.sleep(0.02)
+    return False
+
+
+@pytest.fixture(scope="module")
+def engine():
+    engine = GenerationEngine(tiny_random_lm, (0, 64, 2), max_batch_size=4, max_wait_ms=300,
+                              max_input_tokens=512)
+    engine.start(timeout=120)
+    yield engine
+    engine.close()
+
+
+def test_prefix_cache_keeps_greedy_output():
+    tokenizer, model = tiny_random_lm()
+    tokenizer.padding_side = "left"
+    model.eval()
+    prefix = PrefixCache(tokenizer, model, PromptManager.BASE_CONTEXT)
+    prompts = [PromptManager.get_prompt(q) for q in QUESTIONS]
+
+    full = _generate(tokenizer, model, prompts, [8] * len(prompts), 0, 2048)
+    cached = _generate(tokenizer, model, [prefix.suffix(p) for p in prompts],
+                       [8] * len(prompts), 0, 2048, prefix)
+    assert cached == full
+
+
+def test_concurrent_submits_are_batched(engine):
+    batches = engine.stats()['batches']
+    futures = [engine.submit(q, 4, 0) for q in QUESTIONS]
+    for future in futures:
+        assert isinstance(future.result(30), str)
+    assert engine.stats()['batches'] == batches + 1
+
+
+def test_timeout_cancels_request(engine):
+    with pytest.raises(FutureTimeoutError):
+        engine.generate(QUESTIONS[0], LONG, 0, timeout=0.2)
+    assert engine.stats()['pending'] == 0
+    # Воркер бросил отмененную генерацию и сразу берет следующий запрос
+    started = time.monotonic()
+    engine.generate(QUESTIONS[1], 4, 0, timeout=30)
+    assert time.monotonic() - started < 2
+
+
+def test_cancel_token_skips_queued_request(engine):
+    completed = engine.stats()['completed']
+    running = engine.submit(QUESTIONS[0], 200, 0)
+    cancel = CancelToken()
+    queued = engine.submit(QUESTIONS[1], 200, 0)
+    cancel.add_callback(queued.cancel)
+    cancel.set()
+    assert queued.cancelled()
+    with pytest.raises(CancelledError):
+        queued.result()
+    running.result(30)
+    # Отмененный запрос не генерировался до конца: воркер его результат не прислал
+    assert wait_for(lambda: engine.stats()['completed'] == completed + 1)
+    assert engine.stats()['pending'] == 0
+
+
+def test_cancel_token_stops_running_request(engine):
+    cancel = CancelToken()
+    streaming = threading.Event()
+    result = {}
+
+    def run():
+        started = time.monotonic()
+        try:
+            engine.generate(QUESTIONS[0], LONG, 0, timeout=30,
+                            on_partial=lambda text: streaming.set(), cancel=cancel)
+        except CancelledError:
+            result['cancelled'] = time.monotonic() - started
+
+    thread = threading.Thread(target=run)
+    thread.start()
+    assert streaming.wait(10)
+    cancel.set()
+    thread.join(10)
+    assert 'cancelled' in result
+
+    started = time.monotonic()
+    engine.generate(QUESTIONS[1], 4, 0, timeout=30)
+    assert time.monotonic() - started < 2
+
+
+def test_close_joins_worker():
+    engine = GenerationEngine(tiny_random_lm, (0, 64, 2), max_input_tokens=512)
+    engine.start(timeout=120)
+    process = engine._process
+    engine.close()
+    assert engine._process is None
+    assert not process.is_alive()
+    assert process not in multiprocessing.active_children()
+    assert engine.stats()['running'] is False
@@ -0,0 +1,37 @@
+# tests/test_prompt_builder.py
+import math
+import threading
+
+from app.ai.prompt_builder import ESTIMATE_CHARS_PER_TOKEN, PromptBuilder, TokenCounter
+
+
+def test_long_question_is_trimmed_to_budget():
+    builder = PromptBuilder(TokenCounter('estimate'), budget=700)
+    prompt = builder.build("доставка " * 2000)
+    assert builder.prompt_tokens(prompt) <= 700
+    assert prompt.endswith("\nОтвет:")
+
+
+def test_short_question_is_kept():
+    builder = PromptBuilder(TokenCounter('estimate'), budget=700)
+    assert builder.build("Сколько стоит доставка?").endswith("Вопрос: Сколько стоит доставка?\nОтвет:")
+
+
+def test_tokenizer_loads_in_background():
+    release = threading.Event()
+
+    class Tokenizer:
+        def __call__(self, text, add_special_tokens=False):
+            return {'input_ids': text.split()}
+
+    def loader(model_path):
+        release.wait(5)
+        return Tokenizer()
+
+    counter = TokenCounter('model', loader=loader)
+    text = "один два три четыре пять шесть"
+    # Пока токенизатор загружается, подсчет не ждет и дает оценку
+    assert counter.count(text) == math.ceil(len(text) / ESTIMATE_CHARS_PER_TOKEN)
+    release.set()
+    counter._loading.join(5)
+    assert counter.count(text) == 6
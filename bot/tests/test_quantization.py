@@ -0,0 +1,55 @@
+# tests/test_quantization.py
+import os
+
+import pytest
+
+torch = pytest.importorskip("torch")
+pytest.importorskip("transformers")
+
+from app.ai.engine import load_pretrained, tiny_random_lm  # noqa: E402
+from app.ai.quantization import cache_path, load_quantized  # noqa: E402
+
+
+def test_cached_model_gives_same_logits(tmp_path, monkeypatch):
+    tokenizer, model = tiny_random_lm()
+    model_dir = str(tmp_path / "model")
+    model.save_pretrained(model_dir)
+    cache_dir = str(tmp_path / "cache")
+    inputs = tokenizer(["Как узнать статус заказа?"], return_tensors="pt")
+
+    quantized = load_quantized(model_dir, cache_dir)
+    assert os.path.exists(cache_path(model_dir, cache_dir))
+
+    # Повторная загрузка - из кэша, без fp32-весов
+    import transformers
+
+    def no_pretrained(*args, **kwargs):
+        raise AssertionError("fp32 weights loaded instead of the cache")
+    monkeypatch.setattr(transformers.AutoModelForCausalLM, "from_pretrained", no_pretrained)
+    cached = load_quantized(model_dir, cache_dir)
+    assert cached is not quantized
+
+    with torch.inference_mode():
+        expected = quantized(**inputs).logits
+        actual = cached(**inputs).logits
+    assert torch.equal(expected, actual)
+
+
+def test_cache_path_tracks_nested_files(tmp_path):
+    # Пустой каталог не ломает расчет имени кэша
+    empty = tmp_path / "empty"
+    empty.mkdir()
+    assert cache_path(str(empty), str(tmp_path))
+
+    nested = tmp_path / "model" / "weights"
+    nested.mkdir(parents=True)
+    weights = nested / "model.safetensors"
+    weights.write_bytes(b"0")
+    before = cache_path(str(tmp_path / "model"), str(tmp_path))
+    os.utime(weights, (1, 1))
+    assert cache_path(str(tmp_path / "model"), str(tmp_path)) != before
+
+
+def test_unknown_quantization_is_rejected():
+    with pytest.raises(ValueError):
+        load_pretrained("unused", "int4")
@@ -0,0 +1,51 @@
+# tests/test_response_cache.py
+from app.ai.chat import OPERATOR_HANDOFF_MESSAGE, ChatManager
+from app.knowledge_base.intent import IntentResolver, normalize_query
+
+
+def test_classification_uses_cache_key():
+    # Сообщения с одним ключом кэша классифицируются одинаково
+    resolver = IntentResolver()
+    assert normalize_query("сколько, стоит") == normalize_query("сколько стоит")
+    assert resolver.resolve("сколько, стоит").match.topics == resolver.resolve("сколько стоит").match.topics
+    assert not resolver.resolve("сколько, стоит").needs_operator
+
+
+def test_punctuation_does_not_cache_operator_handoff(db_manager):
+    chat = ChatManager(db_manager)
+    try:
+        chat.process_message(1, "сколько, стоит")
+        response, needs_operator = chat.process_message(2, "сколько стоит")
+        assert response != OPERATOR_HANDOFF_MESSAGE
+        assert not needs_operator
+    finally:
+        chat.close()
+
+
+def test_operator_handoff_is_not_cached(db_manager):
+    chat = ChatManager(db_manager)
+    try:
+        assert chat.process_message(1, "расскажи анекдот") == (OPERATOR_HANDOFF_MESSAGE, True)
+        assert chat.response_cache.get("расскажи анекдот") is None
+    finally:
+        chat.close()
+
+
+def test_faq_answer_is_cached(db_manager):
+    chat = ChatManager(db_manager)
+    try:
+        response, needs_operator = chat.process_message(1, "Сколько стоит доставка?")
+        assert not needs_operator
+        assert chat.response_cache.get("сколько стоит доставка") == (response, False)
+    finally:
+        chat.close()
+
+
+def test_topic_response_is_cached(db_manager):
+    chat = ChatManager(db_manager)
+    try:
+        response, needs_operator = chat.process_message(1, "хочу отследить посылку")
+        assert response == chat.faq.kb.topic_responses["трекинг"]
+        assert chat.response_cache.get("хочу отследить посылку") == (response, False)
+    finally:
+        chat.close()
@@ -0,0 +1,23 @@
+# tests/test_retrieval.py
+from app.config import FAQ_RETRIEVAL_THRESHOLD
+from app.knowledge_base.faq import get_faq
+from app.knowledge_base.intent import IntentResolver
+
+
+def test_single_generic_term_below_threshold():
+    retriever = get_faq().kb.retriever
+    (category, confidence), = retriever.search("заказ", top=1)
+    assert confidence < FAQ_RETRIEVAL_THRESHOLD
+    assert retriever.best("заказ") is None
+
+
+def test_single_generic_term_resolves_to_topic():
+    intent = IntentResolver().resolve("заказ")
+    assert intent.faq_category is None
+    assert intent.topic == 'доставка'
+
+
+def test_paraphrase_still_matches():
+    resolver = IntentResolver()
+    assert resolver.resolve("хочу вернуть бракованный товар").faq_category == 'возврат'
+    assert resolver.resolve("мне прислали не тот товар").faq_category == 'неправильный_заказ'
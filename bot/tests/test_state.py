@@ -0,0 +1,123 @@
+# tests/test_state.py
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+
+fakeredis = pytest.importorskip("fakeredis")
+
+from app.ai.conversation import ConversationStore  # noqa: E402
+from app.database.state import (  # noqa: E402
+    MemoryFlagStore,
+    MemoryRateLimitStore,
+    RedisConversationStore,
+    RedisFlagStore,
+    RedisStateBackend,
+)
+
+
+class HistoryDB:
+    """get_user_interactions как у DatabaseManager: новые записи первыми"""
+
+    def __init__(self, interactions):
+        self.interactions = interactions
+
+    def get_user_interactions(self, user_id, limit=5, message_types=None):
+        return list(reversed(self.interactions))[:limit]
+
+
+def interaction(message, response):
+    return SimpleNamespace(message=message, response=response, message_type='ai')
+
+
+@pytest.fixture
+def redis_backend():
+    server = fakeredis.FakeServer()
+    return RedisStateBackend(
+        client=fakeredis.FakeRedis(server=server),
+        async_client=fakeredis.FakeAsyncRedis(server=server),
+        prefix="test:",
+    )
+
+
+def contents(messages):
+    return [(m.role, m.content) for m in messages]
+
+
+def test_history_is_trimmed_and_expires(redis_backend):
+    store = RedisConversationStore(redis_backend.client, prefix="test:", history_size=3, ttl=100)
+    for i in range(5):
+        store.append(1, f"m{i}")
+    assert [m.content for m in store.get(1)] == ["m2", "m3", "m4"]
+    assert [m.content for m in store.get(1, limit=2)] == ["m3", "m4"]
+    assert 0 < redis_backend.client.ttl(store._key(1)) <= 100
+
+    store.clear(1)
+    assert store.get(1) == []
+
+
+def test_rehydration_keeps_order():
+    db = HistoryDB([interaction("q1", "a1"), interaction("q2", "a2")])
+    redis_store = RedisConversationStore(fakeredis.FakeRedis(), db, prefix="test:", history_size=10)
+    memory_store = ConversationStore(db, history_size=10)
+
+    for store in (redis_store, memory_store):
+        # История восстанавливается перед новым сообщением
+        store.append(7, "q3")
+        assert contents(store.get(7)) == [
+            ("user", "q1"), ("assistant", "a1"), ("user", "q2"), ("assistant", "a2"), ("user", "q3"),
+        ]
+
+
+def test_rehydration_respects_history_size():
+    db = HistoryDB([interaction(f"q{i}", f"a{i}") for i in range(5)])
+    redis_store = RedisConversationStore(fakeredis.FakeRedis(), db, prefix="test:", history_size=4)
+    memory_store = ConversationStore(db, history_size=4)
+
+    for store in (redis_store, memory_store):
+        assert contents(store.get(3)) == [("user", "q3"), ("assistant", "a3"), ("user", "q4"), ("assistant", "a4")]
+        store.append(3, "q5")
+        assert contents(store.get(3)) == [("assistant", "a3"), ("user", "q4"), ("assistant", "a4"), ("user", "q5")]
+
+
+def test_rate_limit_boundary(redis_backend):
+    # Большой период: доля предыдущего окна не меняется за время теста
+    for store in (MemoryRateLimitStore(), redis_backend.rate_limits()):
+        async def scenario():
+            results = [await store.hit("user:1", 3, 3600) for _ in range(3)]
+            # Отклонённый запрос не занимает место в окне
+            results.append(await store.hit("user:1", 3, 3600))
+            results.append(await store.hit("user:2", 5, 3600, cost=4))
+            results.append(await store.hit("user:2", 5, 3600, cost=2))
+            results.append(await store.hit("user:2", 5, 3600, cost=1))
+            return results
+
+        assert asyncio.run(scenario()) == [True, True, True, False, True, False, True]
+
+
+def test_flags_expire(redis_backend):
+    for store in (MemoryFlagStore(ttl=1), RedisFlagStore(redis_backend.async_client, "code", "test:", ttl=1)):
+        async def scenario():
+            assert not await store.get(1)
+            await store.set(1)
+            await store.set(2)
+            assert await store.get(1)
+            await store.pop(2)
+            assert not await store.get(2)
+            await asyncio.sleep(1.1)
+            return await store.get(1)
+
+        assert asyncio.run(scenario()) is False
+
+
+def test_memory_and_redis_histories_match(redis_backend):
+    db = HistoryDB([interaction("q0", "a0")])
+    stores = [ConversationStore(db, history_size=6), redis_backend.conversations(db)]
+    stores[1].history_size = 6
+    for store in stores:
+        for i in range(1, 5):
+            store.append(5, f"q{i}", "user", tokens=i)
+            store.append(5, f"a{i}", "assistant", tokens=i)
+    memory, redis = ([(m.role, m.content, m.tokens) for m in store.get(5)] for store in stores)
+    assert memory == redis
+    assert memory[0] == ("user", "q2", 2)
@@ -0,0 +1,52 @@
+# tests/test_subscription_cache.py
+import time
+
+import pytest
+
+from app.database.cache import SubscriptionCache
+
+
+def test_write_during_read_is_not_overwritten():
+    cache = SubscriptionCache(redis_url=None)
+    version = cache.version(1)
+    # Пока read-through читал БД, пользователь отписался
+    cache.set(1, False)
+    assert not cache.fill(1, True, version)
+    assert cache.get(1) is False
+
+    assert cache.fill(2, True, cache.version(2))
+    assert cache.get(2) is True
+
+
+def test_invalidation_during_read_is_not_overwritten():
+    cache = SubscriptionCache(redis_url=None)
+    version = cache.version(1)
+    cache.invalidate(1)
+    assert not cache.fill(1, True, version)
+    assert cache.get(1) is None
+
+    version = cache.version(1)
+    cache.clear()
+    assert not cache.fill(1, True, version)
+
+
+def test_listener_starts_with_cache(monkeypatch):
+    fakeredis = pytest.importorskip("fakeredis")
+    server = fakeredis.FakeServer()
+    monkeypatch.setattr(SubscriptionCache, "_client", lambda self: fakeredis.FakeRedis(server=server))
+
+    reader = SubscriptionCache(redis_url="redis://test", channel="test:invalidate")
+    writer = SubscriptionCache(redis_url="redis://test", channel="test:invalidate")
+    assert reader._listener.is_alive()
+
+    client = fakeredis.FakeRedis(server=server)
+    deadline = time.monotonic() + 5
+    while client.pubsub_numsub("test:invalidate")[0][1] < 2 and time.monotonic() < deadline:
+        time.sleep(0.01)
+
+    # Запись из другого процесса сбрасывает статус, хотя reader его еще не читал
+    reader.fill(1, True, reader.version(1))
+    writer.set(1, False, publish=True)
+    while reader.get(1) is not None and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert reader.get(1) is None